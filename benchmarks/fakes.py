@@ -0,0 +1,499 @@
+"""In-process stand-ins for the Slides API, Firestore and the chat model.
+
+Every fake records its calls in a shared Recorder, so a benchmark run can report
+how many API calls each stage made, how long they took and how many prompt
+tokens were sent.
+"""
+import copy
+import glob
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, List, Optional
+
+from google.cloud.firestore_v1 import DELETE_FIELD
+from googleapiclient.errors import HttpError
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from slide_categories import SLIDE_CATEGORIES
+
+SEED_SLIDES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "slides")
+SLIDES_PER_PRESENTATION = 20
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Recorder:
+    """Call counts, call latencies, stage wall times and prompt tokens, grouped by stage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Stage measured by the current thread, and every stage being measured, innermost last
+        self._local = threading.local()
+        self._active = []
+        self.calls = {}  # (stage, method) -> [latency seconds]
+        self.stage_seconds = {}  # stage -> [wall seconds]
+        self.tokens = {}  # stage -> prompt tokens sent
+        self.counts = {}  # (stage, name) -> total, e.g. requests sent in batchUpdates
+        self.errors = {}  # stage -> error message
+
+    @property
+    def stage(self):
+        """The calling thread's stage; pool threads of the pipeline get the innermost stage being measured."""
+        stage = getattr(self._local, "stage", None)
+        if stage is not None:
+            return stage
+        with self._lock:
+            return self._active[-1] if self._active else "setup"
+
+    def record_call(self, method, seconds):
+        stage = self.stage
+        with self._lock:
+            self.calls.setdefault((stage, method), []).append(seconds)
+
+    def record_count(self, name, amount):
+        stage = self.stage
+        with self._lock:
+            key = (stage, name)
+            self.counts[key] = self.counts.get(key, 0) + amount
+
+    def record_tokens(self, count):
+        stage = self.stage
+        with self._lock:
+            self.tokens[stage] = self.tokens.get(stage, 0) + count
+
+    @contextmanager
+    def measure(self, stage):
+        """Time the block as stage; a failure is recorded against the stage and re-raised."""
+        previous = getattr(self._local, "stage", None)
+        self._local.stage = stage
+        with self._lock:
+            self._active.append(stage)
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            with self._lock:
+                self.errors[stage] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stage_seconds.setdefault(stage, []).append(elapsed)
+                del self._active[len(self._active) - 1 - self._active[::-1].index(stage)]
+            self._local.stage = previous
+
+    def report(self):
+        stages = {}
+        for stage, seconds in self.stage_seconds.items():
+            stages[stage] = {
+                "runs": len(seconds),
+                "wall_seconds": sum(seconds),
+                "wall_p50": percentile(seconds, 0.5),
+                "wall_p95": percentile(seconds, 0.95),
+                "prompt_tokens": self.tokens.get(stage, 0),
+                "calls": {},
+                "counts": {},
+            }
+            if stage in self.errors:
+                stages[stage]["error"] = self.errors[stage]
+        for (stage, method), latencies in sorted(self.calls.items()):
+            stages.setdefault(stage, {"runs": 0, "calls": {}, "counts": {}})["calls"][method] = {
+                "count": len(latencies),
+                "p50": percentile(latencies, 0.5),
+                "p95": percentile(latencies, 0.95),
+            }
+        for (stage, name), total in sorted(self.counts.items()):
+            stages.setdefault(stage, {"runs": 0, "calls": {}, "counts": {}})["counts"][name] = total
+        return stages
+
+
+class Latency:
+    """Seeded random latency around a mean, so runs are repeatable."""
+
+    def __init__(self, mean_seconds, jitter=0.5, seed=0):
+        self.mean_seconds = mean_seconds
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if self.mean_seconds <= 0:
+            return
+        with self._lock:
+            factor = 1 + self._random.uniform(-self.jitter, self.jitter)
+        time.sleep(self.mean_seconds * factor)
+
+
+# --- Synthetic slide library -------------------------------------------------
+
+def _seed_texts():
+    """Text of every slide in slides/*.json, which hold createSlide/insertText requests."""
+    seeds = []
+    for path in sorted(glob.glob(os.path.join(SEED_SLIDES_DIR, "*.json"))):
+        try:
+            with open(path) as file:
+                requests = json.load(file)
+        except (OSError, ValueError):
+            continue
+        texts = [request["insertText"].get("text", "") for request in requests if "insertText" in request]
+        if texts:
+            seeds.append(texts)
+    return seeds or [["Title", "Body text"]]
+
+
+def _text_shape(object_id, text, top):
+    return {
+        "objectId": object_id,
+        "size": {"width": {"magnitude": 6000000, "unit": "EMU"}, "height": {"magnitude": 800000, "unit": "EMU"}},
+        "transform": {"scaleX": 1, "scaleY": 1, "translateX": 400000, "translateY": top, "unit": "EMU"},
+        "shape": {
+            "shapeType": "TEXT_BOX",
+            "text": {"textElements": [
+                {"paragraphMarker": {"style": {}}},
+                {"textRun": {"content": text + "\n", "style": {"fontSize": {"magnitude": 18, "unit": "PT"}}}},
+            ]},
+        },
+    }
+
+
+def build_library(slide_count, slides_per_presentation=SLIDES_PER_PRESENTATION):
+    """Synthetic presentations totalling slide_count slides, varied copies of the seed slides."""
+    seeds = _seed_texts()
+    presentations = {}
+    for index in range(slide_count):
+        presentation_id = f"bench-presentation-{index // slides_per_presentation:05d}"
+        presentation = presentations.setdefault(presentation_id, {
+            "presentationId": presentation_id,
+            "title": presentation_id,
+            "revisionId": "rev-1",
+            "slides": [],
+        })
+        texts = seeds[index % len(seeds)]
+        slide_id = f"bench-slide-{index:06d}"
+        presentation["slides"].append({
+            "objectId": slide_id,
+            "pageElements": [
+                _text_shape(f"{slide_id}-e{position}", f"{text} (#{index})", 400000 + position * 900000)
+                for position, text in enumerate(texts)
+            ],
+        })
+    return presentations
+
+
+# --- Slides API --------------------------------------------------------------
+
+class _FakeRequest:
+    def __init__(self, service, method, func):
+        self._service = service
+        self._method = method
+        self._func = func
+
+    def execute(self, num_retries=0):
+        start = time.perf_counter()
+        try:
+            self._service.latency.wait()
+            return self._func()
+        finally:
+            self._service.recorder.record_call(f"slides.{self._method}", time.perf_counter() - start)
+
+
+class _HttpResponse(dict):
+    def __init__(self, status, reason):
+        super().__init__(status=str(status))
+        self.status = status
+        self.reason = reason
+
+
+class FakeSlidesService:
+    """The parts of the Slides API this project uses: presentations().get/create/batchUpdate."""
+
+    def __init__(self, presentations, recorder, latency):
+        self.presentations_by_id = copy.deepcopy(presentations)
+        self.recorder = recorder
+        self.latency = latency
+        self._lock = threading.Lock()
+
+    def presentations(self):
+        return self
+
+    def _presentation(self, presentation_id):
+        presentation = self.presentations_by_id.get(presentation_id)
+        if presentation is None:
+            raise HttpError(_HttpResponse(404, "Not Found"), b'{"error": {"message": "Not found"}}')
+        return presentation
+
+    def get(self, presentationId, fields=None):
+        def get_presentation():
+            with self._lock:
+                presentation = self._presentation(presentationId)
+                if fields == "revisionId":
+                    return {"revisionId": presentation["revisionId"]}
+                return copy.deepcopy(presentation)
+        return _FakeRequest(self, "get", get_presentation)
+
+    def create(self, body):
+        def create_presentation():
+            presentation_id = f"bench-created-{uuid.uuid4().hex[:12]}"
+            presentation = {
+                "presentationId": presentation_id,
+                "title": body.get("title"),
+                "revisionId": "rev-1",
+                "slides": [{"objectId": f"{presentation_id}-p1", "pageElements": []}],
+            }
+            with self._lock:
+                self.presentations_by_id[presentation_id] = presentation
+            return copy.deepcopy(presentation)
+        return _FakeRequest(self, "create", create_presentation)
+
+    def batchUpdate(self, presentationId, body):
+        def batch_update():
+            requests = body.get("requests", [])
+            with self._lock:
+                presentation = self._presentation(presentationId)
+                slides = presentation["slides"]
+                for request in requests:
+                    if "createSlide" in request:
+                        slides.append({"objectId": request["createSlide"]["objectId"], "pageElements": []})
+                    elif "deleteObject" in request:
+                        object_id = request["deleteObject"]["objectId"]
+                        presentation["slides"] = slides = [s for s in slides if s["objectId"] != object_id]
+                presentation["revisionId"] = uuid.uuid4().hex
+            self.recorder.record_count("batchUpdate_requests", len(requests))
+            return {"presentationId": presentationId, "replies": [{} for _ in requests]}
+        return _FakeRequest(self, "batchUpdate", batch_update)
+
+
+# --- Firestore ---------------------------------------------------------------
+
+class _Snapshot:
+    def __init__(self, document_id, data):
+        self.id = document_id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+
+class _DocumentRef:
+    def __init__(self, collection, document_id):
+        self._collection = collection
+        self.id = document_id
+
+    def get(self):
+        def get_document():
+            return _Snapshot(self.id, self._collection.documents.get(self.id))
+        return self._collection.db.call("get", get_document)
+
+    def set(self, data, merge=False):
+        return self._collection.db.call("set", lambda: self._collection.write(self.id, data, merge))
+
+
+_OPERATORS = {
+    "==": lambda value, target: value == target,
+    "in": lambda value, target: value in target,
+    "array_contains": lambda value, target: isinstance(value, list) and target in value,
+}
+
+
+class _Query:
+    def __init__(self, collection, filters=(), fields=None, limit=None):
+        self._collection = collection
+        self._filters = list(filters)
+        self._fields = fields
+        self._limit = limit
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return _Query(self._collection, self._filters + [(field_path, op_string, value)], self._fields, self._limit)
+
+    def select(self, fields):
+        return _Query(self._collection, self._filters, list(fields), self._limit)
+
+    def limit(self, count):
+        return _Query(self._collection, self._filters, self._fields, count)
+
+    def _matches(self, data):
+        return all(_OPERATORS[op](data.get(field), value) for field, op, value in self._filters)
+
+    def stream(self):
+        def run_query():
+            results = []
+            for document_id, data in sorted(self._collection.documents.items()):
+                if not self._matches(data):
+                    continue
+                if self._fields is not None:
+                    data = {field: data[field] for field in self._fields if field in data}
+                results.append(_Snapshot(document_id, data))
+                if self._limit is not None and len(results) >= self._limit:
+                    break
+            return results
+        return iter(self._collection.db.call("query", run_query))
+
+
+class _Collection(_Query):
+    def __init__(self, db, name):
+        super().__init__(self)
+        self.db = db
+        self.name = name
+        self.documents = {}
+
+    def document(self, document_id=None):
+        return _DocumentRef(self, document_id or uuid.uuid4().hex)
+
+    def write(self, document_id, data, merge):
+        document = self.documents.get(document_id, {}) if merge else {}
+        for field, value in data.items():
+            if value is DELETE_FIELD:
+                document.pop(field, None)
+            else:
+                document[field] = copy.deepcopy(value)
+        self.documents[document_id] = document
+
+
+class _WriteBatch:
+    def __init__(self, db):
+        self._db = db
+        self._writes = []
+
+    def set(self, reference, data, merge=False):
+        self._writes.append((reference, data, merge))
+
+    def commit(self):
+        def commit_writes():
+            for reference, data, merge in self._writes:
+                reference._collection.write(reference.id, data, merge)
+        return self._db.call("commit", commit_writes)
+
+
+class FakeFirestore:
+    """Firestore client with collections, documents, ==/in queries, projections and write batches."""
+
+    def __init__(self, recorder, latency):
+        self.recorder = recorder
+        self.latency = latency
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def call(self, method, func):
+        start = time.perf_counter()
+        try:
+            self.latency.wait()
+            with self._lock:
+                return func()
+        finally:
+            self.recorder.record_call(f"firestore.{method}", time.perf_counter() - start)
+
+    def collection(self, name):
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = _Collection(self, name)
+            return self._collections[name]
+
+    def batch(self):
+        return _WriteBatch(self)
+
+    def field_path(self, *names):
+        return ".".join(names)
+
+
+# --- Chat model --------------------------------------------------------------
+
+def _count_tokens(text):
+    try:
+        import tiktoken
+        return len(tiktoken.get_encoding("cl100k_base").encode(text))
+    except Exception:
+        # Rough estimate when the encoding cannot be loaded (e.g. offline)
+        return max(1, len(text) // 4)
+
+
+def _digest(text):
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest(), 16)
+
+
+class BenchmarkChatModel(BaseChatModel):
+    """Deterministic chat model that answers each of the project's prompts in the expected format."""
+
+    recorder: Any
+    latency: Any
+    tool_name: Optional[str] = None
+
+    @property
+    def _llm_type(self):
+        return "benchmark-fake"
+
+    def bind_tools(self, tools, tool_choice=None, **kwargs):
+        name = convert_to_openai_tool(tools[0])["function"]["name"]
+        return self.model_copy(update={"tool_name": name})
+
+    def _answer(self, prompt):
+        digest = _digest(prompt)
+        if "format for a slides presentation" in prompt:
+            return "\n\n".join(f"{category}:\n    Cover the {category.lower()} of the topic" for category in SLIDE_CATEGORIES)
+        if "choose the best slide" in prompt:
+            # The options arrive JSON-encoded, so their newlines are escaped
+            match = re.search(r'Presentation ID: ([^\s"\\]+)(?:\\n|\n)Slide ID: ([^\s"\\]+)', prompt)
+            if not match:
+                return "{}"
+            return json.dumps({"presentation_id": match.group(1), "objectId": match.group(2)})
+        if "categorize the following slide summary" in prompt:
+            return SLIDE_CATEGORIES[digest % len(SLIDE_CATEGORIES)]
+        if "tag the following slide summary" in prompt:
+            return ", ".join(f"topic-{(digest >> shift) % 40}" for shift in (0, 8, 16))
+        return f"This slide covers topic {digest % 1000} and explains it with a short list of points."
+
+    def _generate(self, messages: List[Any], stop=None, run_manager=None, **kwargs):
+        prompt = "\n".join(str(message.content) for message in messages)
+        start = time.perf_counter()
+        self.latency.wait()
+        self.recorder.record_call("llm.invoke", time.perf_counter() - start)
+        self.recorder.record_tokens(_count_tokens(prompt))
+
+        if self.tool_name == "DeckStructure":
+            message = AIMessage(content="", tool_calls=[{
+                "name": self.tool_name,
+                "args": {"sections": [
+                    {"category": category, "goal": f"Cover the {category.lower()} of the topic"}
+                    for category in SLIDE_CATEGORIES
+                ]},
+                "id": f"call_{_digest(prompt) % 10 ** 8}",
+            }])
+        elif self.tool_name == "SectionGoals":
+            sections = re.findall(r"^\s*\d+\. (.+)$", prompt, re.MULTILINE)
+            message = AIMessage(content="", tool_calls=[{
+                "name": self.tool_name,
+                "args": {"goals": [f"Cover the {section.lower()} of the topic" for section in sections]},
+                "id": f"call_{_digest(prompt) % 10 ** 8}",
+            }])
+        elif self.tool_name:
+            digest = _digest(prompt)
+            message = AIMessage(content="", tool_calls=[{
+                "name": self.tool_name,
+                "args": {
+                    "summary": self._answer(prompt),
+                    "category": SLIDE_CATEGORIES[digest % len(SLIDE_CATEGORIES)],
+                    "tags": [f"topic-{(digest >> shift) % 40}" for shift in (0, 8, 16)],
+                },
+                "id": f"call_{digest % 10 ** 8}",
+            }])
+        else:
+            message = AIMessage(content=self._answer(prompt))
+        return ChatResult(generations=[ChatGeneration(message=message)])
@@ -0,0 +1,216 @@
+"""End-to-end benchmark of ingestion, slide copying and deck generation against in-process fakes.
+
+Runs without Google, Firebase or OpenAI accounts. From the repository root:
+
+    python -m benchmarks.run_benchmarks --sizes 100 1000 --output bench.json
+    python -m benchmarks.run_benchmarks --sizes 100 --baseline bench.json
+    python -m benchmarks.run_benchmarks --sizes 100 --http-stub --stub-failure-rate 0.05
+
+With --baseline the run exits with status 1 when a stage makes more API calls
+than the baseline, or its wall time grows by more than --tolerance. A stage
+that raises stops the run with its traceback instead of reporting timings.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+
+# Must be set before the project modules are imported
+os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "localhost:8080")
+os.environ["LLM_CACHE"] = "false"
+# Measure the pipeline rather than the OpenAI quota unless a quota is given explicitly
+os.environ.setdefault("INGEST_REQUESTS_PER_MINUTE", "1000000")
+os.environ.setdefault("SLIDES_READS_PER_MINUTE", "1000000")
+os.environ.setdefault("SLIDES_WRITES_PER_MINUTE", "1000000")
+os.environ.setdefault("SLIDES_RETRY_BASE_DELAY", "0.01")
+_state_dir = tempfile.mkdtemp(prefix="bench-")
+os.environ.setdefault("INGEST_CHECKPOINT_FILE", os.path.join(_state_dir, "checkpoint.db"))
+os.environ.setdefault("SLIDE_GRAPH_FILE", os.path.join(_state_dir, "slide_graph.npz"))
+os.environ.setdefault("STRUCTURE_TEMPLATES_FILE", os.path.join(_state_dir, "structure_templates.json"))
+
+from langchain_core.embeddings import DeterministicFakeEmbedding  # noqa: E402
+
+import categorize_slides  # noqa: E402
+import create_structure  # noqa: E402
+import firebase_options  # noqa: E402
+import merge_presentations  # noqa: E402
+import slide_graph  # noqa: E402
+import slide_retrieval  # noqa: E402
+import structure_templates  # noqa: E402
+import slides_service  # noqa: E402
+import slides_transport  # noqa: E402
+import slidesOps  # noqa: E402
+from presentation_cache import snapshot_cache  # noqa: E402
+
+from benchmarks.fakes import (  # noqa: E402
+    BenchmarkChatModel,
+    FakeFirestore,
+    FakeSlidesService,
+    Latency,
+    Recorder,
+    build_library,
+)
+from benchmarks.slides_stub import SlidesStub  # noqa: E402
+
+BENCHMARK_DOC_TYPE = "benchmark"
+CLIENT_INTENT = "Pitch our drug management platform to a regional hospital network."
+
+
+def install_fakes(library, recorder, args):
+    """Point the project at the fakes; returns the Slides stub when --http-stub is given."""
+    service = FakeSlidesService(library, recorder, Latency(args.slides_latency, seed=1))
+    stub = None
+    if args.http_stub:
+        # Real Slides client and transport, talking HTTP to the fake
+        stub = SlidesStub(service, failure_rate=args.stub_failure_rate).start()
+        slides_transport.SLIDES_API_ENDPOINT = stub.endpoint
+        slides_service.use_slides_service(None)
+        slides_service.reset_slides_service()
+    else:
+        slides_service.use_slides_service(service)
+    snapshot_cache.invalidate()
+
+    database = FakeFirestore(recorder, Latency(args.firestore_latency, seed=2))
+    database.collection("presentations").write(
+        BENCHMARK_DOC_TYPE, {f"deck{index}": presentation_id for index, presentation_id in enumerate(library)}, False
+    )
+    firebase_options.use_database(database)
+
+    llm = BenchmarkChatModel(recorder=recorder, latency=Latency(args.llm_latency, seed=3))
+    for module in (categorize_slides, create_structure, merge_presentations):
+        module.ChatOpenAI = lambda *a, llm=llm, **kw: llm
+
+    slide_retrieval._embeddings = DeterministicFakeEmbedding(size=256)
+    slide_retrieval.embedding_index = slide_retrieval.SlideEmbeddingIndex(
+        os.path.join(tempfile.mkdtemp(prefix="bench-"), "embeddings.npz")
+    )
+    slide_graph.slide_graph.clear()
+    structure_templates.structure_templates.clear()
+    return stub
+
+
+@contextlib.contextmanager
+def quiet(enabled):
+    """Silence the project's per-slide prints, which would dominate the timings."""
+    if not enabled:
+        yield
+        return
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def run_size(size, args):
+    recorder = Recorder()
+    library = build_library(size)
+    stub = install_fakes(library, recorder, args)
+    slide_ids = [(pid, slide["objectId"]) for pid, deck in library.items() for slide in deck["slides"]]
+
+    try:
+        with quiet(not args.verbose):
+            with recorder.measure("categorize"):
+                categorize_slides.perform_categorization_with_type(BENCHMARK_DOC_TYPE, fused=args.fused)
+
+            # Nothing changed, so this should cost one read per presentation and no LLM calls
+            with recorder.measure("categorize_unchanged"):
+                categorize_slides.perform_categorization_with_type(BENCHMARK_DOC_TYPE, fused=args.fused)
+
+            service = slides_service.get_slides_service()
+            with recorder.measure("copy_setup"):
+                destination_id, _ = slidesOps.create_presentation(service, "benchmark copies")
+            for presentation_id, slide_id in slide_ids[:args.copies]:
+                with recorder.measure("copy_slide"):
+                    result = slidesOps.copy_slide(presentation_id, slide_id, destination_id)
+                    if result.get("status") != "success":
+                        raise RuntimeError(result.get("message"))
+
+            for _ in range(args.decks):
+                with recorder.measure("generate"):
+                    merge_presentations.create_presentation_from_database(
+                        CLIENT_INTENT, "Benchmark deck", "TITLE_AND_BODY", background_color="#F5B7B1"
+                    )
+    finally:
+        if stub is not None:
+            stub.stop()
+            print(f"Slides stub injected {stub.failures} failures")
+    return recorder.report()
+
+
+def print_report(size, report):
+    print(f"\n=== {size} slides ===")
+    for stage, data in report.items():
+        if not data.get("runs"):
+            continue
+        print(f"{stage}: runs={data['runs']} wall={data['wall_seconds']:.3f}s "
+              f"p50={data['wall_p50'] * 1000:.1f}ms p95={data['wall_p95'] * 1000:.1f}ms "
+              f"prompt_tokens={data['prompt_tokens']}")
+        if "error" in data:
+            print(f"  ERROR {data['error']}")
+        for method, call in data["calls"].items():
+            print(f"  {method:<22} count={call['count']:<6} "
+                  f"p50={call['p50'] * 1000:.1f}ms p95={call['p95'] * 1000:.1f}ms")
+        for name, total in data["counts"].items():
+            print(f"  {name:<22} total={total}")
+
+
+def compare(results, baseline, tolerance):
+    """Regressions against a previous --output file: more calls, slower stages or new errors."""
+    regressions = []
+    for size, report in results.items():
+        for stage, data in report.items():
+            before = baseline.get(size, {}).get(stage)
+            if not before:
+                continue
+            if "error" in data and "error" not in before:
+                regressions.append(f"{size}/{stage}: failed with {data['error']}")
+            for method, call in data["calls"].items():
+                previous = before.get("calls", {}).get(method, {}).get("count", 0)
+                if call["count"] > previous:
+                    regressions.append(f"{size}/{stage}: {method} calls {previous} -> {call['count']}")
+            if before.get("wall_p95") and data.get("wall_p95", 0) > before["wall_p95"] * (1 + tolerance):
+                regressions.append(
+                    f"{size}/{stage}: p95 {before['wall_p95'] * 1000:.1f}ms -> {data['wall_p95'] * 1000:.1f}ms"
+                )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--slides-latency", type=float, default=0.05, help="mean Slides API latency (s)")
+    parser.add_argument("--firestore-latency", type=float, default=0.02, help="mean Firestore latency (s)")
+    parser.add_argument("--llm-latency", type=float, default=0.01, help="mean chat model latency (s)")
+    parser.add_argument("--copies", type=int, default=20, help="slides copied with copy_slide")
+    parser.add_argument("--decks", type=int, default=3, help="decks generated per library size")
+    parser.add_argument("--fused", action="store_true", help="use the single-call slide analysis")
+    parser.add_argument("--http-stub", action="store_true", help="serve the fake Slides API over local HTTP")
+    parser.add_argument("--stub-failure-rate", type=float, default=0.0, help="share of stub requests failed with 503")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 slowdown vs the baseline")
+    parser.add_argument("--verbose", action="store_true", help="keep the project's own output")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for size in args.sizes:
+        results[str(size)] = run_size(size, args)
+        print_report(size, results[str(size)])
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
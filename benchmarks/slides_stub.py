@@ -0,0 +1,110 @@
+"""Local HTTP stub of the Slides API, serving a FakeSlidesService over real HTTP.
+
+Pointing slides_transport at it (SLIDES_API_ENDPOINT, or run_benchmarks
+--http-stub) exercises the real client path: connection reuse, the quota
+buckets, retries and the per-endpoint histograms. A share of requests can be
+failed with 429/503 to check the retries.
+"""
+import json
+import random
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from googleapiclient.errors import HttpError
+
+PRESENTATION_PATH = re.compile(r"^/v1/presentations(?:/([^/:]+))?(:batchUpdate)?$")
+
+
+class SlidesStub:
+    """Serves service (a FakeSlidesService) on 127.0.0.1 until stop() is called."""
+
+    def __init__(self, service, failure_rate=0.0, failure_status=503, seed=0):
+        self.service = service
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def _should_fail(self):
+        with self._lock:
+            if self._random.random() < self.failure_rate:
+                self.failures += 1
+                return True
+            return False
+
+    def _dispatch(self, method, path, query, body):
+        match = PRESENTATION_PATH.match(path)
+        if not match:
+            return 404, {"error": {"message": f"No route for {method} {path}"}}
+        presentation_id, batch_update = match.groups()
+        presentations = self.service.presentations()
+        if method == "GET" and presentation_id and not batch_update:
+            fields = query.get("fields", [None])[0]
+            return 200, presentations.get(presentationId=presentation_id, fields=fields).execute()
+        if method == "POST" and presentation_id and batch_update:
+            return 200, presentations.batchUpdate(presentationId=presentation_id, body=body).execute()
+        if method == "POST" and not presentation_id:
+            return 200, presentations.create(body=body).execute()
+        return 405, {"error": {"message": f"{method} not allowed on {path}"}}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Keep-alive responses are small; don't let Nagle delay them
+            disable_nagle_algorithm = True
+
+            def _respond(self, status, payload, headers=()):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _handle(self, method):
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+                if stub._should_fail():
+                    self._respond(stub.failure_status, {"error": {"code": stub.failure_status, "message": "Injected failure"}},
+                                  headers=(("Retry-After", "0"),))
+                    return
+                try:
+                    status, payload = stub._dispatch(method, url.path, parse_qs(url.query), body)
+                except HttpError as error:
+                    status, payload = error.resp.status, {"error": {"code": error.resp.status, "message": str(error)}}
+                self._respond(status, payload)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="slides-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
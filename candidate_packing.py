@@ -0,0 +1,69 @@
+from functools import lru_cache
+
+import tiktoken
+
+# Model used to choose slides and the size of its context window
+SELECTION_MODEL = "gpt-3.5-turbo"
+SELECTION_CONTEXT_TOKENS = 4096
+# Reserved for the model's answer
+SELECTION_RESPONSE_TOKENS = 500
+
+CANDIDATE_SEPARATOR = "\n\n"
+
+
+@lru_cache(maxsize=None)
+def get_encoder(model=SELECTION_MODEL):
+    """tiktoken encoder for the model, loaded once per process."""
+    return tiktoken.encoding_for_model(model)
+
+
+def count_tokens(text, model=SELECTION_MODEL):
+    return len(get_encoder(model).encode(text or ""))
+
+
+def format_candidate(slide):
+    """The text block describing one candidate slide in the selection prompt."""
+    return (
+        f"Slide Summary: {slide.get('summary') or 'No summary available'}\n"
+        f"Presentation ID: {slide.get('presentation_id', 'Unknown presentation')}\n"
+        f"Slide ID: {slide.get('objectId', 'Unknown slide ID')}"
+    )
+
+
+def candidate_tokens(slide, model=SELECTION_MODEL):
+    """Prompt tokens taken by a candidate, using the summary_tokens stored at ingest when present."""
+    summary_tokens = slide.get("summary_tokens")
+    if summary_tokens is None or not slide.get("summary"):
+        return count_tokens(format_candidate(slide) + CANDIDATE_SEPARATOR, model)
+    # Only the short ID lines still need encoding
+    frame = dict(slide, summary="")
+    return summary_tokens + count_tokens(format_candidate(frame) + CANDIDATE_SEPARATOR, model)
+
+
+def by_relevance(slides):
+    """Most relevant first; slides without a relevance score keep their order after scored ones."""
+    return sorted(slides, key=lambda slide: -slide.get("relevance", float("-inf")))
+
+
+def pack_candidates(slides, budget, model=SELECTION_MODEL):
+    """Split slides into groups of whole candidates, each fitting in budget tokens.
+
+    Candidates are taken greedily in order of relevance, so the first group holds
+    the most relevant slides. A candidate larger than the whole budget gets a
+    group of its own rather than being cut.
+    """
+    groups, current, used = [], [], 0
+    for slide in by_relevance(slides):
+        tokens = candidate_tokens(slide, model)
+        if current and used + tokens > budget:
+            groups.append(current)
+            current, used = [], 0
+        current.append(slide)
+        used += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def render_candidates(slides):
+    return CANDIDATE_SEPARATOR.join(format_candidate(slide) for slide in slides)
@@ -1,6 +1,8 @@
 import os
 import time
 import json
+import logging
+from typing import List
 from langchain import hub
 from langchain.output_parsers.openai_tools import PydanticToolsParser
 from langchain.prompts import PromptTemplate
@@ -12,11 +14,38 @@ from langchain_core.runnables import RunnablePassthrough
 from langchain_core.utils.function_calling import convert_to_openai_tool
 from langchain_openai import ChatOpenAI
 
-from slidesOps import get_slides
-from firebase_options import get_presentation_ids, update_document
-
-def summarize_slide(slides):
-        # Define the prompt template
+from slidesOps import fetch_presentations
+from ingest_checkpoint import IngestCheckpoint
+from firebase_options import get_presentation_ids, get_content_hashes, write_documents, SLIDE_PAGES_COLLECTION
+from ingestion_engine import invoke_chain, map_concurrently
+from slide_categories import SlideCategory, SLIDE_CATEGORIES
+from slide_content import (
+    MAX_PAGE_BYTES,
+    PAGE_ENCODING,
+    compress_page,
+    element_counts,
+    slide_content_hash,
+    slide_document_id,
+    slide_layout,
+    slide_text,
+)
+from slide_retrieval import index_slides
+from slide_graph import update_slide_graph
+from instrumentation import span
+from candidate_packing import count_tokens
+from llm_cache import install_llm_cache
+
+install_llm_cache()
+
+logger = logging.getLogger(__name__)
+
+# Analyze each slide with one structured-output call instead of three chained calls
+FUSED_ANALYSIS = os.environ.get("FUSED_ANALYSIS", "false").lower() in ("1", "true", "yes")
+# Slides analyzed and persisted together by categorize_presentations
+INGEST_CHUNK_SIZE = int(os.environ.get("INGEST_CHUNK_SIZE", "32"))
+
+def summary_chain():
+    # Define the prompt template
     prompt = PromptTemplate(
         template="""
         Your task is to summarize the following slide from received from the google slides api. Please summarize the slide, making sure to mention the content and purpose of the slide.
@@ -32,24 +61,26 @@ def summarize_slide(slides):
     llm = ChatOpenAI(model_name="gpt-3.5-turbo-16k", temperature=0)
 
     # Chain setup
-    rag_chain = prompt | llm | StrOutputParser()
+    return prompt | llm | StrOutputParser()
 
-    summarized_slides_json = []
 
-    # Run the categorization process
-    for slide in slides:
-
-        summary = rag_chain.invoke({"slide": slide})
-        summarized_slides_json.append({"slide": slide,"summary": summary})
+def summarize_slide(slides):
+    rag_chain = summary_chain()
 
+    def summarize(slide):
+        summary = invoke_chain(rag_chain, {"slide": slide})
         objectID = slide.get("objectId", None)
-        print("SUMMARIZING SLIDE" + str(objectID))
+        logger.debug("Summarized slide %s", objectID)
+        return {"slide": slide, "summary": summary}
+
+    # Run the summarization process concurrently, keeping the slide order
+    summarized_slides_json = map_concurrently(summarize, slides)
 
     print("SUMMERIZATION COMPLETE")
     return summarized_slides_json
 
 
-def categorize_slides(summarized_slides):
+def category_chain():
     # Define the prompt template
     prompt = PromptTemplate(
         template="""
@@ -79,31 +110,32 @@ def categorize_slides(summarized_slides):
     llm = ChatOpenAI(model_name="gpt-3.5-turbo-16k", temperature=0)
 
     # Chain setup
-    rag_chain = prompt | llm | StrOutputParser()
+    return prompt | llm | StrOutputParser()
 
-    categorized_slides_json = []
 
-    # Run the categorization process
-    for summarized_slide in summarized_slides:
+def categorize_slides(summarized_slides):
+    rag_chain = category_chain()
 
+    def categorize(summarized_slide):
         slide_data = summarized_slide.get("slide", "{}")  # Default to an empty JSON object if "slide" key is missing
         slide_data = json.dumps(slide_data) # dump the json data to a string
         slide = json.loads(slide_data)  # Load the stringified slide data as JSON
 
         # Access the objectId from the slide
         objectID = slide.get("objectId", None)
-        print("objectID: " + str(objectID))
+        category = invoke_chain(rag_chain, {"slide_summary": summarized_slide["summary"]})
+        logger.debug("Categorized slide %s: %s", objectID, category)
+        return {"slide": slide_data,
+                "summary": summarized_slide["summary"],
+                "category": category}
 
-        category = rag_chain.invoke({"slide_summary": summarized_slide["summary"]})
-        categorized_slides_json.append({"slide": slide_data, 
-                                        "summary": summarized_slide["summary"], 
-                                        "category": category})
-        print("CATEGORIZING SLIDE: " + str(category))
+    # Run the categorization process concurrently, keeping the slide order
+    categorized_slides_json = map_concurrently(categorize, summarized_slides)
 
     print("CATEGORIZATION COMPLETE")
     return categorized_slides_json
     
-def tag_slides(categorized_slides):
+def tag_chain():
     prompt = PromptTemplate(
         template="""
         Your task is to tag the following slide summary with keywords based on its content. Consider the main points and purpose of the slide for tagging.
@@ -116,45 +148,120 @@ def tag_slides(categorized_slides):
     )
 
     llm = ChatOpenAI(model_name="gpt-3.5-turbo-16k", temperature=0)
-    rag_chain = prompt | llm | StrOutputParser()
-    tagged_slides_json = []
+    return prompt | llm | StrOutputParser()
+
+
+def tag_slides(categorized_slides):
+    rag_chain = tag_chain()
 
-    for categorized_slide in categorized_slides:
-        tags = rag_chain.invoke({"slide_summary": categorized_slide["summary"]})
-        tagged_slides_json.append({
+    def tag(categorized_slide):
+        tags = invoke_chain(rag_chain, {"slide_summary": categorized_slide["summary"]})
+        logger.debug("Tagged slide: %s", tags)
+        return {
             "slide": categorized_slide["slide"],
             "summary": categorized_slide["summary"],
             "category": categorized_slide["category"],
             "tags": tags
-        })
-        print("TAGGING SLIDE: " + str(tags))
+        }
+
+    tagged_slides_json = map_concurrently(tag, categorized_slides)
 
     print("TAGGING COMPLETE")
     return tagged_slides_json
 
 
+class SlideAnalysis(BaseModel):
+    """Summary, category and tags for a single slide."""
+    summary: str = Field(description="Summary of the slide, mentioning its content and purpose")
+    category: SlideCategory = Field(description="The category that best matches the slide")
+    tags: List[str] = Field(description="Keywords describing the main points and purpose of the slide")
+
+
+def fused_analysis_chain():
+    prompt = PromptTemplate(
+        template="""
+        Your task is to analyze the following slide received from the google slides api.
+        \n\n
+        <Slide Content>{slide}</Slide Content>
+        \n\n
+        Summarize the slide, making sure to mention the content and purpose of the slide.
+        Categorize the slide into the one category that best matches it, paying the most attention to the text content of the slide (e.g. text saying "Agenda" would likely be in the Agenda category).
+        Tag the slide with keywords based on its main points and purpose.
+        """,
+        input_variables=["slide"]
+    )
+
+    llm = ChatOpenAI(model_name="gpt-3.5-turbo-16k", temperature=0)
+    return prompt | llm.with_structured_output(SlideAnalysis)
+
+
+def fused_analyze_slide(rag_chain, slide):
+    """Analyze a slide with one structured call. Returns None when the output does not validate."""
+    try:
+        analysis = invoke_chain(rag_chain, {"slide": slide})
+    except Exception as e:
+        print(f"Fused analysis failed for slide {slide.get('objectId')}: {e}")
+        return None
+
+    if not isinstance(analysis, SlideAnalysis) or analysis.category.value not in SLIDE_CATEGORIES:
+        return None
+    return {
+        "slide": json.dumps(slide),
+        "summary": analysis.summary,
+        "category": analysis.category.value,
+        "tags": ", ".join(analysis.tags),
+    }
+
+
 def send_slides_to_Firebase(tagged_slides, presentation_id):
+    """Store the analysis of each slide as a small document, and its raw page compressed on the side.
+
+    Selection only ever reads the main documents, so they hold the extracted
+    text, element counts and layout instead of the full page JSON.
+    """
+    documents, pages = [], []
     for tagged_slide in tagged_slides:
-        category = tagged_slide["category"]
-        summary = tagged_slide["summary"]
-        tags = tagged_slide["tags"]
         slide_data = tagged_slide.get("slide", "{}")
         slide = json.loads(slide_data) if isinstance(slide_data, str) else slide_data
         objectId = slide.get("objectId", None)
-        
-        # Construct a unique document ID
-        document_id = f"slide-{objectId}-{int(time.time())}"
-        print("objectID: " + str(objectId))
-
-        # Update each field individually
-        update_document("categorized_slides", document_id, "category", category)
-        update_document("categorized_slides", document_id, "summary", summary)
-        update_document("categorized_slides", document_id, "slide", str(slide))
-        update_document("categorized_slides", document_id, "tags", tags)
-        update_document("categorized_slides", document_id, "presentation_id", presentation_id)
-        update_document("categorized_slides", document_id, "objectId", objectId, field_path=True)
-
-    print("SLIDES UPDATED IN FIREBASE")
+        content_hash = tagged_slide.get("content_hash") or slide_content_hash(slide)
+
+        # One document per (presentation, slide), so re-runs overwrite instead of duplicating
+        document_id = slide_document_id(presentation_id, objectId)
+        documents.append((document_id, {
+            "category": tagged_slide["category"],
+            "summary": tagged_slide["summary"],
+            # Lets slide selection pack candidates without re-encoding every summary
+            "summary_tokens": count_tokens(tagged_slide["summary"]),
+            "text": slide_text(slide),
+            "element_counts": element_counts(slide),
+            "layout": slide_layout(slide),
+            "tags": tagged_slide["tags"],
+            "presentation_id": presentation_id,
+            "objectId": objectId,
+            "content_hash": content_hash,
+        }))
+
+        page = compress_page(slide)
+        if len(page) > MAX_PAGE_BYTES:
+            print(f"Not storing the page of slide {objectId}: {len(page)} bytes compressed")
+            continue
+        pages.append((document_id, {
+            "presentation_id": presentation_id,
+            "objectId": objectId,
+            "content_hash": content_hash,
+            "encoding": PAGE_ENCODING,
+            "page": page,
+        }))
+
+    # Commit every slide in as few batched writes as possible; "slide" held the raw page before
+    stats = write_documents("categorized_slides", documents, delete_fields=("slide",))
+    page_stats = write_documents(SLIDE_PAGES_COLLECTION, pages)
+    if page_stats["failed"]:
+        print(f"Could not store {page_stats['failed']} slide pages; copies of those slides need their source deck")
+
+    print(f"SLIDES UPDATED IN FIREBASE: {stats['written']} written, {stats['failed']} failed in {stats['batches']} batches")
+    return stats
 
 def write_slides_to_file(slides, filename):
     with open(filename, 'w') as file:
@@ -165,38 +272,186 @@ def write_slides_to_file(slides, filename):
 
 
 
-def perform_categorization_with_ids(presentation_ids):
-    # Step 1: get slides
-    presentations = [get_slides(presentation_id) for presentation_id in presentation_ids]
-    print("got slides for the presentations")
+def slide_analyzer(fused=None):
+    """Return analyze(slide), which summarizes, categorizes and tags one slide.
 
-    # Step 2: Summarize, categorize, and tag slides
-    summarized_presentations = [summarize_slide(presentation) for presentation in presentations]
-    categorized_presentations = [categorize_slides(summarized_presentation) for summarized_presentation in summarized_presentations]
-    tagged_presentations = [tag_slides(categorized_presentation) for categorized_presentation in categorized_presentations]
+    With fused analysis the three stages are one structured-output call, falling
+    back to the three-call path for slides whose output fails validation.
+    """
+    fused = FUSED_ANALYSIS if fused is None else fused
+    summarizer, categorizer, tagger = summary_chain(), category_chain(), tag_chain()
+    fused_chain = fused_analysis_chain() if fused else None
 
-    # Step 3: Send slides to Firebase
-    for presentation_id, tagged_presentation in zip(presentation_ids, tagged_presentations):
-        send_slides_to_Firebase(tagged_presentation, presentation_id)
+    def analyze(slide):
+        if fused_chain is not None:
+            analyzed = fused_analyze_slide(fused_chain, slide)
+            if analyzed is not None:
+                logger.debug("Analyzed slide %s: %s", slide.get('objectId'), analyzed['category'])
+                return analyzed
 
+        summary = invoke_chain(summarizer, {"slide": slide})
+        category = invoke_chain(categorizer, {"slide_summary": summary})
+        tags = invoke_chain(tagger, {"slide_summary": summary})
+        logger.debug("Analyzed slide %s: %s", slide.get('objectId'), category)
+        return {"slide": json.dumps(slide), "summary": summary, "category": category, "tags": tags}
 
-def perform_categorization_with_type(type):
-    # Step 1: Get presentation IDs and slides
-    
+    return analyze
+
+
+def analyze_slides(slides, fused=None):
+    """Summarize, categorize and tag slides concurrently.
+
+    Each slide runs through all three stages on its own, so categorizing one slide
+    never waits for every other slide to be summarized. Results keep the input order.
+    """
+    return map_concurrently(slide_analyzer(fused), slides)
+
+
+def embed_slides(tagged_slides, presentation_id):
+    """Add the summaries and tags of freshly analyzed slides to the local embedding index."""
+    slides = []
+    for tagged_slide in tagged_slides:
+        slide_data = tagged_slide.get("slide", "{}")
+        slide = json.loads(slide_data) if isinstance(slide_data, str) else slide_data
+        slides.append({
+            "presentation_id": presentation_id,
+            "objectId": slide.get("objectId"),
+            "summary": tagged_slide["summary"],
+            "tags": tagged_slide["tags"],
+        })
+    try:
+        print(f"EMBEDDED {index_slides(slides)} SLIDES")
+    except Exception as e:
+        # Slides missing from the index are embedded lazily at generation time
+        print(f"Error embedding slides for {presentation_id}: {e}")
+        return
+    try:
+        update_slide_graph(slides)
+    except Exception as e:
+        # The graph catches up on the next rebuild_slide_graph
+        print(f"Error adding slides of {presentation_id} to the slide graph: {e}")
+
+
+def changed_slides(presentation_id, slides):
+    """Return the slides whose content hash differs from the one stored in Firebase."""
+    stored_hashes = get_content_hashes("categorized_slides", presentation_id)
+
+    changed = []
+    for slide in slides:
+        content_hash = slide_content_hash(slide)
+        if stored_hashes.get(slide.get("objectId")) != content_hash:
+            changed.append((slide, content_hash))
+
+    print(f"{len(changed)} of {len(slides)} slides changed in presentation {presentation_id}")
+    return changed
+
+
+def _ignore_progress(event, **data):
+    pass
+
+
+def changed_slide_stream(presentation_ids, progress):
+    """Yield (presentation_id, slide, content_hash) for every new or changed slide.
+
+    Presentations are fetched a few at a time and diffed against Firebase as
+    each one arrives, so only a handful of decks are ever held in memory.
+    """
+    slides_total = 0
+    for presentations_fetched, (presentation_id, slides) in enumerate(fetch_presentations(presentation_ids), 1):
+        changed = changed_slides(presentation_id, slides)
+        slides_total += len(changed)
+        progress("slides_fetched",
+                 presentation_id=presentation_id,
+                 presentations_total=len(presentation_ids),
+                 presentations_fetched=presentations_fetched,
+                 slides_total=slides_total)
+        for slide, content_hash in changed:
+            yield presentation_id, slide, content_hash
+
+
+def chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def categorize_presentations(presentation_ids, fused=None, progress=None, checkpoint=None):
+    """Fetch, analyze and persist the new or changed slides of the presentations as a stream.
+
+    Slides flow through in chunks of INGEST_CHUNK_SIZE: each chunk is analyzed
+    concurrently, written to Firebase and embedded before the next one starts,
+    so memory stays flat however large the library is. Every finished analysis
+    is recorded in the checkpoint (see ingest_checkpoint.py), and a rerun after
+    a crash reuses it instead of calling the LLM again.
+    """
+    # progress(event, **data) is called as slides are ingested (see job_queue.py)
+    progress = progress or _ignore_progress
+    presentation_ids = list(presentation_ids)
+    owns_checkpoint = checkpoint is None
+    checkpoint = checkpoint or IngestCheckpoint()
+    analyze = slide_analyzer(fused)
+
+    def analyze_with_checkpoint(item):
+        presentation_id, slide, content_hash = item
+        object_id = slide.get("objectId")
+        analysis = checkpoint.get(presentation_id, object_id, content_hash)
+        if analysis is not None:
+            tagged_slide = dict(analysis, slide=json.dumps(slide))
+        else:
+            tagged_slide = analyze(slide)
+            checkpoint.record(presentation_id, object_id, content_hash,
+                              {key: value for key, value in tagged_slide.items() if key != "slide"})
+        tagged_slide["content_hash"] = content_hash
+        return presentation_id, object_id, tagged_slide
+
+    slides_ingested = 0
+    try:
+        with span("ingest", presentations=len(presentation_ids)):
+            for chunk in chunked(changed_slide_stream(presentation_ids, progress), INGEST_CHUNK_SIZE):
+                with span("ingest.analyze", slides=len(chunk)):
+                    analyzed = map_concurrently(analyze_with_checkpoint, chunk)
+
+                # Persist the chunk one presentation at a time, in the order the slides came in
+                by_presentation = {}
+                for presentation_id, object_id, tagged_slide in analyzed:
+                    by_presentation.setdefault(presentation_id, []).append((object_id, tagged_slide))
+                for presentation_id, slides in by_presentation.items():
+                    tagged_presentation = [tagged_slide for _, tagged_slide in slides]
+                    with span("ingest.write", presentation_id=presentation_id, slides=len(tagged_presentation)):
+                        stats = send_slides_to_Firebase(tagged_presentation, presentation_id)
+                    # Slides whose commit failed keep their analysis for the next run
+                    failed = set(stats["failed_ids"])
+                    checkpoint.clear(presentation_id, [
+                        object_id for object_id, _ in slides
+                        if slide_document_id(presentation_id, object_id) not in failed
+                    ])
+                    with span("ingest.embed", presentation_id=presentation_id, slides=len(tagged_presentation)):
+                        embed_slides(tagged_presentation, presentation_id)
+
+                slides_ingested += len(chunk)
+                progress("slides_ingested", slides_ingested=slides_ingested)
+    finally:
+        if owns_checkpoint:
+            checkpoint.close()
+
+    print(f"Ingested {slides_ingested} slides from {len(presentation_ids)} presentations")
+
+
+def perform_categorization_with_ids(presentation_ids, fused=None, progress=None):
+    categorize_presentations(presentation_ids, fused=fused, progress=progress)
+
+
+def perform_categorization_with_type(type, fused=None, progress=None):
+    # Get presentation IDs for the type, then categorize them
     presentation_ids = get_presentation_ids(type)
     print(f"got {type} presentation ids")
-    
-    presentations = [get_slides(presentation_id) for presentation_id in presentation_ids]
-    print("got slides for the presentations")
-
-    # Step 2: Summarize, categorize, and tag slides
-    summarized_presentations = [summarize_slide(presentation) for presentation in presentations]
-    categorized_presentations = [categorize_slides(summarized_presentation) for summarized_presentation in summarized_presentations]
-    tagged_presentations = [tag_slides(categorized_presentation) for categorized_presentation in categorized_presentations]
 
-    # Step 3: Send slides to Firebase
-    for presentation_id, tagged_presentation in zip(presentation_ids, tagged_presentations):
-        send_slides_to_Firebase(tagged_presentation, presentation_id)
+    categorize_presentations(presentation_ids, fused=fused, progress=progress)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,79 @@
+import ast
+import json
+
+from firebase_options import db, write_documents, SLIDE_PAGES_COLLECTION
+from slide_content import (
+    MAX_PAGE_BYTES,
+    PAGE_ENCODING,
+    compress_page,
+    element_counts,
+    slide_document_id,
+    slide_layout,
+    slide_text,
+)
+
+COLLECTION_NAME = "categorized_slides"
+
+
+def parse_stored_slide(slide_data):
+    """Slides were stored as str(dict) (a Python repr) or, in places, as JSON."""
+    try:
+        return ast.literal_eval(slide_data)
+    except (ValueError, SyntaxError):
+        return json.loads(slide_data)
+
+
+def compact_slide_documents(collection_name=COLLECTION_NAME):
+    """Move the raw "slide" field of documents written before the lean format to the pages collection.
+
+    Each document gets the extracted text, element counts and layout instead, so
+    the documents read during selection (and by the catalog listener) stay small.
+    """
+    documents, pages, skipped = [], [], 0
+    page_documents = {}  # page id -> id of the document whose raw slide it holds
+    query = db.collection(collection_name).select(["slide", "presentation_id", "objectId", "content_hash"])
+    for doc in query.stream():
+        data = doc.to_dict()
+        if not data.get("slide"):
+            continue
+        try:
+            slide = parse_stored_slide(data["slide"])
+        except (ValueError, SyntaxError) as e:
+            print(f"Could not parse the stored slide of {doc.id}: {e}")
+            skipped += 1
+            continue
+
+        documents.append((doc.id, {
+            "text": slide_text(slide),
+            "element_counts": element_counts(slide),
+            "layout": slide_layout(slide),
+        }))
+        page = compress_page(slide)
+        if len(page) > MAX_PAGE_BYTES or not data.get("presentation_id") or not data.get("objectId"):
+            # No page load_slide_page could find, so the raw slide stays on the document
+            continue
+        # Older documents have IDs like slide-{objectId}-{ts}; pages are looked up by slide_document_id
+        page_id = slide_document_id(data["presentation_id"], data["objectId"])
+        page_documents[page_id] = doc.id
+        pages.append((page_id, {
+            "presentation_id": data["presentation_id"],
+            "objectId": data["objectId"],
+            "content_hash": data.get("content_hash"),
+            "encoding": PAGE_ENCODING,
+            "page": page,
+        }))
+
+    # Pages first, so the raw slide is only deleted from documents whose copy exists
+    failed_pages = set(write_documents(SLIDE_PAGES_COLLECTION, pages)["failed_ids"])
+    paged = {document_id for page_id, document_id in page_documents.items() if page_id not in failed_pages}
+    compacted = [(document_id, data) for document_id, data in documents if document_id in paged]
+    kept = [(document_id, data) for document_id, data in documents if document_id not in paged]
+    if kept:
+        print(f"Keeping the raw slide of {len(kept)} documents whose page could not be stored")
+        write_documents(collection_name, kept)
+    stats = write_documents(collection_name, compacted, delete_fields=("slide",))
+    print(f"Compacted {stats['written']} slide documents ({stats['failed']} failed, {skipped} unparseable)")
+    return stats
+
+if __name__ == "__main__":
+    compact_slide_documents()
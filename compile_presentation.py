@@ -4,6 +4,10 @@ from langchain_openai import ChatOpenAI
 import json
 import tiktoken  # Ensure this library is installed
 
+from llm_cache import install_llm_cache
+
+install_llm_cache()
+
 # Token limit constants
 MODEL_TOKEN_LIMIT = 16384  # Total token limit for gpt-3.5-turbo-16k
 SAFE_MARGIN = 500          # Reserved tokens for the prompt and response
@@ -2,13 +2,13 @@ import os
 import json
 import time
 from google.oauth2 import service_account
-from googleapiclient.discovery import build
 from langchain.prompts import PromptTemplate
 from langchain.output_parsers.openai_tools import PydanticToolsParser
 from langchain_core.output_parsers import StrOutputParser
 from langchain_openai import ChatOpenAI
 
 from slidesOps import get_slides
+from slides_transport import build_slides_service
 from firebase_options import get_presentation_ids, update_document
 from compile_presentation import choose_best_slide
 
@@ -20,7 +20,7 @@ SCOPES = ['https://www.googleapis.com/auth/presentations', 'https://www.googleap
 
 def authenticate_google_api():
     credentials = service_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-    service = build('slides', 'v1', credentials=credentials)
+    service = build_slides_service(credentials)
     return service
 
 def create_presentation(service, title):
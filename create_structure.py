@@ -1,12 +1,14 @@
 import os
+import re
 import json
+from typing import List, Optional
 from langchain import hub
 from langchain.output_parsers.openai_tools import PydanticToolsParser
 from langchain.prompts import PromptTemplate
 from langchain_community.vectorstores import Chroma
 from langchain_core.messages import BaseMessage, FunctionMessage
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.pydantic_v1 import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.utils.function_calling import convert_to_openai_tool
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
@@ -14,19 +16,92 @@ from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from slidesOps import create_slide
 from slidesOps import get_slides
 from firebase_options import get_presentation_ids
+from llm_cache import install_llm_cache
+from slide_categories import SlideCategory, match_category
+from structure_templates import (
+    CATEGORY_GOALS,
+    STRUCTURE_TEMPLATES_ENABLED,
+    TEMPLATE_FILL_CONFIDENCE,
+    TEMPLATE_MIN_USES,
+    TEMPLATE_SKIP_CONFIDENCE,
+    structure_templates,
+    template_categories,
+)
+
+install_llm_cache()
 
 slide_json_string = """"""
 
-def separate_string_by_newlines(string):
-    lines_array = string.split('\n\n')
-    return lines_array
-    
+# A heading line such as "Title Slide:", "2. Agenda: ..." or "**Q&A**:"
+STRUCTURE_HEADING = re.compile(r"^(?:#+\s*|\d+[.)]\s*|slide\s+\d+\s*[:.)-]\s*)?\**\s*([^:*]+?)\s*\**\s*:\s*(.*)$", re.IGNORECASE)
+
+
+class StructureSection(BaseModel):
+    """One section of a deck: the category its slide comes from and what the slide should achieve."""
+    category: Optional[SlideCategory] = Field(description="The slide category of this section")
+    goal: str = Field(default="", description="What the slide of this section should cover")
+
+    @field_validator("category", mode="before")
+    @classmethod
+    def _match_category(cls, value):
+        # Near misses such as "Title" or "Questions" still map onto a category
+        return match_category(value) if isinstance(value, str) else value
+
+
+class DeckStructure(BaseModel):
+    """The sections of a presentation, in order."""
+    sections: List[StructureSection] = Field(description="The sections of the presentation, in order")
+
+
+def parse_structure(text):
+    """Parse a plain-text format (headings followed by indented goal lines) into sections.
+
+    Headings are matched to the known categories. The first heading sets the
+    heading indentation, and lines indented deeper than it are always goal text,
+    so goal lines such as "Title: ..." or "Data: ..." never start a section of
+    their own. Lines that are not a heading are kept as goal text of the section
+    before them.
+    """
+    sections = []
+    heading_indent = None
+    for raw_line in text.splitlines():
+        raw_line = raw_line.expandtabs(4)
+        line = raw_line.strip()
+        if not line:
+            continue
+        indent = len(raw_line) - len(raw_line.lstrip())
+        heading = STRUCTURE_HEADING.match(line) if heading_indent is None or indent <= heading_indent else None
+        category = match_category(heading.group(1)) if heading else None
+        if category is not None:
+            if heading_indent is None:
+                heading_indent = indent
+            sections.append(StructureSection(category=category, goal=heading.group(2).strip("* ")))
+        elif sections:
+            sections[-1].goal = f"{sections[-1].goal}\n{line}".strip()
+    return sections
+
+
+def normalize_structure(sections):
+    """Drop sections without a category, folding their goal into the section before them."""
+    normalized = []
+    for section in sections:
+        if section.category is not None:
+            normalized.append(StructureSection(category=section.category, goal=section.goal.strip()))
+        elif normalized and section.goal.strip():
+            normalized[-1].goal = f"{normalized[-1].goal}\n{section.goal.strip()}".strip()
+    return normalized
+
 def write_string_to_file(file_path, input_string):
     with open(file_path, 'w') as file:
         file.write(input_string)
     print("String has been written to the file successfully.")
 
-def create_structure(topic):
+def generate_structure(topic):
+  """Generate the deck structure for a topic with the LLM, as a list of StructureSection.
+
+  The sections come from a structured-output call; if its output does not
+  validate, the plain-text format is requested instead and parsed.
+  """
  # Prompt
   prompt = PromptTemplate(
         template="""You are a presenter assigned the task of creating a format for a slides presentation on a topic. \n
@@ -100,24 +175,102 @@ def create_structure(topic):
                 Provide contact information for further inquiries or follow-up discussions
         
        
-       only respond with the format you have created.
+       {response_format}
         """,
-        input_variables=["topic"],
+        input_variables=["topic", "response_format"],
     )
 
   # LLM
   llm = ChatOpenAI(model_name="gpt-3.5-turbo-16k", temperature=0)
 
-  # Post-processing
-  def format_docs(docs):
-      return "\n\n".join(doc.page_content for doc in docs)
-
   # Chain
-  rag_chain = prompt | llm | StrOutputParser()
+  structured_chain = prompt | llm.with_structured_output(DeckStructure)
 
   # Run
-  generation = rag_chain.invoke({"topic": topic})
-  return generation
+  try:
+      structure = structured_chain.invoke({
+          "topic": topic,
+          "response_format": "Respond with the sections of the format you have created, in order, "
+                             "each with its category and the goal of its slide.",
+      })
+      sections = normalize_structure(structure.sections)
+  except Exception as e:
+      print(f"Structured deck structure failed, parsing the text format instead: {e}")
+      sections = []
+
+  if not sections:
+      text_chain = prompt | llm | StrOutputParser()
+      generation = text_chain.invoke({"topic": topic, "response_format": "only respond with the format you have created."})
+      sections = normalize_structure(parse_structure(generation))
+  return sections
+
+
+class SectionGoals(BaseModel):
+    """The goal of each section of a deck, in order."""
+    goals: List[str] = Field(description="One goal per section, in the order the sections were given")
+
+
+def fill_section_goals(topic, categories):
+    """Write the goal of each section of a known deck shape with one small LLM call.
+
+    Returns the sections, or None when the response does not give one goal per section.
+    """
+    prompt = PromptTemplate(
+        template="""You are a presenter preparing a slides presentation on a topic.
+
+        Here is the topic:
+        <topic>
+        {topic}
+        </topic>
+
+        The presentation has these sections, in order:
+        {sections}
+
+        For each section, write one sentence describing what its slide should cover for this topic.
+        """,
+        input_variables=["topic", "sections"],
+    )
+    llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0)
+    chain = prompt | llm.with_structured_output(SectionGoals)
+
+    listing = "\n".join(f"{number}. {category.value}" for number, category in enumerate(categories, 1))
+    try:
+        goals = chain.invoke({"topic": topic, "sections": listing}).goals
+    except Exception as e:
+        print(f"Filling section goals failed: {e}")
+        return None
+    if len(goals) != len(categories):
+        return None
+    return [StructureSection(category=category, goal=goal.strip()) for category, goal in zip(categories, goals)]
+
+
+def create_structure(topic):
+  """Create the deck structure for a topic as a list of StructureSection.
+
+  Intents that closely match a deck shape from the template library (see
+  structure_templates.py) reuse it: with high confidence and a shape the LLM
+  has produced often enough no LLM call is made, otherwise one small call writes the section goals.
+  Everything else goes to generate_structure, and the result is added to
+  the library.
+  """
+  if STRUCTURE_TEMPLATES_ENABLED:
+      template, confidence = structure_templates.classify(topic)
+      categories = template_categories(template) if template else []
+      if categories and confidence >= TEMPLATE_SKIP_CONFIDENCE and template["generated"] >= TEMPLATE_MIN_USES:
+          print(f"Using structure template {template['id']} (confidence {confidence:.2f})")
+          structure_templates.record(topic, [StructureSection(category=category) for category in categories], "skipped")
+          return [StructureSection(category=category, goal=CATEGORY_GOALS[category]) for category in categories]
+      if categories and confidence >= TEMPLATE_FILL_CONFIDENCE:
+          sections = fill_section_goals(topic, categories)
+          if sections:
+              print(f"Filled structure template {template['id']} (confidence {confidence:.2f})")
+              structure_templates.record(topic, sections, "filled")
+              return sections
+
+  sections = generate_structure(topic)
+  if STRUCTURE_TEMPLATES_ENABLED and sections:
+      structure_templates.record(topic, sections, "generated")
+  return sections
  
  
 def generate_slides(format, generated_format_slides):
@@ -172,9 +325,9 @@ def generate_slides(format, generated_format_slides):
   
  
 if __name__ == "__main__":
-    output = create_structure("how to tie your shoe")
+    sections = create_structure("how to tie your shoe")
   
-    items = separate_string_by_newlines(output)
+    items = [f"{section.category.value}:\n{section.goal}" for section in sections]
     for item in items:
         print(item)
         print("------------")
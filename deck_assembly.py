@@ -0,0 +1,211 @@
+import json
+from collections import Counter
+
+from googleapiclient.errors import HttpError
+
+from instrumentation import api_requests, span
+
+from slidesOps import (
+    apply_theme_request,
+    background_color_request,
+    background_image_request,
+    build_copy_slide_requests,
+    delete_slide_request,
+    generate_unique_object_id,
+)
+
+# Limits for a single batchUpdate. The Slides API rejects oversized request bodies,
+# so stay well below its payload cap instead of sending one unbounded request.
+MAX_REQUESTS_PER_BATCH = 1000
+MAX_BATCH_BYTES = 2 * 1024 * 1024
+
+
+def _request_size(request):
+    return len(json.dumps(request))
+
+
+def pack_batches(groups, max_requests=MAX_REQUESTS_PER_BATCH, max_bytes=MAX_BATCH_BYTES):
+    """Pack request groups into as few batches as the limits allow.
+
+    A group (e.g. all requests for one slide) is never split across batches unless
+    it is too large to fit in one on its own. Returns a list of batches, each a list
+    of (group_index, requests) tuples.
+    """
+    batches = []
+    current, current_count, current_bytes = [], 0, 0
+
+    for index, group in enumerate(groups):
+        group_bytes = sum(_request_size(request) for request in group)
+
+        if len(group) > max_requests or group_bytes > max_bytes:
+            # Oversized group: flush, then send it in consecutive chunks
+            if current:
+                batches.append(current)
+                current, current_count, current_bytes = [], 0, 0
+            chunk, chunk_bytes = [], 0
+            for request in group:
+                size = _request_size(request)
+                if chunk and (len(chunk) >= max_requests or chunk_bytes + size > max_bytes):
+                    batches.append([(index, chunk)])
+                    chunk, chunk_bytes = [], 0
+                chunk.append(request)
+                chunk_bytes += size
+            if chunk:
+                batches.append([(index, chunk)])
+            continue
+
+        if current and (current_count + len(group) > max_requests or current_bytes + group_bytes > max_bytes):
+            batches.append(current)
+            current, current_count, current_bytes = [], 0, 0
+
+        current.append((index, group))
+        current_count += len(group)
+        current_bytes += group_bytes
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+class DeckPlan:
+    """Every request needed to assemble a deck, sent as a handful of batchUpdates.
+
+    All object IDs are generated on the client, so no request has to wait for the
+    reply of another one.
+    """
+
+    def __init__(self, presentation_id):
+        self.presentation_id = presentation_id
+        self.slides = []  # (new_slide_id, requests) in deck order
+        self.cleanup_requests = []  # deletes, applied once the new slides exist
+        self.layout_requests = []  # best-effort, sent after the content
+
+    def add_slide(self, source_slide, layout_id=None, background_color=None, background_image_url=None):
+        new_slide_id = generate_unique_object_id("new_slide")
+
+        requests = [{"createSlide": {"objectId": new_slide_id}}]
+        requests.extend(build_copy_slide_requests(source_slide, new_slide_id))
+
+        if background_color:
+            requests.append(background_color_request(new_slide_id, background_color))
+        elif background_image_url:
+            requests.append(background_image_request(new_slide_id, background_image_url))
+
+        if layout_id:
+            self.layout_requests.append(apply_theme_request(new_slide_id, layout_id))
+
+        self.slides.append((new_slide_id, requests))
+        return new_slide_id
+
+    def delete_slide(self, slide_id):
+        if slide_id:
+            self.cleanup_requests.append(delete_slide_request(slide_id))
+
+    def request_count(self):
+        return (sum(len(requests) for _, requests in self.slides)
+                + len(self.cleanup_requests) + len(self.layout_requests))
+
+    def _send(self, service, requests):
+        api_requests.inc(len(requests), api="slides")
+        with span("deck.batch_update", presentation_id=self.presentation_id, requests=len(requests)):
+            return service.presentations().batchUpdate(
+                presentationId=self.presentation_id,
+                body={"requests": requests}
+            ).execute()
+
+    def execute(self, service, progress=None):
+        """Send the plan and report which slides made it into the deck.
+
+        batchUpdate is atomic, so when a batch holding several slides fails each
+        slide is retried on its own and only the broken ones are dropped. A slide
+        too large for one batch is sent in chunks; if one of them fails, the rest
+        are skipped and the half-built slide is deleted again.
+        progress(event, **data), if given, is told about copied slides and the theme.
+        """
+        groups = [requests for _, requests in self.slides]
+        if self.cleanup_requests:
+            groups.append(self.cleanup_requests)
+
+        batches = pack_batches(groups)
+        # A slide counts as copied once the last of its chunks has been applied
+        chunks_left = Counter(index for batch in batches for index, _ in batch)
+        partial_groups = set()
+        failed_groups = set()
+        batch_updates = 0
+        copied = [0]
+
+        def report_copied(indexes):
+            finished = []
+            for index in indexes:
+                chunks_left[index] -= 1
+                if chunks_left[index]:
+                    partial_groups.add(index)
+                else:
+                    partial_groups.discard(index)
+                    finished.append(index)
+            if progress is None:
+                return
+            new_slide_ids = [self.slides[index][0] for index in finished if index < len(self.slides)]
+            if new_slide_ids:
+                copied[0] += len(new_slide_ids)
+                progress("slides_copied", new_slide_ids=new_slide_ids, slides_copied=copied[0])
+
+        for batch in batches:
+            if len(batch) == 1 and batch[0][0] in failed_groups:
+                # Remaining chunk of a split slide that already failed
+                continue
+            batch_updates += 1
+            try:
+                self._send(service, [request for _, group in batch for request in group])
+                report_copied([index for index, _ in batch])
+                continue
+            except HttpError as error:
+                print(f"Batch update failed: {error}")
+                if len(batch) == 1:
+                    failed_groups.add(batch[0][0])
+                    continue
+
+            for index, group in batch:
+                batch_updates += 1
+                try:
+                    self._send(service, group)
+                    report_copied([index])
+                except HttpError as error:
+                    print(f"Request group {index} failed: {error}")
+                    failed_groups.add(index)
+
+        # Split slides whose later chunk failed already exist in the deck, half built
+        half_built = [self.slides[index][0] for index in sorted(partial_groups & failed_groups)
+                      if index < len(self.slides)]
+        if half_built:
+            batch_updates += 1
+            try:
+                self._send(service, [delete_slide_request(slide_id) for slide_id in half_built])
+            except HttpError as error:
+                print(f"Error deleting partially copied slides {half_built}: {error}")
+
+        new_slide_ids, failed_slide_ids = [], []
+        for index, (new_slide_id, _) in enumerate(self.slides):
+            (failed_slide_ids if index in failed_groups else new_slide_ids).append(new_slide_id)
+
+        # Layout changes are applied last and never take the slide content down with them
+        layout_requests = [
+            request for request in self.layout_requests
+            if request["updateSlideProperties"]["slideObjectId"] in new_slide_ids
+        ]
+        if layout_requests:
+            batch_updates += 1
+            try:
+                self._send(service, layout_requests)
+                if progress is not None:
+                    progress("theme_applied", slides_themed=len(layout_requests))
+            except HttpError as error:
+                print(f"Error applying theme layout: {error}")
+
+        print(f"Assembled {len(new_slide_ids)} slides with {batch_updates} batch updates")
+        return {
+            "status": "success" if not failed_slide_ids else "partial_success",
+            "new_slide_ids": new_slide_ids,
+            "failed_slide_ids": failed_slide_ids,
+            "batch_updates": batch_updates,
+        }
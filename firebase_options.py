@@ -1,20 +1,62 @@
+import logging
+import os
+import time
+
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.cloud.firestore_v1 import DELETE_FIELD
+from google.cloud.firestore_v1.base_query import FieldFilter
 from slidesOps import get_slides
+from slide_catalog import slide_catalog
+from instrumentation import api_requests, firestore_documents, span
+from slide_content import decompress_page, slide_document_id
+
+logger = logging.getLogger(__name__)
+
+FIREBASE_CREDENTIALS_FILE = "slidesdatabase-c12eb-firebase-adminsdk-id40o-48ad49b096.json"
+FIREBASE_PROJECT_ID = "slidesdatabase-c12eb"
+
+# Firestore commits at most 500 writes per batch
+MAX_BATCH_WRITES = 500
+# Firestore accepts at most 30 values in an "in" filter
+MAX_IN_FILTER_VALUES = 30
+
+# Compressed raw slide pages, kept out of the documents that selection reads
+SLIDE_PAGES_COLLECTION = "slide_pages"
+
+# The only slide fields needed to pick a slide for a deck
+SELECTION_FIELDS = ["summary", "summary_tokens", "presentation_id", "objectId", "tags"]
+
+
+def _create_client():
+    # Point FIRESTORE_EMULATOR_HOST at a local emulator to run without real credentials
+    if os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        from google.auth.credentials import AnonymousCredentials
+        from google.cloud import firestore as cloud_firestore
+        return cloud_firestore.Client(project=FIREBASE_PROJECT_ID, credentials=AnonymousCredentials())
+
+    # Initialize Firebase Admin SDK
+    cred = credentials.Certificate(FIREBASE_CREDENTIALS_FILE)
+    firebase_admin.initialize_app(cred, {
+        'databaseURL': 'https://slidesdatabase-c12eb-default-rtdb.firebaseio.com/'
+    })
+    return firestore.client()
 
-# Initialize Firebase Admin SDK
-cred = credentials.Certificate("slidesdatabase-c12eb-firebase-adminsdk-id40o-48ad49b096.json")
-firebase_admin.initialize_app(cred, {
-    'databaseURL': 'https://slidesdatabase-c12eb-default-rtdb.firebaseio.com/'
-})
 
 # Reference to the database
-db = firestore.client()
+db = _create_client()
+
+
+def use_database(client):
+    """Point every helper in this module at another Firestore client (e.g. an in-process fake)."""
+    global db
+    db = client
 
 def get_presentation_ids(doc_type):
     try:
         doc_ref = db.collection('presentations').document(doc_type)
-        doc = doc_ref.get()
+        with span("firestore.get", collection="presentations"):
+            doc = doc_ref.get()
         if doc.exists:
             # Get all fields from the document
             presentations = doc.to_dict()
@@ -32,9 +74,6 @@ def get_presentation_ids(doc_type):
 # Function to update an existing document or create it if it doesn't exist
 def update_document(collection_name, document_id, field_name, field_value, field_path=False):
     try:
-        # Get Firestore client
-        db = firestore.client()
-
         # Reference to the specific document
         doc_ref = db.collection(collection_name).document(document_id)
 
@@ -45,41 +84,143 @@ def update_document(collection_name, document_id, field_name, field_value, field
             update_data = {field_name: field_value}
 
         # Use set with merge=True to create or update the document
-        doc_ref.set(update_data, merge=True)
+        with span("firestore.set", collection=collection_name):
+            doc_ref.set(update_data, merge=True)
 
-        print(f"Document {document_id} in collection {collection_name} successfully updated/created with {field_name}: {field_value}")
+        print(f"Document {document_id} in collection {collection_name} successfully updated/created with {field_name}")
+        logger.debug("New value of %s.%s: %s", document_id, field_name, field_value)
 
     except Exception as e:
         print(f"An error occurred: {e}")
 
 
-def get_slides_by_category(collection_name, category):
-    # Fetch slides in the given category
-    slides_collection = db.collection(collection_name)
-    slides = slides_collection.stream()
-
-    matching_slides = []
-
-    for slide in slides:
-        slide_data = slide.to_dict()
-        slide_category = slide_data['category']
-
-        if(slide_category == category):
-            matching_slides.append(slide_data)
+def write_documents(collection_name, documents, batch_size=MAX_BATCH_WRITES, delete_fields=()):
+    """Write whole documents with as few commits as possible.
+
+    documents is a list of (document_id, data) pairs. Each document is merged
+    into any existing one, and up to batch_size documents are committed per
+    WriteBatch. Fields named in delete_fields are removed from the stored
+    documents. Returns the number of documents written and failed, the ids of
+    the failed documents and the latency of every commit.
+    """
+    deletions = {field: DELETE_FIELD for field in delete_fields}
+    collection = db.collection(collection_name)
+    stats = {"written": 0, "failed": 0, "failed_ids": [], "batches": 0, "batch_seconds": []}
+
+    for start in range(0, len(documents), batch_size):
+        chunk = documents[start:start + batch_size]
+        batch = db.batch()
+        for document_id, data in chunk:
+            batch.set(collection.document(document_id), dict(data, **deletions) if deletions else data, merge=True)
+
+        batch_start = time.perf_counter()
+        api_requests.inc(api="firestore")
+        firestore_documents.inc(len(chunk), collection=collection_name)
+        stats["batches"] += 1
+        try:
+            with span("firestore.commit", collection=collection_name, documents=len(chunk)):
+                batch.commit()
+        except Exception as e:
+            # Reported to the caller through failed and failed_ids
+            stats["failed"] += len(chunk)
+            stats["failed_ids"].extend(document_id for document_id, _ in chunk)
+            logger.error("Error committing batch of %d documents to %s: %s", len(chunk), collection_name, e)
         else:
-            continue
+            stats["written"] += len(chunk)
+            logger.debug("Committed batch of %d documents to %s in %.2fs",
+                         len(chunk), collection_name, time.perf_counter() - batch_start)
+        stats["batch_seconds"].append(time.perf_counter() - batch_start)
+
+    return stats
+
+
+def get_slides_by_category(collection_name, category, fields=SELECTION_FIELDS):
+    # Fetch slides in the given category, filtered and projected by Firestore
+    query = (
+        db.collection(collection_name)
+        .where(filter=FieldFilter("category", "==", category))
+        .select(fields)
+    )
+    with span("firestore.query", collection=collection_name, category=category):
+        return [slide.to_dict() for slide in query.stream()]
+
+
+def get_slides_by_categories(collection_name, categories, fields=SELECTION_FIELDS):
+    """Fetch the slides of several categories at once, grouped by category.
+
+    Uses "in" queries (at most MAX_IN_FILTER_VALUES categories each), so a whole
+    deck needs one or two reads instead of one per section.
+    """
+    categories = list(dict.fromkeys(categories))
+    slides_by_category = {category: [] for category in categories}
+
+    fields = list(dict.fromkeys(list(fields) + ["category"]))
+    for start in range(0, len(categories), MAX_IN_FILTER_VALUES):
+        query = (
+            db.collection(collection_name)
+            .where(filter=FieldFilter("category", "in", categories[start:start + MAX_IN_FILTER_VALUES]))
+            .select(fields)
+        )
+        with span("firestore.query", collection=collection_name, categories=len(categories)):
+            for slide in query.stream():
+                slide_data = slide.to_dict()
+                slides_by_category[slide_data["category"]].append(slide_data)
+
+    return slides_by_category
+
+
+def get_content_hashes(collection_name, presentation_id):
+    """Map objectId -> content_hash for the slides already stored for a presentation."""
+    try:
+        query = (
+            db.collection(collection_name)
+            .where(filter=FieldFilter("presentation_id", "==", presentation_id))
+            .select(["objectId", "content_hash"])
+        )
+        content_hashes = {}
+        with span("firestore.query", collection=collection_name, presentation_id=presentation_id):
+            for doc in query.stream():
+                slide_data = doc.to_dict()
+                if slide_data.get("content_hash"):
+                    content_hashes[slide_data.get("objectId")] = slide_data["content_hash"]
+        return content_hashes
+    except Exception as e:
+        print(f"Error getting content hashes for {presentation_id}: {e}")
+        return {}
+
 
-    return matching_slides
+def load_slide_page(presentation_id, object_id):
+    """The raw Slides API page stored at ingest, or None if it was not kept."""
+    doc_ref = db.collection(SLIDE_PAGES_COLLECTION).document(slide_document_id(presentation_id, object_id))
+    try:
+        with span("firestore.get", collection=SLIDE_PAGES_COLLECTION):
+            doc = doc_ref.get()
+        if not doc.exists:
+            return None
+        return decompress_page(doc.to_dict()["page"])
+    except Exception as e:
+        print(f"Error loading the stored page of slide {object_id}: {e}")
+        return None
 
 
 # find the slide by the objectId
 def find_slide(objectId):
-    slides_collection = db.collection("categorized_slides")
-    slides = slides_collection.stream()
+    # Served from the in-memory catalog when the server has started it
+    if slide_catalog.ready:
+        records = slide_catalog.by_object_id(objectId)
+        if records:
+            return records[0].as_dict()
+        return {"error": "could not find the slide"}
+
+    query = (
+        db.collection("categorized_slides")
+        .where(filter=FieldFilter("objectId", "==", objectId))
+        .limit(1)
+    )
+    with span("firestore.query", collection="categorized_slides"):
+        for slide in query.stream():
+            return slide.to_dict()
 
-    for slide in slides:
-        if(slide["objectId"] == objectId):  return slide
-    
     return {"error": "could not find the slide"}
 
 # # Example usage
@@ -1,41 +1,154 @@
 const API_BASE_URL = "https://luke-ai-slides-deck-project-z089.onrender.com";   // https://luke-ai-slides-deck-project.onrender.com
 
-// Function to categorize presentations by IDs
-async function categorizePresentations() {
-    const presentationIdsInput = document.getElementById("presentation-ids").value;
-    const messageElement = document.getElementById("categorize-message");
+// Poll a background job until it finishes, showing its progress in messageElement
+async function waitForJob(jobId, messageElement) {
+    while (true) {
+        const response = await fetch(`${API_BASE_URL}/jobs/${jobId}`);
+        const job = await response.json();
 
-    if (!presentationIdsInput) {
-        messageElement.textContent = "Please enter presentation IDs.";
-        messageElement.classList.add("error");
-        return;
-    }
+        if (!response.ok) {
+            throw new Error(job.error || "Could not get the job status.");
+        }
+        if (job.status === "succeeded") {
+            return job.result;
+        }
+        if (job.status === "failed") {
+            throw new Error(job.error || "The job failed.");
+        }
+        if (job.status === "cancelled") {
+            throw new Error("The job was cancelled.");
+        }
 
-    const presentationIds = presentationIdsInput.split(",").map(id => id.trim());
+        const progress = job.progress || {};
+        if (progress.sections_total !== undefined) {
+            messageElement.textContent = `Working... ${progress.sections_done || 0} of ${progress.sections_total} sections done.`;
+        } else if (progress.slides_total !== undefined) {
+            messageElement.textContent = `Working... ${progress.slides_ingested || 0} of ${progress.slides_total} slides ingested.`;
+        } else {
+            messageElement.textContent = `Job ${job.status}...`;
+        }
+        await new Promise(resolve => setTimeout(resolve, 2000));
+    }
+}
 
+// Submit a job-backed request, then wait for the job and show its result
+async function runJob(url, body, messageElement) {
     try {
-        const response = await fetch(`${API_BASE_URL}/categorize_presentations`, {
+        const response = await fetch(url, {
             method: "POST",
             headers: {
                 "Content-Type": "application/json"
             },
-            body: JSON.stringify({ presentation_ids: presentationIds })
+            body: JSON.stringify(body)
         });
 
         const result = await response.json();
-        if (response.ok) {
-            messageElement.textContent = result.message;
-            messageElement.classList.remove("error");
-        } else {
+        if (!response.ok) {
             messageElement.textContent = result.error || "An error occurred.";
             messageElement.classList.add("error");
+            return;
         }
+
+        messageElement.textContent = result.message;
+        messageElement.classList.remove("error");
+
+        const jobResult = await waitForJob(result.job_id, messageElement);
+        messageElement.textContent = jobResult.message;
     } catch (error) {
-        messageElement.textContent = "Failed to connect to the server.";
+        messageElement.textContent = error.message || "Failed to connect to the server.";
         messageElement.classList.add("error");
     }
 }
 
+// Describe a deck generation event for the status message
+function describeGenerationEvent(event, data) {
+    switch (event) {
+        case "queued":
+            return "Waiting for a free worker...";
+        case "started":
+            return "Generating the presentation structure...";
+        case "requeued":
+            return "The worker stopped; waiting to run the job again...";
+        case "structure_generated":
+            return `Structure ready with ${data.sections_total} sections.`;
+        case "candidates_fetched":
+            return `Section ${data.section + 1} (${data.category}): ${data.candidates} candidate slides.`;
+        case "slide_selected":
+            return `Chose a slide for ${data.category} (${data.sections_done} sections done).`;
+        case "assembly_started":
+            return `Building the deck from ${data.slides_planned} slides...`;
+        case "slides_copied":
+            return `Copied ${data.slides_copied} slides into the deck.`;
+        case "theme_applied":
+            return "Theme applied.";
+        default:
+            return null;
+    }
+}
+
+// Follow a job's Server-Sent Events until it finishes, showing each step in messageElement.
+// If the stream breaks before a final event, fall back to polling the job.
+function streamJob(jobId, eventsUrl, messageElement) {
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(`${API_BASE_URL}${eventsUrl}`);
+        const events = ["queued", "started", "requeued", "structure_generated", "candidates_fetched",
+                        "slide_selected", "assembly_started", "slides_copied", "theme_applied", "deck_assembled"];
+
+        events.forEach(name => source.addEventListener(name, message => {
+            const text = describeGenerationEvent(name, JSON.parse(message.data));
+            if (text) {
+                messageElement.textContent = text;
+            }
+        }));
+        source.addEventListener("succeeded", message => {
+            source.close();
+            resolve(JSON.parse(message.data));
+        });
+        source.addEventListener("failed", message => {
+            source.close();
+            reject(new Error(JSON.parse(message.data).error || "The job failed."));
+        });
+        source.addEventListener("cancelled", () => {
+            source.close();
+            reject(new Error("Presentation generation was cancelled."));
+        });
+        source.onerror = () => {
+            source.close();
+            waitForJob(jobId, messageElement).then(resolve, reject);
+        };
+    });
+}
+
+let currentGenerationJobId = null;
+
+// Function to cancel the presentation that is being generated
+async function cancelPresentation() {
+    if (!currentGenerationJobId) {
+        return;
+    }
+    try {
+        await fetch(`${API_BASE_URL}/jobs/${currentGenerationJobId}/cancel`, { method: "POST" });
+    } catch (error) {
+        console.error("Failed to cancel the job:", error);
+    }
+}
+
+// Function to categorize presentations by IDs
+async function categorizePresentations() {
+    const presentationIdsInput = document.getElementById("presentation-ids").value;
+    const messageElement = document.getElementById("categorize-message");
+
+    if (!presentationIdsInput) {
+        messageElement.textContent = "Please enter presentation IDs.";
+        messageElement.classList.add("error");
+        return;
+    }
+
+    const presentationIds = presentationIdsInput.split(",").map(id => id.trim());
+
+    await runJob(`${API_BASE_URL}/categorize_presentations`, { presentation_ids: presentationIds }, messageElement);
+}
+
 // Function to toggle input fields based on selection
 function toggleBackgroundInput() {
     const backgroundType = document.getElementById("background-type").value;
@@ -77,6 +190,8 @@ async function createPresentation() {
         return;
     }
 
+    const cancelButton = document.getElementById("cancel-create");
+
     try {
         const response = await fetch(`${API_BASE_URL}/generate_presentation`, {
             method: "POST",
@@ -94,16 +209,28 @@ async function createPresentation() {
         });
 
         const result = await response.json();
-        if (response.ok) {
-            messageElement.textContent = result.message;
-            messageElement.classList.remove("error");
-        } else {
+        if (!response.ok) {
             messageElement.textContent = result.error || "An error occurred.";
             messageElement.classList.add("error");
+            return;
         }
+
+        messageElement.textContent = result.message;
+        messageElement.classList.remove("error");
+        currentGenerationJobId = result.job_id;
+        cancelButton.style.display = "inline-block";
+
+        // Stream progress events when the browser supports them, otherwise poll
+        const jobResult = window.EventSource
+            ? await streamJob(result.job_id, result.events_url, messageElement)
+            : await waitForJob(result.job_id, messageElement);
+        messageElement.textContent = `${jobResult.message} Presentation ID: ${jobResult.presentation_id}`;
     } catch (error) {
-        messageElement.textContent = "Failed to connect to the server.";
+        messageElement.textContent = error.message || "Failed to connect to the server.";
         messageElement.classList.add("error");
+    } finally {
+        currentGenerationJobId = null;
+        cancelButton.style.display = "none";
     }
 }
 
@@ -119,27 +246,7 @@ async function categorizePresentationsByType() {
         return;
     }
 
-    try {
-        const response = await fetch(`${API_BASE_URL}/categorize_presentations_by_type`, {
-            method: "POST",
-            headers: {
-                "Content-Type": "application/json"
-            },
-            body: JSON.stringify({ type: typeInput })
-        });
-
-        const result = await response.json();
-        if (response.ok) {
-            messageElement.textContent = result.message;
-            messageElement.classList.remove("error");
-        } else {
-            messageElement.textContent = result.error || "An error occurred.";
-            messageElement.classList.add("error");
-        }
-    } catch (error) {
-        messageElement.textContent = "Failed to connect to the server.";
-        messageElement.classList.add("error");
-    }
+    await runJob(`${API_BASE_URL}/categorize_presentations_by_type`, { type: typeInput }, messageElement);
 }
 
 // Function to refresh the token
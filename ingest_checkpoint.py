@@ -0,0 +1,79 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+INGEST_CHECKPOINT_FILE = os.environ.get("INGEST_CHECKPOINT_FILE", "ingest_checkpoint.db")
+
+
+class IngestCheckpoint:
+    """Analyses of slides that have not been written to Firebase yet, kept in SQLite.
+
+    Slides are recorded as soon as their analysis finishes and cleared once they
+    are persisted. Persisted slides are skipped on the next run by their content
+    hash, so a crashed ingest resumes from here without paying for the LLM calls
+    it had already made.
+    """
+
+    def __init__(self, path=INGEST_CHECKPOINT_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stats = {"resumed": 0, "recorded": 0, "cleared": 0}
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS analyzed_slides (
+                presentation_id TEXT NOT NULL,
+                object_id TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                analysis TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (presentation_id, object_id)
+            )"""
+        )
+        self._conn.commit()
+
+    def get(self, presentation_id, object_id, content_hash):
+        """The recorded analysis of the slide, or None if it has none for this content."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT analysis FROM analyzed_slides WHERE presentation_id = ? AND object_id = ? AND content_hash = ?",
+                (presentation_id, object_id, content_hash),
+            ).fetchone()
+            if row is None:
+                return None
+            self._stats["resumed"] += 1
+        return json.loads(row[0])
+
+    def record(self, presentation_id, object_id, content_hash, analysis):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analyzed_slides VALUES (?, ?, ?, ?, ?)",
+                (presentation_id, object_id, content_hash, json.dumps(analysis), time.time()),
+            )
+            self._conn.commit()
+            self._stats["recorded"] += 1
+
+    def clear(self, presentation_id, object_ids):
+        """Forget slides once they are persisted."""
+        object_ids = list(object_ids)
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM analyzed_slides WHERE presentation_id = ? AND object_id = ?",
+                [(presentation_id, object_id) for object_id in object_ids],
+            )
+            self._conn.commit()
+            self._stats["cleared"] += len(object_ids)
+
+    def pending(self):
+        """Number of analyzed slides still waiting to be persisted."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM analyzed_slides").fetchone()[0]
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,73 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from instrumentation import attach, current_span
+from rate_limiting import TokenBucket, call_with_retry
+
+# Concurrency and rate limits for ingestion LLM calls, overridable from the environment
+INGEST_CONCURRENCY = int(os.environ.get("INGEST_CONCURRENCY", "8"))
+INGEST_REQUESTS_PER_MINUTE = int(os.environ.get("INGEST_REQUESTS_PER_MINUTE", "500"))
+INGEST_MAX_RETRIES = int(os.environ.get("INGEST_MAX_RETRIES", "5"))
+# Threads of the process-wide pool behind map_concurrently and fetch_presentations
+WORKER_THREADS = int(os.environ.get("WORKER_THREADS", "32"))
+
+# Shared by every ingestion thread so the whole process stays under the quota
+llm_rate_limiter = TokenBucket.per_minute(INGEST_REQUESTS_PER_MINUTE, capacity=INGEST_CONCURRENCY)
+
+# Long-lived, so the Slides client and keep-alive connection each thread caches are built once
+worker_pool = ThreadPoolExecutor(max_workers=WORKER_THREADS, thread_name_prefix="worker")
+
+
+def invoke_chain(chain, inputs, rate_limiter=None, max_retries=INGEST_MAX_RETRIES):
+    """Invoke a LangChain runnable under the rate limit, backing off on 429 responses."""
+    rate_limiter = rate_limiter or llm_rate_limiter
+
+    def _invoke():
+        rate_limiter.acquire()
+        return chain.invoke(inputs)
+
+    return call_with_retry(_invoke, max_retries=max_retries)
+
+
+def map_concurrently(func, items, max_workers=None):
+    """Apply func to every item with at most max_workers running at once, on the shared worker_pool.
+
+    Results come back in the order of items regardless of completion order. The
+    calling thread works through the items too, and helpers still queued when
+    it runs out are cancelled, so nested calls (func itself calling
+    map_concurrently) cannot deadlock on a busy pool.
+    """
+    items = list(items)
+    max_workers = max_workers or INGEST_CONCURRENCY
+    if max_workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    # Spans opened by func in the workers belong to the caller's trace
+    parent = current_span()
+    results = [None] * len(items)
+    errors = [None] * len(items)
+    next_index = [0]
+    lock = threading.Lock()
+
+    def drain():
+        with attach(parent):
+            while True:
+                with lock:
+                    index = next_index[0]
+                    if index >= len(items):
+                        return
+                    next_index[0] += 1
+                try:
+                    results[index] = func(items[index])
+                except Exception as e:
+                    errors[index] = e
+
+    helpers = [worker_pool.submit(drain) for _ in range(min(max_workers, len(items)) - 1)]
+    drain()
+    wait([helper for helper in helpers if not helper.cancel()])
+
+    for error in errors:
+        if error is not None:
+            raise error
+    return results
@@ -0,0 +1,287 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+# Append every finished span to this JSON-lines file when set
+TRACE_FILE = os.environ.get("TRACE_FILE")
+
+# Upper bounds (seconds) of the latency histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.kind = "counter"
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.kind = "histogram"
+        self.buckets = buckets
+        self._values = {}  # label key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            values = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[index] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, values in self._values.items():
+                for bound, count in zip(self.buckets, values):
+                    samples.append((f"{self.name}_bucket", key + (("le", repr(bound)),), count))
+                samples.append((f"{self.name}_bucket", key + (("le", "+Inf"),), values[-1]))
+                samples.append((f"{self.name}_sum", key, values[-2]))
+                samples.append((f"{self.name}_count", key, values[-1]))
+        return samples
+
+
+class MetricsRegistry:
+    """Counters and histograms rendered in the Prometheus text exposition format.
+
+    Collectors registered with register_collector report values kept elsewhere
+    (e.g. cache stats) as gauges at scrape time.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text)
+            return metric
+
+    def counter(self, name, help_text=""):
+        return self._get_or_create(Counter, name, help_text)
+
+    def histogram(self, name, help_text=""):
+        return self._get_or_create(Histogram, name, help_text)
+
+    def register_collector(self, prefix, collect, help_text=""):
+        """collect() returns a dict of numeric stats, exported as gauges named prefix_<key>."""
+        self._collectors.append((prefix, collect, help_text))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for prefix, collect, help_text in self._collectors:
+            try:
+                stats = collect()
+            except Exception as e:
+                lines.append(f"# {prefix} collector failed: {e}")
+                continue
+            for key, value in sorted(stats.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{prefix}_{key}"
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+# Shared registry exported by the server's /metrics endpoint
+metrics = MetricsRegistry()
+
+span_duration = metrics.histogram("span_duration_seconds", "Duration of instrumented operations")
+span_errors = metrics.counter("span_errors_total", "Instrumented operations that raised")
+prompt_tokens = metrics.counter("llm_prompt_tokens_total", "Prompt tokens sent to the LLM")
+completion_tokens = metrics.counter("llm_completion_tokens_total", "Completion tokens received from the LLM")
+api_requests = metrics.counter("api_requests_total", "Requests sent in Slides batchUpdates, and Firestore commits")
+firestore_documents = metrics.counter("firestore_documents_total", "Documents sent in Firestore commits")
+api_bytes = metrics.counter("api_request_bytes_total", "Bytes sent in API request bodies")
+
+_local = threading.local()
+_trace_lock = threading.Lock()
+
+
+class Span:
+    """A timed operation with attributes; nested spans in one thread share a trace ID."""
+
+    def __init__(self, name, attributes, parent):
+        self.name = name
+        self.attributes = attributes
+        self.span_id = uuid.uuid4().hex[:16]
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.parent_id = parent.span_id if parent else None
+        self.thread = threading.current_thread().name
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": self.duration,
+            "error": self.error,
+            "thread": self.thread,
+            "attributes": self.attributes,
+        }
+
+
+def current_span():
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else None
+
+
+def _write_trace(span):
+    try:
+        line = json.dumps(span.as_dict(), default=str)
+        with _trace_lock, open(TRACE_FILE, "a") as file:
+            file.write(line + "\n")
+    except OSError as e:
+        print(f"Could not write trace to {TRACE_FILE}: {e}")
+
+
+def _finish(current, duration, error=None):
+    current.duration = duration
+    if error is not None:
+        current.error = f"{type(error).__name__}: {error}"
+        span_errors.inc(span=current.name)
+    span_duration.observe(duration, span=current.name)
+    if TRACE_FILE:
+        _write_trace(current)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a block as span `name`, exporting its duration to /metrics and the trace file.
+
+    Only the span name is used as a metric label; attributes (request counts,
+    bytes, tokens) go to the trace file.
+    """
+    current = Span(name, attributes, current_span())
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(current)
+    start = time.perf_counter()
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        stack.pop()
+        _finish(current, time.perf_counter() - start, error)
+
+
+@contextmanager
+def attach(parent):
+    """Make parent the current span of this thread, so spans opened in a worker join its trace."""
+    if parent is None:
+        yield
+        return
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(parent)
+    try:
+        yield
+    finally:
+        stack.pop()
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """Records an llm.call span and token counts for every chat model call."""
+
+    def __init__(self):
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        model = (kwargs.get("invocation_params") or {}).get("model_name") \
+            or (kwargs.get("invocation_params") or {}).get("model")
+        with self._lock:
+            self._runs[run_id] = (Span("llm.call", {"model": model}, current_span()), time.perf_counter())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        current, start = run
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        sent = usage.get("prompt_tokens", 0)
+        received = usage.get("completion_tokens", 0)
+        current.set(prompt_tokens=sent, completion_tokens=received)
+        prompt_tokens.inc(sent)
+        completion_tokens.inc(received)
+        _finish(current, time.perf_counter() - start)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is not None:
+            _finish(run[0], time.perf_counter() - run[1], error)
+
+
+# Every LangChain chat model call in the process reports to this handler
+_llm_metrics_handler = ContextVar("llm_metrics_handler", default=LLMMetricsHandler())
+register_configure_hook(_llm_metrics_handler, True)
+
+
+def render_metrics():
+    return metrics.render()
@@ -0,0 +1,376 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+JOBS_DB_FILE = os.environ.get("JOBS_DB_FILE", "jobs.db")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+# Each process refreshes the heartbeat of the jobs it is running this often
+JOB_HEARTBEAT_SECONDS = float(os.environ.get("JOB_HEARTBEAT_SECONDS", "15"))
+# Running jobs whose heartbeat is older than this belong to a dead process and are re-queued
+JOB_HEARTBEAT_TIMEOUT = float(os.environ.get("JOB_HEARTBEAT_TIMEOUT", "60"))
+
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job when it has been cancelled."""
+
+
+class JobQueue:
+    """Persistent job queue backed by SQLite and worked by a bounded thread pool.
+
+    Jobs survive restarts: anything queued or interrupted while running is picked
+    up again. Every running job records the process that owns it, and that
+    process keeps the job's heartbeat fresh while it runs; a sweep in every
+    process re-queues jobs whose heartbeat has stopped. Jobs owned by an earlier
+    run of this process on the same host are re-queued as soon as it starts.
+    """
+
+    def __init__(self, path=JOBS_DB_FILE, workers=JOB_WORKERS):
+        self.path = path
+        self.workers = workers
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._threads = []
+        # host:pid:instance, so a restarted process with a recycled pid is still told apart
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress TEXT NOT NULL DEFAULT '{}',
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "owner" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        if "heartbeat_at" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS job_events (
+                job_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                event TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (job_id, seq)
+            )"""
+        )
+        self._conn.commit()
+        self._events_changed = threading.Condition()
+
+    def register(self, kind, handler):
+        """handler(params, progress) runs the job and returns a JSON-serializable result.
+
+        progress(event, **data) records the latest event and merges data into the
+        job's progress.
+        """
+        self._handlers[kind] = handler
+
+    def submit(self, kind, params):
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._wakeup:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, params, status, created_at, updated_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, json.dumps(params), now, now)
+            )
+            self._conn.commit()
+            self._wakeup.notify()
+        self._add_event(job_id, "queued", {})
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, status, progress, result, error, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row[0],
+            "kind": row[1],
+            "status": row[2],
+            "progress": json.loads(row[3]),
+            "result": json.loads(row[4]) if row[4] else None,
+            "error": row[5],
+            "created_at": row[6],
+            "updated_at": row[7],
+        }
+
+    def _update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def _finish(self, job_id, **fields):
+        """Record a job's final state, unless it was re-queued and handed to another owner meanwhile."""
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            finished = self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ? AND owner = ?", (*fields.values(), job_id, self.owner)
+            ).rowcount
+            self._conn.commit()
+        return bool(finished)
+
+    def _claim(self):
+        """Atomically move the oldest queued job to running, waiting for one if needed."""
+        with self._wakeup:
+            while True:
+                row = self._conn.execute(
+                    "SELECT id, kind, params FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    # The status check keeps two server processes from claiming the same job
+                    now = time.time()
+                    claimed = self._conn.execute(
+                        "UPDATE jobs SET status = 'running', owner = ?, heartbeat_at = ?, updated_at = ? "
+                        "WHERE id = ? AND status = 'queued'",
+                        (self.owner, now, now, row[0])
+                    ).rowcount
+                    self._conn.commit()
+                    if claimed:
+                        return row[0], row[1], json.loads(row[2])
+                    continue
+                self._wakeup.wait(timeout=5)
+
+    def _status(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def _add_event(self, job_id, event, data):
+        with self._lock:
+            # IMMEDIATE takes the write lock before reading MAX(seq), so another process
+            # appending to the same job cannot pick the same seq
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                seq = self._conn.execute(
+                    "SELECT COALESCE(MAX(seq), 0) + 1 FROM job_events WHERE job_id = ?", (job_id,)
+                ).fetchone()[0]
+                self._conn.execute(
+                    "INSERT INTO job_events (job_id, seq, event, data, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (job_id, seq, event, json.dumps(data), time.time())
+                )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        with self._events_changed:
+            self._events_changed.notify_all()
+
+    def events(self, job_id, after_seq=0):
+        """Events recorded for a job after after_seq, as (seq, event, data) tuples."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, event, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after_seq)
+            ).fetchall()
+        return [(seq, event, json.loads(data)) for seq, event, data in rows]
+
+    def stream_events(self, job_id, after_seq=0, poll_seconds=1.0):
+        """Yield (seq, event, data) for a job as they happen, ending once it has finished."""
+        finished_polls = 0
+        while True:
+            status = self._status(job_id)
+            for seq, event, data in self.events(job_id, after_seq):
+                after_seq = seq
+                yield seq, event, data
+                if event in FINISHED_STATUSES:
+                    return
+            if status is None:
+                return
+            if status in FINISHED_STATUSES:
+                # Give the final event one more poll to land before giving up on it
+                finished_polls += 1
+                if finished_polls > 1:
+                    return
+            # Woken early by events from this process; the timeout covers other processes
+            with self._events_changed:
+                self._events_changed.wait(timeout=poll_seconds)
+
+    def cancel(self, job_id):
+        """Cancel a queued job, or ask a running one to stop at its next progress report.
+
+        Reports made through shielded() do not stop the job, so a phase that
+        must not be left half-done runs to completion first. Cancelling a job
+        that is already stopping succeeds again; only finished jobs return False.
+        """
+        with self._lock:
+            cancelled = self._conn.execute(
+                "UPDATE jobs SET status = CASE status WHEN 'queued' THEN 'cancelled' ELSE 'cancelling' END, "
+                "updated_at = ? WHERE id = ? AND status IN ('queued', 'running', 'cancelling')",
+                (time.time(), job_id)
+            ).rowcount
+            self._conn.commit()
+        if cancelled and self._status(job_id) == "cancelled":
+            self._add_event(job_id, "cancelled", {})
+        return bool(cancelled)
+
+    def _progress_reporter(self, job_id):
+        progress = {}
+        lock = threading.Lock()
+
+        def report(event, **data):
+            with lock:
+                progress.update(data)
+                progress["event"] = event
+                self._update(job_id, progress=json.dumps(progress))
+            self._add_event(job_id, event, data)
+            if self._status(job_id) == "cancelling":
+                raise JobCancelled(job_id)
+
+        return report
+
+    def _run(self, job_id, kind, params):
+        self._add_event(job_id, "started", {"kind": kind})
+        try:
+            result = self._handlers[kind](params, self._progress_reporter(job_id))
+            if self._finish(job_id, status="succeeded", result=json.dumps(result)):
+                self._add_event(job_id, "succeeded", result)
+        except JobCancelled:
+            if self._finish(job_id, status="cancelled"):
+                self._add_event(job_id, "cancelled", {})
+        except Exception as e:
+            traceback.print_exc()
+            if self._finish(job_id, status="failed", error=str(e)):
+                self._add_event(job_id, "failed", {"error": str(e)})
+
+    def _worker(self):
+        while True:
+            job_id, kind, params = self._claim()
+            self._run(job_id, kind, params)
+
+    def _heartbeat(self):
+        """Refresh the heartbeat of the jobs this process is running."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status IN ('running', 'cancelling')",
+                (time.time(), self.owner)
+            )
+            self._conn.commit()
+
+    def _previous_owners(self):
+        """Owners of running jobs that were earlier runs of a process on this host, now gone."""
+        host, pid, _ = self.owner.rsplit(":", 2)
+        with self._lock:
+            owners = [row[0] for row in self._conn.execute(
+                "SELECT DISTINCT owner FROM jobs WHERE status IN ('running', 'cancelling') AND owner LIKE ?",
+                (f"{host}:%",)
+            )]
+        previous = []
+        for owner in owners:
+            owner_host, owner_pid, _ = owner.rsplit(":", 2)
+            if owner_host != host or owner == self.owner:
+                continue
+            # Same pid with another instance id is this process restarted, e.g. pid 1 in a container
+            if owner_pid == pid or not _pid_alive(int(owner_pid)):
+                previous.append(owner)
+        return previous
+
+    def _reclaim(self, owners=()):
+        """Re-queue running jobs whose owner stopped heartbeating, or that belong to owners.
+
+        Jobs that were being cancelled are marked cancelled instead.
+        """
+        dead = "heartbeat_at IS NULL OR heartbeat_at < ?"
+        if owners:
+            dead += f" OR owner IN ({', '.join('?' for _ in owners)})"
+        params = (time.time() - JOB_HEARTBEAT_TIMEOUT, *owners)
+        with self._wakeup:
+            # IMMEDIATE takes the write lock up front, so two processes sweeping at once see the same rows
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    f"SELECT id, status FROM jobs WHERE status IN ('running', 'cancelling') AND ({dead})", params
+                ).fetchall()
+                now = time.time()
+                for job_id, status in rows:
+                    if status == "running":
+                        self._conn.execute(
+                            "UPDATE jobs SET status = 'queued', owner = NULL, heartbeat_at = NULL, updated_at = ? "
+                            "WHERE id = ?", (now, job_id)
+                        )
+                    else:
+                        self._conn.execute("UPDATE jobs SET status = 'cancelled', updated_at = ? WHERE id = ?", (now, job_id))
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+            if rows:
+                self._wakeup.notify_all()
+        for job_id, status in rows:
+            if status == "running":
+                print(f"Re-queued job {job_id} after its worker stopped")
+                self._add_event(job_id, "requeued", {})
+            else:
+                self._add_event(job_id, "cancelled", {})
+        return len(rows)
+
+    def _monitor(self):
+        while True:
+            time.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                self._heartbeat()
+                self._reclaim()
+            except sqlite3.Error as e:
+                print(f"Job heartbeat failed: {e}")
+
+    def start(self):
+        if self._threads:
+            return
+        # Jobs left running by an earlier run of this process never finished; run them again now
+        # rather than waiting for their heartbeat to time out
+        self._reclaim(self._previous_owners())
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._monitor, name="job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+
+def shielded(progress):
+    """Wrap progress for a phase that must not be interrupted.
+
+    Events are still recorded, but a cancellation is left for the next report
+    made through the unwrapped progress.
+    """
+    def report(event, **data):
+        try:
+            progress(event, **data)
+        except JobCancelled:
+            pass
+
+    return report
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,173 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from langchain_core.caches import BaseCache
+from langchain_core.globals import get_llm_cache, set_llm_cache
+from langchain_core.load import dumps, loads
+
+LLM_CACHE_FILE = os.environ.get("LLM_CACHE_FILE", "llm_cache.db")
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE", "true").lower() in ("1", "true", "yes")
+# Least recently used entries are evicted once the stored responses exceed this size
+LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+LLM_CACHE_TTL_SECONDS = int(os.environ.get("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+
+def cache_key(prompt, llm_string):
+    """Content address of one LLM call: the rendered prompt plus the model and its parameters.
+
+    The prompt is hashed exactly as rendered. Whitespace inside interpolated
+    inputs (code blocks, tables, line-broken slide text) can change the answer,
+    and a template's own indentation renders the same on every call anyway.
+    """
+    return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+
+class SQLiteLLMCache(BaseCache):
+    """Persistent LangChain LLM cache with LRU eviction by size and a TTL.
+
+    Installed with set_llm_cache, it is consulted by every ChatOpenAI call, so
+    all prompt | llm | parser chains are served from it without changes. The
+    cache only sees the rendered prompt, so callers that reject an answer drop
+    it with evict_last() from the thread that made the call.
+    """
+
+    def __init__(self, path=LLM_CACHE_FILE, max_bytes=LLM_CACHE_MAX_BYTES, ttl_seconds=LLM_CACHE_TTL_SECONDS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # Key of the entry each thread last looked up or stored
+        self._local = threading.local()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "expirations": 0,
+                       "rejections": 0}
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                llm_string TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)")
+        self._conn.commit()
+
+    def lookup(self, prompt, llm_string):
+        key = self._local.last_key = cache_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self._stats["expirations"] += 1
+                row = None
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._stats["hits"] += 1
+        try:
+            return loads(row[0])
+        except Exception as e:
+            print(f"Discarding unreadable LLM cache entry: {e}")
+            return None
+
+    def update(self, prompt, llm_string, return_val):
+        response = dumps(list(return_val))
+        key = self._local.last_key = cache_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, llm_string, response, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, llm_string, response, len(response), now, now)
+            )
+            self._stats["writes"] += 1
+            self._evict()
+            self._conn.commit()
+
+    def evict_last(self):
+        """Drop the response of this thread's last LLM call, e.g. an answer that failed validation."""
+        key = getattr(self._local, "last_key", None)
+        if key is None:
+            return False
+        self._local.last_key = None
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,)).rowcount
+            self._conn.commit()
+            self._stats["rejections"] += removed
+        return bool(removed)
+
+    def _evict(self):
+        self._stats["expirations"] += self._conn.execute(
+            "DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+        ).rowcount
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed_at").fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", evicted)
+        self._stats["evictions"] += len(evicted)
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()
+        stats["entries"] = entries
+        stats["bytes"] = size
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def install_llm_cache():
+    """Route every LangChain LLM call in this process through the shared SQLite cache.
+
+    Safe to call from several modules; the cache is created once. Set LLM_CACHE=false
+    to disable it.
+    """
+    global _cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = SQLiteLLMCache()
+        if get_llm_cache() is not _cache:
+            set_llm_cache(_cache)
+    return _cache
+
+
+def reject_last_llm_response():
+    """Keep the answer this thread just got from being replayed, so a retry asks the model again."""
+    if _cache is not None:
+        _cache.evict_last()
+
+
+def get_llm_cache_stats():
+    return _cache.stats() if _cache is not None else {}
@@ -2,33 +2,41 @@ from langchain.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_openai import ChatOpenAI
 import json
+import logging
 import os
-import time
-import tiktoken
-
-from firebase_options import get_slides_by_category
-from create_structure import create_structure, separate_string_by_newlines
-from slidesOps import copy_slide, initialize_slides_service, create_presentation, delete_first_slide, apply_theme_to_slide, set_slide_background_color, set_slide_background_image, apply_theme_from_template
-
-# Token limit constants
-MODEL_TOKEN_LIMIT = 16384  # Total token limit for gpt-3.5-turbo-16k
-SAFE_MARGIN = 500          # Reserved tokens for the prompt and respon
-
-# Tokenizer for token counting
-tokenizer = tiktoken.encoding_for_model("gpt-3.5-turbo-16k")
-
-def truncate_text(text, max_tokens):
-    """Truncate the input text to fit within the specified token limit."""
-    tokens = tokenizer.encode(text)
-    if len(tokens) > max_tokens:
-        truncated_text = tokenizer.decode(tokens[:max_tokens])
-        print(f"Text truncated to {max_tokens} tokens.")
-        return truncated_text
-    return text
-
-def choose_best_slide(slide_options, slide_goal, category, client_intent):
-    # Define the prompt
-    prompt = PromptTemplate(
+import threading
+
+from firebase_options import get_slides_by_categories, load_slide_page
+from slide_catalog import slide_catalog
+from slide_content import without_expired_urls
+from slide_retrieval import rank_candidates
+from create_structure import create_structure
+from slidesOps import get_source_slide, initialize_slides_service, create_presentation
+from deck_assembly import DeckPlan
+from ingestion_engine import map_concurrently
+from llm_cache import install_llm_cache, reject_last_llm_response
+from instrumentation import span
+from job_queue import shielded
+from candidate_packing import (
+    SELECTION_CONTEXT_TOKENS,
+    SELECTION_MODEL,
+    SELECTION_RESPONSE_TOKENS,
+    by_relevance,
+    count_tokens,
+    pack_candidates,
+    render_candidates,
+)
+
+# Serve repeated prompts (same model, template and inputs) from the persistent LLM cache
+install_llm_cache()
+
+logger = logging.getLogger(__name__)
+
+# Number of deck sections whose slides are selected at the same time
+SELECTION_CONCURRENCY = int(os.environ.get("SELECTION_CONCURRENCY", "6"))
+
+def slide_choice_prompt():
+    return PromptTemplate(
         template="""
         You are a presentation expert. Given the client's intention, the slide goal, and category, choose the best slide out of the slide options.
         Client Intention: {client_intention}
@@ -52,97 +60,197 @@ def choose_best_slide(slide_options, slide_goal, category, client_intent):
         input_variables=["client_intention", "category", "slide_goal", "slide_options"]
     )
 
+def parse_slide_choice(response):
+    """(presentation_id, objectId) from the model's JSON answer, or None if it cannot be parsed."""
+    try:
+        choice = json.loads(response)
+        return choice["presentation_id"], choice["objectId"]
+    except (TypeError, ValueError, KeyError) as e:
+        print(f"Could not parse the slide choice: {e}")
+        return None
+
+def choose_best_slide(slide_options, slide_goal, category, client_intent):
+    """Choose the best of slide_options (candidate slide dicts) and return it, or None.
+
+    Whole candidates are packed into the prompt in order of relevance. When they
+    do not all fit, the groups are judged in parallel and their winners compete
+    in another round until a single prompt holds every remaining candidate.
+    """
+    prompt = slide_choice_prompt()
+
     # Initialize the LLM
-    llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0)
+    llm = ChatOpenAI(model_name=SELECTION_MODEL, temperature=0)
 
     # Chain setup
     rag_chain = prompt | llm | StrOutputParser()
 
-    # Serialize slides to JSON format
-    try:
-        slides_data = json.dumps(slide_options, indent=2)
-    except Exception as e:
-        print(f"Error serializing slides to JSON: {e}")
+    # Tokens left for candidates once the rest of the prompt and the answer are accounted for
+    static_tokens = count_tokens(prompt.format(
+        client_intention=client_intent, category=category, slide_goal=slide_goal, slide_options=""
+    ))
+    budget = SELECTION_CONTEXT_TOKENS - SELECTION_RESPONSE_TOKENS - static_tokens
+
+    def choose(group):
+        slide_options_text = render_candidates(group)
+        logger.debug("Slide options for %s: %s", category, slide_options_text)
+        try:
+            response = rag_chain.invoke({
+                "client_intention": client_intent,
+                "category": category,
+                "slide_goal": slide_goal,
+                "slide_options": slide_options_text
+            })
+        except Exception as e:
+            print(f"Error in slide selection: {e}")
+            return None
+
+        choice = parse_slide_choice(response.strip())
+        for slide in group:
+            if (slide.get("presentation_id"), slide.get("objectId")) == choice:
+                return slide
+        if choice is not None:
+            print(f"The slide chosen for {category} is not one of the options")
+        # Otherwise the cached answer would be replayed on every retry for the cache TTL
+        reject_last_llm_response()
         return None
 
-    # Calculate token budget for truncation
-    tokenizer = tiktoken.encoding_for_model("gpt-3.5-turbo")
-    max_tokens = 4096 - 500  # Reserve 500 tokens for prompt and response
+    candidates = list(slide_options)
+    rounds = 0
+    with span("generate.choose_slide", category=category, candidates=len(candidates)) as choice_span:
+        while candidates:
+            rounds += 1
+            groups = pack_candidates(candidates, budget)
+            choice_span.set(rounds=rounds)
+            if len(groups) == 1:
+                return choose(groups[0])
+
+            winners = [winner for winner in map_concurrently(choose, groups) if winner is not None]
+            if len(winners) >= len(candidates):
+                # Every candidate needs a prompt of its own, so no round can narrow them down
+                return by_relevance(candidates)[0]
+            candidates = winners
+    return None
+
+def get_candidate_slides(categories):
+    """Slides of each category, from the warm slide catalog or else from Firestore."""
+    if slide_catalog.ready:
+        return slide_catalog.slides_by_categories(categories)
+    return get_slides_by_categories("categorized_slides", categories)
+
+def _ignore_progress(event, **data):
+    pass
+
+def select_slide_for_section(component, category, candidate_slides, client_intent, section=None, progress=_ignore_progress):
+    """Pick the best slide for one section and fetch its page from the source deck.
+
+    Returns (presentation_id, slide_id, source_slide), or None if no slide could be chosen.
+    """
+    logger.debug("Finding slide of category: %s", category)
+
+    # Only the slides closest to the client intent and section goal go to the LLM
+    relevant_slides = rank_candidates(candidate_slides, client_intent, component)
+    progress("candidates_fetched", section=section, category=category, candidates=len(relevant_slides))
 
-    # Truncate slides data using provided function
-    truncated_slides = truncate_text(slides_data, max_tokens)
-    print("Serialized and Truncated Slides JSON:", truncated_slides)
+    # Find the best fitting slide among whole candidates that fit the model's context
+    best_fitting_slide = choose_best_slide(relevant_slides, component, category, client_intent)
+    if best_fitting_slide is None:
+        print(f"No slide chosen for {category}")
+        return None
+    presentation_id = best_fitting_slide["presentation_id"]
+    slide_id = best_fitting_slide["objectId"]
 
-    # Invoke the chain
     try:
-        best_slide_id = rag_chain.invoke({
-            "client_intention": client_intent,
-            "category": category,
-            "slide_goal": slide_goal,
-            "slide_options": truncated_slides
-        })
-        return best_slide_id.strip()
+        source_slide = get_source_slide(presentation_id, slide_id)
     except Exception as e:
-        print(f"Error in slide selection: {e}")
+        # API, transport and auth errors alike; one unreachable deck must not fail the whole deck
+        print(f"Error fetching slide {slide_id} from {presentation_id}: {e}")
+        source_slide = None
+    if source_slide is None:
+        # The source deck changed or is unreachable; fall back to the page stored at ingest,
+        # whose image URLs have long expired
+        stored_slide = load_slide_page(presentation_id, slide_id)
+        source_slide = without_expired_urls(stored_slide) if stored_slide is not None else None
+    if source_slide is None:
+        print(f"Slide {slide_id} not available from source presentation {presentation_id}")
         return None
 
-def create_presentation_from_database(client_intent, title, layout_id, background_color=None, background_image_url=None):
-    structure = create_structure(client_intent)  # Create the structure
-    components = separate_string_by_newlines(structure)  # Break down by components
-
-    service = initialize_slides_service()
-    new_presentation_id, first_slide_id = create_presentation(service, title)
-            
-    # now delete the first slide
-    delete_first_slide(service, new_presentation_id, first_slide_id)
-
-    # Iterate through each slide intention
-    for component in components:
-        category = component.split("\n")[0].strip(":").strip()  # Remove colons and whitespace
-        print(f"Finding slide of category: {category}")
-
-        relevant_slides = get_slides_by_category("categorized_slides", category)  # Get slides of category from Firestore
-
-        # Format the slide data to pass only summary, presentation_id, and object_id
-        formatted_slides = []
-        for slide in relevant_slides:
-            slide_summary = slide.get("summary", "No summary available")
-            presentation_id = slide.get("presentation_id", "Unknown presentation")
-            object_id = slide.get("objectId", "Unknown slide ID")
-
-            # Create a string representation of the slide data
-            slide_string = f"Slide Summary: {slide_summary}\nPresentation ID: {presentation_id}\nSlide ID: {object_id}"
-            formatted_slides.append(slide_string)
-
-        # Find the best fitting slide using the formatted slide data
-        best_fitting_slide = choose_best_slide(formatted_slides, component, category, client_intent)
-
-        best_fitting_slide_data = json.loads(best_fitting_slide)  # Load JSON data from the response
-        presentation_id = best_fitting_slide_data["presentation_id"]  # Parse the presentation ID
-        slide_id = best_fitting_slide_data["objectId"]  # Parse the object ID
-
-        # Copy the slides over to the new presentation
-        response = copy_slide(presentation_id, slide_id, new_presentation_id)
-        time.sleep(2)
-
-        if response.get("status") == "success":
-            new_slide_id = response["new_slide_id"]
-            print(f"Successfully added slide {slide_id} from {presentation_id} to new presentation {new_presentation_id}")
-
-            # Only apply individual background settings if no theme template is applied
-            #if not theme_template_id:
-            if background_color:
-                set_slide_background_color(new_presentation_id, new_slide_id, background_color)
-                print(f"Background color {background_color} applied to slide {new_slide_id}")
-            elif background_image_url:
-                set_slide_background_image(new_presentation_id, new_slide_id, background_image_url)
-                print(f"Background image {background_image_url} applied to slide {new_slide_id}")
-
-            # Apply the theme layout to the new slide
-            apply_theme_to_slide(new_presentation_id, new_slide_id, layout_id)
-            print(f"Theme applied to slide {new_slide_id}\n")
-        else:
-            print(f"Failed to copy slide {slide_id} to new presentation {new_presentation_id}")
+    return presentation_id, slide_id, source_slide
+
+
+def create_presentation_from_database(client_intent, title, layout_id, background_color=None, background_image_url=None, progress=None):
+    # progress(event, **data) is called as the deck is built (see job_queue.py)
+    progress = progress or _ignore_progress
+
+    with span("generate.presentation", title=title) as generation:
+        with span("generate.structure"):
+            sections = create_structure(client_intent)  # Typed sections, each with a known category
+
+        # Get the slides of every category in the structure in one pass
+        with span("generate.candidates", categories=len(sections)):
+            slides_by_category = get_candidate_slides([section.category.value for section in sections])
+
+        # Sections with no slides to choose from are dropped before any ranking or LLM calls
+        empty = [section.category.value for section in sections if not slides_by_category.get(section.category.value)]
+        if empty:
+            print(f"Skipping sections with no categorized slides: {', '.join(empty)}")
+        sections = [section for section in sections if slides_by_category.get(section.category.value)]
+        components = [section.goal or section.category.value for section in sections]
+        categories = [section.category.value for section in sections]
+        progress("structure_generated", sections_total=len(sections), sections_done=0, categories=categories,
+                 sections_skipped=len(empty))
+
+        # Phase one: sections are independent, so select their slides concurrently
+        sections_done = [0]
+        sections_lock = threading.Lock()
+
+        def select(section):
+            index, (component, category) = section
+            with span("generate.select_section", section=index, category=category):
+                selection = select_slide_for_section(
+                    component, category, slides_by_category.get(category, []), client_intent,
+                    section=index, progress=progress
+                )
+            with sections_lock:
+                sections_done[0] += 1
+                chosen = {"presentation_id": selection[0], "slide_id": selection[1]} if selection else {}
+                progress("slide_selected", section=index, category=category, sections_done=sections_done[0], **chosen)
+            return selection
+
+        selections = map_concurrently(select, enumerate(zip(components, categories)), max_workers=SELECTION_CONCURRENCY)
+
+        # Last point at which a cancelled job stops; once the deck exists it is always finished,
+        # since a cancellation in the middle of the batch updates would leave it half-built
+        progress("assembly_started", slides_planned=sum(selection is not None for selection in selections))
+        progress = shielded(progress)
+
+        with span("generate.assemble") as assembly_span:
+            service = initialize_slides_service()
+            new_presentation_id, first_slide_id = create_presentation(service, title)
+
+            # Phase two: collect every request for the deck into one plan, in section order
+            plan = DeckPlan(new_presentation_id)
+            for selection in selections:
+                if selection is None:
+                    continue
+                presentation_id, slide_id, source_slide = selection
+
+                # Queue the copy, background and theme layout for the new slide
+                new_slide_id = plan.add_slide(
+                    source_slide,
+                    layout_id=layout_id,
+                    background_color=background_color,
+                    background_image_url=background_image_url
+                )
+                logger.debug("Planned slide %s from slide %s of %s", new_slide_id, slide_id, presentation_id)
+
+            # now delete the first slide, in the same plan
+            plan.delete_slide(first_slide_id)
+
+            print(f"Sending {plan.request_count()} requests to presentation {new_presentation_id}")
+            assembly_span.set(requests=plan.request_count())
+            assembly = plan.execute(service, progress=progress)
+        generation.set(presentation_id=new_presentation_id, slides_added=len(assembly["new_slide_ids"]))
+        progress("deck_assembled", presentation_id=new_presentation_id, slides_added=len(assembly["new_slide_ids"]))
 
     return new_presentation_id
 
@@ -0,0 +1,152 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# Default bounds for the shared snapshot cache
+SNAPSHOT_CACHE_SIZE = 32
+SNAPSHOT_TTL_SECONDS = 300
+# Image contentUrls in a fetched page expire about 30 minutes after the fetch, so
+# a snapshot is downloaded again once it is this old, whatever its revision
+SNAPSHOT_MAX_AGE_SECONDS = 1200
+
+
+class PresentationSnapshot:
+    """The slides of one presentation revision, indexed by slide objectId."""
+
+    def __init__(self, presentation_id, presentation):
+        self.presentation_id = presentation_id
+        self.revision_id = presentation.get("revisionId")
+        self.slides = presentation.get("slides", [])
+        self.slide_index = {slide["objectId"]: slide for slide in self.slides}
+        self.fetched_at = time.monotonic()
+        # Last time the revision was fetched or confirmed unchanged
+        self.validated_at = self.fetched_at
+
+    @property
+    def key(self):
+        return (self.presentation_id, self.revision_id)
+
+    def get_slide(self, slide_object_id):
+        return self.slide_index.get(slide_object_id)
+
+
+class PresentationSnapshotCache:
+    """LRU cache of source presentation snapshots with a TTL.
+
+    Entries validated within the TTL are served as-is. Older entries are
+    revalidated with a revisionId-only request and kept when the revision has
+    not changed. Revalidation never extends a snapshot past max_age_seconds
+    from its download, since the image URLs in it expire. Concurrent lookups
+    of the same presentation share one revalidation or download.
+    """
+
+    def __init__(self, max_size=SNAPSHOT_CACHE_SIZE, ttl_seconds=SNAPSHOT_TTL_SECONDS,
+                 max_age_seconds=SNAPSHOT_MAX_AGE_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.max_age_seconds = max_age_seconds
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+        # presentation_id -> Future of the revalidation or download in progress
+        self._in_flight = {}
+        self._stats = {"hits": 0, "misses": 0, "revalidations": 0, "expirations": 0, "evictions": 0,
+                       "shared_fetches": 0}
+
+    def _fetch(self, service, presentation_id):
+        presentation = service.presentations().get(presentationId=presentation_id).execute()
+        return PresentationSnapshot(presentation_id, presentation)
+
+    def _fetch_revision(self, service, presentation_id):
+        response = service.presentations().get(
+            presentationId=presentation_id, fields="revisionId"
+        ).execute()
+        return response.get("revisionId")
+
+    def _store(self, snapshot):
+        with self._lock:
+            self._snapshots[snapshot.presentation_id] = snapshot
+            self._snapshots.move_to_end(snapshot.presentation_id)
+            while len(self._snapshots) > self.max_size:
+                self._snapshots.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def get(self, service, presentation_id):
+        with self._lock:
+            snapshot = self._snapshots.get(presentation_id)
+            if snapshot is not None:
+                self._snapshots.move_to_end(presentation_id)
+                now = time.monotonic()
+                if now - snapshot.fetched_at >= self.max_age_seconds:
+                    self._stats["expirations"] += 1
+                    snapshot = None
+                elif now - snapshot.validated_at < self.ttl_seconds:
+                    self._stats["hits"] += 1
+                    return snapshot
+
+            # Sections selected in parallel often copy from the same deck; only one thread fetches it
+            future = self._in_flight.get(presentation_id)
+            owner = future is None
+            if owner:
+                future = self._in_flight[presentation_id] = Future()
+            else:
+                self._stats["shared_fetches"] += 1
+        if not owner:
+            return future.result()
+
+        try:
+            snapshot = self._refresh(service, presentation_id, snapshot)
+            future.set_result(snapshot)
+            return snapshot
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[presentation_id]
+
+    def _refresh(self, service, presentation_id, snapshot):
+        """Revalidate snapshot, or download the presentation if it changed or there is none."""
+        if snapshot is not None and snapshot.revision_id is not None:
+            revision_id = self._fetch_revision(service, presentation_id)
+            with self._lock:
+                self._stats["revalidations"] += 1
+            if revision_id == snapshot.revision_id:
+                snapshot.validated_at = time.monotonic()
+                with self._lock:
+                    self._stats["hits"] += 1
+                return snapshot
+
+        with self._lock:
+            self._stats["misses"] += 1
+        snapshot = self._fetch(service, presentation_id)
+        self._store(snapshot)
+        return snapshot
+
+    def get_slide(self, service, presentation_id, slide_object_id):
+        return self.get(service, presentation_id).get_slide(slide_object_id)
+
+    def invalidate(self, presentation_id=None):
+        with self._lock:
+            if presentation_id is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(presentation_id, None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._snapshots)
+        # A lookup that waited on another thread's fetch did not download the deck either
+        served = stats["hits"] + stats["shared_fetches"]
+        lookups = served + stats["misses"]
+        stats["hit_rate"] = served / lookups if lookups else 0.0
+        return stats
+
+
+# Shared cache used by slidesOps.copy_slide and deck assembly
+snapshot_cache = PresentationSnapshotCache()
+
+
+def get_snapshot_cache_stats():
+    return snapshot_cache.stats()
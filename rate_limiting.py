@@ -0,0 +1,69 @@
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, requests_per_minute, capacity=None):
+        return cls(requests_per_minute / 60.0, capacity)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` are available and take them. Returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def is_rate_limit_error(error):
+    """True for HTTP 429 errors raised by the OpenAI, Google or requests clients."""
+    for candidate in (error, getattr(error, "response", None), getattr(error, "resp", None)):
+        status = getattr(candidate, "status_code", None) or getattr(candidate, "status", None)
+        try:
+            if int(status) == 429:
+                return True
+        except (TypeError, ValueError):
+            continue
+    return type(error).__name__ == "RateLimitError"
+
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=60.0):
+    """Exponential backoff with full jitter for the given retry attempt (0-based)."""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def call_with_retry(func, *args, max_retries=5, base_delay=1.0, max_delay=60.0,
+                    should_retry=is_rate_limit_error, **kwargs):
+    """Call func, retrying with exponential backoff while should_retry(error) holds."""
+    attempt = 0
+    while True:
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt >= max_retries or not should_retry(e):
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            print(f"Rate limited ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
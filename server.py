@@ -1,13 +1,27 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from google_auth_oauthlib.flow import Flow
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
 import os
+import json
+import logging
 from werkzeug.middleware.proxy_fix import ProxyFix
 
 from categorize_slides import perform_categorization_with_ids, perform_categorization_with_type
 from merge_presentations import create_presentation_from_database
+from firebase_options import db
+from slide_catalog import slide_catalog
+from job_queue import JobQueue
+from instrumentation import metrics, render_metrics
+from slides_service import get_service_stats
+from presentation_cache import get_snapshot_cache_stats
+from llm_cache import get_llm_cache_stats
+from slide_graph import get_slide_graph_stats
+from structure_templates import get_structure_template_stats
+
+# DEBUG also logs slide payloads and LLM inputs; keep it off in production
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 
 SCOPES = ["https://www.googleapis.com/auth/presentations"]
 REDIRECT_URI = "https://luke-ai-slides-deck-project-z089.onrender.com/oauth2callback"  # Update to your actual frontend or backend redirect URI
@@ -26,6 +40,48 @@ flow = Flow.from_client_secrets_file(
     redirect_uri=REDIRECT_URI
 )
 
+# Long-running generation and categorization work runs on a persistent job queue
+def run_generate_presentation(params, progress):
+    presentation_id = create_presentation_from_database(
+        params["client_intent"],
+        params["title"],
+        params["layout_id"],
+        background_color=params.get("background_color"),
+        background_image_url=params.get("background_image_url"),
+        progress=progress
+    )
+    return {"message": "Presentation generated successfully.", "presentation_id": presentation_id}
+
+def run_categorize_presentations(params, progress):
+    perform_categorization_with_ids(params["presentation_ids"], fused=params.get("fused"), progress=progress)
+    return {"message": "Categorization and tagging completed successfully.", "presentation_ids": params["presentation_ids"]}
+
+def run_categorize_by_type(params, progress):
+    perform_categorization_with_type(params["type"], fused=params.get("fused"), progress=progress)
+    return {"message": f"Categorization and tagging for type '{params['type']}' completed successfully."}
+
+# Stats kept by the caches and the Slides client, exported with the metrics at scrape time
+metrics.register_collector("slides_service", get_service_stats, "Slides client builds and token refreshes")
+metrics.register_collector("snapshot_cache", get_snapshot_cache_stats, "Source presentation snapshot cache")
+metrics.register_collector("llm_cache", get_llm_cache_stats, "Persistent LLM response cache")
+metrics.register_collector("slide_graph", get_slide_graph_stats, "Slide relationship graph")
+metrics.register_collector("structure_templates", get_structure_template_stats, "Deck structure template library")
+metrics.register_collector("slide_catalog", lambda: {"slides": len(slide_catalog), "ready": int(slide_catalog.ready)},
+                           "In-memory slide catalog")
+
+job_queue = JobQueue()
+job_queue.register("generate_presentation", run_generate_presentation)
+job_queue.register("categorize_presentations", run_categorize_presentations)
+job_queue.register("categorize_presentations_by_type", run_categorize_by_type)
+job_queue.start()
+
+# Warm the in-memory slide catalog; it stays current through a Firestore listener
+try:
+    if not slide_catalog.start(db):
+        print("Slide catalog is still loading; falling back to Firestore queries until it is ready")
+except Exception as e:
+    print(f"Could not start the slide catalog: {e}")
+
 def save_credentials(creds):
     with open("token.json", "w") as token:
         token.write(creds.to_json())
@@ -125,25 +181,22 @@ def generate_presentation():
     # if theme_template_id and (background_color or background_image_url):
     #     return jsonify({"error": "Cannot apply a theme template along with background color or image."}), 400
 
-    try:
-        # Call the function to create presentation and pass all options
-        presentation_id = create_presentation_from_database(
-            client_intent, 
-            title, 
-            layout_id, 
-            background_color=background_color, 
-            background_image_url=background_image_url 
-            #theme_template_id=theme_template_id
-        )
-        
-        return jsonify({
-            "message": "Presentation generated successfully.",
-            "presentation_id": presentation_id
-        }), 200
+    # Generation takes minutes, so run it on the job queue and return right away
+    job_id = job_queue.submit("generate_presentation", {
+        "client_intent": client_intent,
+        "title": title,
+        "layout_id": layout_id,
+        "background_color": background_color,
+        "background_image_url": background_image_url
+        #"theme_template_id": theme_template_id
+    })
 
-    except Exception as e:
-        print(f"Error generating presentation: {e}")
-        return jsonify({"error": str(e)}), 500
+    return jsonify({
+        "message": "Presentation generation started.",
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events"
+    }), 202
 
 
 @app.route("/categorize_presentations", methods=["POST"])
@@ -155,18 +208,17 @@ def categorize_presentations():
     if not presentation_ids or not isinstance(presentation_ids, list):
         return jsonify({"error": "A list of presentation IDs is required"}), 400
 
-    try:
-        # Perform categorization with the provided presentation IDs
-        perform_categorization_with_ids(presentation_ids)
-
-        return jsonify({
-            "message": "Categorization and tagging completed successfully.",
-            "presentation_ids": presentation_ids
-        }), 200
-
-    except Exception as e:
-        print(f"Error categorizing presentations: {e}")
-        return jsonify({"error": str(e)}), 500
+    job_id = job_queue.submit("categorize_presentations", {
+        "presentation_ids": presentation_ids,
+        "fused": data.get("fused")
+    })
+
+    return jsonify({
+        "message": "Categorization and tagging started.",
+        "presentation_ids": presentation_ids,
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}"
+    }), 202
     
 @app.route("/categorize_presentations_by_type", methods=["POST"])
 def categorize_by_type():
@@ -177,17 +229,59 @@ def categorize_by_type():
     if not categorization_type:
         return jsonify({"error": "Categorization type is required"}), 400
 
-    try:
-        # Perform categorization with the provided type
-        perform_categorization_with_type(categorization_type)
+    job_id = job_queue.submit("categorize_presentations_by_type", {
+        "type": categorization_type,
+        "fused": data.get("fused")
+    })
 
-        return jsonify({
-            "message": f"Categorization and tagging for type '{categorization_type}' completed successfully."
-        }), 200
+    return jsonify({
+        "message": f"Categorization and tagging for type '{categorization_type}' started.",
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}"
+    }), 202
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job), 200
+
+@app.route("/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id):
+    """Stream a job's progress events as Server-Sent Events until it finishes."""
+    if job_queue.get(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    # EventSource sends Last-Event-ID when it reconnects, so resume after it
+    try:
+        after_seq = int(request.headers.get("Last-Event-ID") or request.args.get("after") or 0)
+    except ValueError:
+        return jsonify({"error": "Last-Event-ID and after must be integers"}), 400
+
+    def generate():
+        for seq, event, data in job_queue.stream_events(job_id, after_seq):
+            yield f"id: {seq}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    if job_queue.get(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+    if not job_queue.cancel(job_id):
+        return jsonify({"error": "Job has already finished"}), 409
+    return jsonify({"message": "Job cancellation requested.", "job_id": job_id}), 202
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
 
-    except Exception as e:
-        print(f"Error categorizing by type: {e}")
-        return jsonify({"error": str(e)}), 500
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
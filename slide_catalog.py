@@ -0,0 +1,184 @@
+import threading
+
+
+def parse_tags(tags):
+    """Normalize tags stored either as a list or as the LLM's comma-separated string."""
+    if not tags:
+        return []
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    return [tag.strip().lower() for tag in tags if tag and tag.strip()]
+
+
+class SlideRecord:
+    """The fields of a categorized slide needed for selection, without the raw slide JSON."""
+
+    __slots__ = ("document_id", "object_id", "presentation_id", "category", "summary", "tags", "content_hash",
+                 "summary_tokens")
+
+    def __init__(self, document_id, object_id, presentation_id, category, summary, tags, content_hash=None,
+                 summary_tokens=None):
+        self.document_id = document_id
+        self.object_id = object_id
+        self.presentation_id = presentation_id
+        self.category = category
+        self.summary = summary
+        self.tags = tags
+        self.content_hash = content_hash
+        self.summary_tokens = summary_tokens
+
+    @classmethod
+    def from_document(cls, document_id, data):
+        return cls(
+            document_id,
+            data.get("objectId"),
+            data.get("presentation_id"),
+            data.get("category"),
+            data.get("summary"),
+            tuple(parse_tags(data.get("tags"))),
+            data.get("content_hash"),
+            data.get("summary_tokens"),
+        )
+
+    def as_dict(self):
+        return {
+            "objectId": self.object_id,
+            "presentation_id": self.presentation_id,
+            "category": self.category,
+            "summary": self.summary,
+            "summary_tokens": self.summary_tokens,
+            "tags": list(self.tags),
+        }
+
+
+class SlideCatalog:
+    """In-memory copy of the categorized slides with hash indexes.
+
+    Loaded once and kept current by a Firestore on_snapshot listener, so lookups
+    by category, tag, objectId or presentation never touch Firestore.
+    """
+
+    def __init__(self, collection_name="categorized_slides"):
+        self.collection_name = collection_name
+        self._records = {}  # document_id -> SlideRecord
+        self._by_category = {}
+        self._by_tag = {}
+        self._by_object_id = {}
+        self._by_presentation = {}
+        self._lock = threading.RLock()
+        self._ready = threading.Event()
+        self._watch = None
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def __len__(self):
+        return len(self._records)
+
+    @staticmethod
+    def _index_add(index, key, document_id):
+        if key:
+            index.setdefault(key, set()).add(document_id)
+
+    @staticmethod
+    def _index_remove(index, key, document_id):
+        document_ids = index.get(key)
+        if document_ids is not None:
+            document_ids.discard(document_id)
+            if not document_ids:
+                del index[key]
+
+    def _remove(self, document_id):
+        record = self._records.pop(document_id, None)
+        if record is None:
+            return
+        self._index_remove(self._by_category, record.category, document_id)
+        self._index_remove(self._by_object_id, record.object_id, document_id)
+        self._index_remove(self._by_presentation, record.presentation_id, document_id)
+        for tag in record.tags:
+            self._index_remove(self._by_tag, tag, document_id)
+
+    def upsert(self, document_id, data):
+        record = SlideRecord.from_document(document_id, data)
+        with self._lock:
+            self._remove(document_id)
+            self._records[document_id] = record
+            self._index_add(self._by_category, record.category, document_id)
+            self._index_add(self._by_object_id, record.object_id, document_id)
+            self._index_add(self._by_presentation, record.presentation_id, document_id)
+            for tag in record.tags:
+                self._index_add(self._by_tag, tag, document_id)
+
+    def remove(self, document_id):
+        with self._lock:
+            self._remove(document_id)
+
+    def load(self, db):
+        """Load the whole collection once, without listening for changes."""
+        for doc in db.collection(self.collection_name).stream():
+            self.upsert(doc.id, doc.to_dict())
+        self._ready.set()
+        print(f"Slide catalog loaded {len(self)} slides")
+
+    def _on_snapshot(self, docs, changes, read_time):
+        for change in changes:
+            if change.type.name == "REMOVED":
+                self.remove(change.document.id)
+            else:
+                self.upsert(change.document.id, change.document.to_dict())
+        if not self.ready:
+            self._ready.set()
+            print(f"Slide catalog loaded {len(self)} slides")
+
+    def start(self, db, timeout=60):
+        """Load the catalog and keep it current with a Firestore listener.
+
+        The listener's first snapshot delivers every document, so this waits for
+        it (up to timeout seconds) before returning.
+        """
+        if self._watch is None:
+            self._watch = db.collection(self.collection_name).on_snapshot(self._on_snapshot)
+        return self._ready.wait(timeout)
+
+    def stop(self):
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+
+    def _lookup(self, index, key):
+        with self._lock:
+            return [self._records[document_id] for document_id in sorted(index.get(key, ()))]
+
+    def records(self):
+        with self._lock:
+            return [self._records[document_id] for document_id in sorted(self._records)]
+
+    def by_category(self, category):
+        return self._lookup(self._by_category, category)
+
+    def by_tag(self, tag):
+        return self._lookup(self._by_tag, tag.strip().lower())
+
+    def by_object_id(self, object_id):
+        return self._lookup(self._by_object_id, object_id)
+
+    def by_presentation(self, presentation_id):
+        return self._lookup(self._by_presentation, presentation_id)
+
+    def get(self, presentation_id, object_id):
+        for record in self.by_object_id(object_id):
+            if record.presentation_id == presentation_id:
+                return record
+        return None
+
+    def slides_by_categories(self, categories):
+        """Same shape as firebase_options.get_slides_by_categories, served from memory."""
+        return {
+            category: [record.as_dict() for record in self.by_category(category)]
+            for category in dict.fromkeys(categories)
+        }
+
+
+# Shared catalog, started by the server and used by slide selection when ready
+slide_catalog = SlideCatalog()
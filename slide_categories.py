@@ -0,0 +1,68 @@
+import difflib
+import re
+from enum import Enum
+
+
+class SlideCategory(str, Enum):
+    """The fixed slide categories used for categorization and deck structure."""
+
+    TITLE_SLIDE = "Title Slide"
+    INTRODUCTION = "Introduction"
+    AGENDA = "Agenda"
+    BACKGROUND_CONTEXT = "Background/Context"
+    MAIN_CONTENT_SLIDES = "Main Content Slides"
+    DATA_STATISTICS = "Data/Statistics"
+    CASE_STUDIES_EXAMPLES = "Case Studies/Examples"
+    ANALYSIS_FINDINGS = "Analysis/Findings"
+    CONCLUSION = "Conclusion"
+    RECOMMENDATIONS_NEXT_STEPS = "Recommendations/Next Steps"
+    Q_AND_A = "Q&A"
+    THANK_YOU = "Thank You"
+
+
+SLIDE_CATEGORIES = [category.value for category in SlideCategory]
+
+# How close a heading must be to a category name for match_category to accept it
+CATEGORY_MATCH_CUTOFF = 0.8
+
+# Other names the LLM uses for some categories
+CATEGORY_ALIASES = {
+    "questions": SlideCategory.Q_AND_A,
+    "questions and answers": SlideCategory.Q_AND_A,
+    "thanks": SlideCategory.THANK_YOU,
+    "intro": SlideCategory.INTRODUCTION,
+    "overview": SlideCategory.INTRODUCTION,
+    "summary": SlideCategory.CONCLUSION,
+    "next steps": SlideCategory.RECOMMENDATIONS_NEXT_STEPS,
+}
+
+
+def _category_key(name):
+    name = re.sub(r"[^a-z0-9]+", " ", name.lower().replace("&", " and "))
+    return re.sub(r"\s+slides?$", "", name.strip())
+
+
+def _category_names():
+    names = dict(CATEGORY_ALIASES)
+    for category in SlideCategory:
+        names[_category_key(category.value)] = category
+        names[_category_key(category.name)] = category
+        for part in category.value.split("/"):
+            names.setdefault(_category_key(part), category)
+    return names
+
+
+_CATEGORY_NAMES = _category_names()
+
+
+def match_category(name, cutoff=CATEGORY_MATCH_CUTOFF):
+    """The SlideCategory a heading like "title slide:" or "Data & Statistics" refers to, or None."""
+    if isinstance(name, SlideCategory):
+        return name
+    key = _category_key(name or "")
+    if not key:
+        return None
+    if key in _CATEGORY_NAMES:
+        return _CATEGORY_NAMES[key]
+    matches = difflib.get_close_matches(key, list(_CATEGORY_NAMES), n=1, cutoff=cutoff)
+    return _CATEGORY_NAMES[matches[0]] if matches else None
@@ -0,0 +1,394 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Writable properties per element kind; read-only ones returned by presentations.get are dropped
+SHAPE_PROPERTY_FIELDS = ("shapeBackgroundFill", "outline", "contentAlignment", "link", "autofit")
+IMAGE_PROPERTY_FIELDS = ("outline", "link")
+LINE_PROPERTY_FIELDS = ("lineFill", "weight", "dashStyle", "startArrow", "endArrow", "link")
+TABLE_CELL_PROPERTY_FIELDS = ("tableCellBackgroundFill", "contentAlignment")
+TEXT_STYLE_FIELDS = (
+    "backgroundColor", "foregroundColor", "bold", "italic", "fontFamily", "fontSize", "link",
+    "baselineOffset", "smallCaps", "strikethrough", "underline", "weightedFontFamily",
+)
+PARAGRAPH_STYLE_FIELDS = (
+    "lineSpacing", "alignment", "indentStart", "indentEnd", "spaceAbove", "spaceBelow",
+    "indentFirstLine", "direction", "spacingMode",
+)
+LINE_CATEGORIES = {"STRAIGHT", "BENT", "CURVED"}
+DEFAULT_BULLET_PRESET = "BULLET_DISC_CIRCLE_SQUARE"
+
+
+def utf16_length(text):
+    """Length in UTF-16 code units, the unit of every index in the Slides API."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _writable(properties, fields):
+    values = {field: properties[field] for field in fields if field in (properties or {})}
+    # "autofit" only accepts autofitType; its other members are read-only
+    if "autofit" in values:
+        autofit_type = values["autofit"].get("autofitType")
+        if autofit_type in (None, "AUTOFIT_TYPE_UNSPECIFIED"):
+            del values["autofit"]
+        else:
+            values["autofit"] = {"autofitType": autofit_type}
+    return values
+
+
+def _merge_ranges(ranges):
+    """Merge adjacent (start, end, value) ranges that share the same value."""
+    merged = []
+    for start, end, value in ranges:
+        if merged and merged[-1][1] == start and merged[-1][2] == value:
+            merged[-1] = (merged[-1][0], end, value)
+        else:
+            merged.append((start, end, value))
+    return merged
+
+
+def compose_transforms(outer, inner):
+    """Absolute transform of an element whose transform is relative to a group with transform outer."""
+    def matrix(transform):
+        # A missing transform is the identity, but within one the API omits zero-valued
+        # entries, e.g. a 90 degree rotation has only shearX and shearY
+        if not transform:
+            return (1, 0, 0, 0, 1, 0)
+        return tuple(transform.get(name, 0) for name in (
+            "scaleX", "shearX", "translateX", "shearY", "scaleY", "translateY",
+        ))
+
+    a1, c1, e1, b1, d1, f1 = matrix(outer)
+    a2, c2, e2, b2, d2, f2 = matrix(inner)
+    return {
+        "scaleX": a1 * a2 + c1 * b2,
+        "shearX": a1 * c2 + c1 * d2,
+        "translateX": a1 * e2 + c1 * f2 + e1,
+        "shearY": b1 * a2 + d1 * b2,
+        "scaleY": b1 * c2 + d1 * d2,
+        "translateY": b1 * e2 + d1 * f2 + f1,
+        "unit": (inner or {}).get("unit") or (outer or {}).get("unit") or "EMU",
+    }
+
+
+class SlideCloner:
+    """Translates a source page into the requests that rebuild it on another slide.
+
+    Shapes keep their fill, outline and text styles, tables their cells, merges and
+    sizes, lines their style, and groups are regrouped. Text is inserted once per
+    shape or cell, and styles are applied over maximal ranges of identical runs, so
+    a slide costs a handful of requests regardless of how many runs it has.
+    """
+
+    def __init__(self, new_object_id):
+        self.new_object_id = new_object_id
+        self.requests = []
+
+    def clone(self, source_slide, new_slide_id):
+        background = (source_slide.get("pageProperties") or {}).get("pageBackgroundFill")
+        if background and background.get("propertyState", "RENDERED") == "RENDERED" and (
+            "solidFill" in background or "stretchedPictureFill" in background
+        ):
+            fill = {key: background[key] for key in ("solidFill", "stretchedPictureFill") if key in background}
+            self.requests.append({
+                "updatePageProperties": {
+                    "objectId": new_slide_id,
+                    "pageProperties": {"pageBackgroundFill": fill},
+                    "fields": "pageBackgroundFill",
+                }
+            })
+
+        for element in source_slide.get("pageElements", []):
+            try:
+                self.clone_element(element, new_slide_id)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Error copying element {element.get('objectId')}: {e}")
+        return self.requests
+
+    def _element_properties(self, element, page_id, transform=None):
+        properties = {"pageObjectId": page_id}
+        if element.get("size"):
+            properties["size"] = element["size"]
+        if transform or element.get("transform"):
+            properties["transform"] = transform or element["transform"]
+        return properties
+
+    def clone_element(self, element, page_id, transform=None):
+        """Append the requests for one element; returns its new objectId, or None if it was skipped."""
+        properties = self._element_properties(element, page_id, transform)
+        if "shape" in element:
+            return self.clone_shape(element["shape"], properties)
+        if "image" in element:
+            return self.clone_image(element["image"], properties)
+        if "table" in element:
+            return self.clone_table(element["table"], properties)
+        if "line" in element:
+            return self.clone_line(element["line"], properties)
+        if "elementGroup" in element:
+            return self.clone_group(element, page_id, transform)
+        if "sheetsChart" in element:
+            # Rebuilt from its rendered image, which needs no access to the spreadsheet
+            return self.clone_image(element["sheetsChart"], properties)
+        if "video" in element:
+            return self.clone_video(element["video"], properties)
+        if "wordArt" in element:
+            return self.clone_word_art(element["wordArt"], properties)
+        logger.debug("Skipping unsupported element %s", element.get("objectId"))
+        return None
+
+    def clone_shape(self, shape, properties):
+        object_id = self.new_object_id()
+        shape_type = shape.get("shapeType")
+        if shape_type in (None, "TYPE_UNSPECIFIED"):
+            shape_type = "TEXT_BOX"
+        self.requests.append({
+            "createShape": {"objectId": object_id, "shapeType": shape_type, "elementProperties": properties}
+        })
+
+        shape_properties = _writable(shape.get("shapeProperties"), SHAPE_PROPERTY_FIELDS)
+        if shape_properties:
+            self.requests.append({
+                "updateShapeProperties": {
+                    "objectId": object_id,
+                    "shapeProperties": shape_properties,
+                    "fields": ",".join(shape_properties),
+                }
+            })
+
+        self.add_text(object_id, shape.get("text"))
+        return object_id
+
+    def add_text(self, object_id, text, cell_location=None):
+        """Insert the text of a shape or table cell, then restyle it in merged ranges."""
+        if not text:
+            return
+        content, runs, paragraphs = [], [], []
+        length = 0
+        for text_element in text.get("textElements", []):
+            if "paragraphMarker" in text_element:
+                marker = text_element["paragraphMarker"]
+                paragraphs.append((
+                    text_element.get("startIndex", 0),
+                    text_element.get("endIndex", 0),
+                    _writable(marker.get("style"), PARAGRAPH_STYLE_FIELDS),
+                    "bullet" in marker,
+                ))
+                continue
+            run = text_element.get("textRun") or text_element.get("autoText")
+            if not run or not run.get("content"):
+                continue
+            run_length = utf16_length(run["content"])
+            runs.append((length, length + run_length, _writable(run.get("style"), TEXT_STYLE_FIELDS)))
+            content.append(run["content"])
+            length += run_length
+
+        full_text = "".join(content)
+        # Every shape already ends with a newline, so the last one is not inserted
+        if full_text.endswith("\n"):
+            full_text = full_text[:-1]
+        if not full_text:
+            return
+        text_length = utf16_length(full_text)
+
+        target = {"objectId": object_id}
+        if cell_location:
+            target["cellLocation"] = cell_location
+        self.requests.append({"insertText": dict(target, text=full_text, insertionIndex=0)})
+
+        for start, end, style in _merge_ranges(runs):
+            end = min(end, text_length)
+            if not style or start >= end:
+                continue
+            self.requests.append({
+                "updateTextStyle": dict(
+                    target,
+                    style=style,
+                    textRange={"type": "FIXED_RANGE", "startIndex": start, "endIndex": end},
+                    fields=",".join(style),
+                )
+            })
+
+        paragraph_styles = _merge_ranges([(start, end, style) for start, end, style, _ in paragraphs])
+        for start, end, style in paragraph_styles:
+            end = min(end, text_length)
+            if not style or start >= end:
+                continue
+            self.requests.append({
+                "updateParagraphStyle": dict(
+                    target,
+                    style=style,
+                    textRange={"type": "FIXED_RANGE", "startIndex": start, "endIndex": end},
+                    fields=",".join(style),
+                )
+            })
+
+        bullets = _merge_ranges([(start, end, bullet) for start, end, _, bullet in paragraphs])
+        for start, end, bullet in bullets:
+            end = min(end, text_length)
+            if not bullet or start >= end:
+                continue
+            self.requests.append({
+                "createParagraphBullets": dict(
+                    target,
+                    textRange={"type": "FIXED_RANGE", "startIndex": start, "endIndex": end},
+                    bulletPreset=DEFAULT_BULLET_PRESET,
+                )
+            })
+
+    def clone_image(self, image, properties):
+        url = image.get("contentUrl") or image.get("sourceUrl")
+        if not url:
+            logger.debug("Skipping image without a URL")
+            return None
+        object_id = self.new_object_id()
+        self.requests.append({"createImage": {"objectId": object_id, "url": url, "elementProperties": properties}})
+
+        image_properties = _writable(image.get("imageProperties"), IMAGE_PROPERTY_FIELDS)
+        if image_properties:
+            self.requests.append({
+                "updateImageProperties": {
+                    "objectId": object_id,
+                    "imageProperties": image_properties,
+                    "fields": ",".join(image_properties),
+                }
+            })
+        return object_id
+
+    def clone_table(self, table, properties):
+        rows, columns = table.get("rows", 0), table.get("columns", 0)
+        if not rows or not columns:
+            return None
+        object_id = self.new_object_id()
+        self.requests.append({
+            "createTable": {"objectId": object_id, "elementProperties": properties, "rows": rows, "columns": columns}
+        })
+
+        for column_index, column in enumerate(table.get("tableColumns", [])):
+            if column.get("columnWidth"):
+                self.requests.append({
+                    "updateTableColumnProperties": {
+                        "objectId": object_id,
+                        "columnIndices": [column_index],
+                        "tableColumnProperties": {"columnWidth": column["columnWidth"]},
+                        "fields": "columnWidth",
+                    }
+                })
+
+        for row_index, row in enumerate(table.get("tableRows", [])):
+            if row.get("rowHeight"):
+                self.requests.append({
+                    "updateTableRowProperties": {
+                        "objectId": object_id,
+                        "rowIndices": [row_index],
+                        "tableRowProperties": {"minRowHeight": row["rowHeight"]},
+                        "fields": "minRowHeight",
+                    }
+                })
+
+            # Cells of a row with identical properties are updated as one range
+            cell_properties = []
+            for cell in row.get("tableCells", []):
+                location = cell.get("location", {})
+                column_index = location.get("columnIndex", 0)
+                cell_properties.append((
+                    column_index,
+                    column_index + cell.get("columnSpan", 1),
+                    _writable(cell.get("tableCellProperties"), TABLE_CELL_PROPERTY_FIELDS),
+                ))
+                if cell.get("rowSpan", 1) > 1 or cell.get("columnSpan", 1) > 1:
+                    self.requests.append({
+                        "mergeTableCells": {
+                            "objectId": object_id,
+                            "tableRange": {
+                                "location": {"rowIndex": row_index, "columnIndex": column_index},
+                                "rowSpan": cell.get("rowSpan", 1),
+                                "columnSpan": cell.get("columnSpan", 1),
+                            },
+                        }
+                    })
+                self.add_text(object_id, cell.get("text"), {"rowIndex": row_index, "columnIndex": column_index})
+
+            for start, end, values in _merge_ranges(cell_properties):
+                if not values:
+                    continue
+                self.requests.append({
+                    "updateTableCellProperties": {
+                        "objectId": object_id,
+                        "tableRange": {
+                            "location": {"rowIndex": row_index, "columnIndex": start},
+                            "rowSpan": 1,
+                            "columnSpan": end - start,
+                        },
+                        "tableCellProperties": values,
+                        "fields": ",".join(values),
+                    }
+                })
+        return object_id
+
+    def clone_line(self, line, properties):
+        object_id = self.new_object_id()
+        category = line.get("lineCategory")
+        self.requests.append({
+            "createLine": {
+                "objectId": object_id,
+                "category": category if category in LINE_CATEGORIES else "STRAIGHT",
+                "elementProperties": properties,
+            }
+        })
+        line_properties = _writable(line.get("lineProperties"), LINE_PROPERTY_FIELDS)
+        if line_properties:
+            self.requests.append({
+                "updateLineProperties": {
+                    "objectId": object_id,
+                    "lineProperties": line_properties,
+                    "fields": ",".join(line_properties),
+                }
+            })
+        return object_id
+
+    def clone_group(self, element, page_id, transform=None):
+        # Children transforms are relative to the group, so place them absolutely first
+        group_transform = transform or element.get("transform")
+        children = [
+            self.clone_element(child, page_id, compose_transforms(group_transform, child.get("transform")))
+            for child in element["elementGroup"].get("children", [])
+        ]
+        children = [child for child in children if child]
+        if len(children) < 2:
+            return children[0] if children else None
+        object_id = self.new_object_id()
+        self.requests.append({"groupObjects": {"groupObjectId": object_id, "childrenObjectIds": children}})
+        return object_id
+
+    def clone_video(self, video, properties):
+        if video.get("source") not in ("YOUTUBE", "DRIVE") or not video.get("id"):
+            return None
+        object_id = self.new_object_id()
+        self.requests.append({
+            "createVideo": {
+                "objectId": object_id,
+                "source": video["source"],
+                "id": video["id"],
+                "elementProperties": properties,
+            }
+        })
+        return object_id
+
+    def clone_word_art(self, word_art, properties):
+        object_id = self.new_object_id()
+        self.requests.append({
+            "createShape": {"objectId": object_id, "shapeType": "TEXT_BOX", "elementProperties": properties}
+        })
+        if word_art.get("renderedText"):
+            self.requests.append({
+                "insertText": {"objectId": object_id, "text": word_art["renderedText"], "insertionIndex": 0}
+            })
+        return object_id
+
+
+def clone_slide_requests(source_slide, new_slide_id, new_object_id):
+    """Requests that rebuild source_slide on the existing slide new_slide_id.
+
+    new_object_id() returns a fresh objectId for each created element.
+    """
+    return SlideCloner(new_object_id).clone(source_slide, new_slide_id)
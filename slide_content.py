@@ -0,0 +1,169 @@
+import hashlib
+import json
+import zlib
+
+# Extracted slide text kept on the main Firestore document
+SLIDE_TEXT_LIMIT = 4000
+# Firestore rejects documents over 1 MiB; leave room for the other fields
+MAX_PAGE_BYTES = 1000000
+PAGE_ENCODING = "zlib+json"
+
+
+def _text_content(text):
+    return "".join(
+        text_element["textRun"].get("content", "")
+        for text_element in text.get("textElements", [])
+        if "textRun" in text_element
+    )
+
+
+def normalize_element(element):
+    """Reduce a page element to the parts that define its content.
+
+    Volatile fields such as image contentUrls (short-lived signed URLs) are left
+    out so that re-fetching an unchanged slide yields the same normalized form.
+    """
+    normalized = {
+        "size": element.get("size"),
+        "transform": element.get("transform"),
+    }
+
+    if "shape" in element:
+        shape = element["shape"]
+        normalized["shape"] = {
+            "shapeType": shape.get("shapeType"),
+            "placeholder": shape.get("placeholder", {}).get("type"),
+            "text": _text_content(shape.get("text", {})),
+        }
+    elif "image" in element:
+        normalized["image"] = {"sourceUrl": element["image"].get("sourceUrl")}
+    elif "table" in element:
+        table = element["table"]
+        normalized["table"] = [
+            [_text_content(cell.get("text", {})) for cell in row.get("tableCells", [])]
+            for row in table.get("tableRows", [])
+        ]
+    elif "line" in element:
+        normalized["line"] = {"lineType": element["line"].get("lineType")}
+    elif "elementGroup" in element:
+        normalized["elementGroup"] = [
+            normalize_element(child) for child in element["elementGroup"].get("children", [])
+        ]
+    else:
+        # video, sheetsChart, wordArt, ...: keep the element kind only
+        normalized["kind"] = sorted(key for key in element if key not in ("objectId", "size", "transform"))
+
+    return normalized
+
+
+def normalize_slide(slide):
+    return [normalize_element(element) for element in slide.get("pageElements", [])]
+
+
+def slide_content_hash(slide):
+    """Stable hash of a slide's normalized pageElements (text runs, shapes, images)."""
+    normalized = json.dumps(normalize_slide(slide), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def slide_document_id(presentation_id, object_id):
+    """Stable Firestore document ID for a slide, so re-ingesting overwrites instead of duplicating."""
+    return f"slide-{presentation_id}-{object_id}"
+
+
+def _element_texts(element):
+    if "shape" in element:
+        yield _text_content(element["shape"].get("text", {}))
+    elif "table" in element:
+        for row in element["table"].get("tableRows", []):
+            for cell in row.get("tableCells", []):
+                yield _text_content(cell.get("text", {}))
+    elif "elementGroup" in element:
+        for child in element["elementGroup"].get("children", []):
+            yield from _element_texts(child)
+
+
+def slide_text(slide, limit=SLIDE_TEXT_LIMIT):
+    """All text on the slide (shapes, tables, grouped elements), one line per text block."""
+    texts = (
+        text.strip()
+        for element in slide.get("pageElements", [])
+        for text in _element_texts(element)
+    )
+    return "\n".join(text for text in texts if text)[:limit]
+
+
+def _element_kind(element):
+    for kind in ("shape", "image", "table", "line", "elementGroup", "video", "sheetsChart", "wordArt", "speakerSpotlight"):
+        if kind in element:
+            return kind
+    return "other"
+
+
+def element_counts(slide):
+    """Number of page elements of each kind, e.g. {"shape": 3, "image": 1}."""
+    counts = {}
+    for element in slide.get("pageElements", []):
+        kind = _element_kind(element)
+        counts[kind] = counts.get(kind, 0) + 1
+    return counts
+
+
+def slide_layout(slide):
+    """Layout and placeholder types of the slide, enough to tell a title slide from a body slide."""
+    placeholders = sorted({
+        element["shape"]["placeholder"].get("type")
+        for element in slide.get("pageElements", [])
+        if "placeholder" in element.get("shape", {})
+    } - {None})
+    return {
+        "layoutObjectId": slide.get("slideProperties", {}).get("layoutObjectId"),
+        "placeholders": placeholders,
+    }
+
+
+def _without_expired_urls(element):
+    """The element with its expiring contentUrls removed, or None if nothing could be kept."""
+    if "image" in element:
+        image = {key: value for key, value in element["image"].items() if key != "contentUrl"}
+        # sourceUrl is the URL the image was inserted from and does not expire
+        return dict(element, image=image) if image.get("sourceUrl") else None
+    if "sheetsChart" in element:
+        # Charts are copied from their rendered image, which only has a contentUrl
+        return None
+    if "elementGroup" in element:
+        children = [
+            child for child in map(_without_expired_urls, element["elementGroup"].get("children", []))
+            if child is not None
+        ]
+        if not children:
+            return None
+        return dict(element, elementGroup=dict(element["elementGroup"], children=children))
+    return element
+
+
+def without_expired_urls(slide):
+    """A copy of a stored page without the image contentUrls, which expire soon after it was fetched.
+
+    Images that only have a contentUrl, and charts, are dropped, as is a picture
+    background. Returns None if that leaves a page that had elements with none.
+    """
+    elements = slide.get("pageElements", [])
+    kept = [element for element in map(_without_expired_urls, elements) if element is not None]
+    if elements and not kept:
+        return None
+    slide = dict(slide, pageElements=kept)
+    background = (slide.get("pageProperties") or {}).get("pageBackgroundFill")
+    if background and "stretchedPictureFill" in background:
+        background = {key: value for key, value in background.items() if key != "stretchedPictureFill"}
+        slide["pageProperties"] = dict(slide["pageProperties"], pageBackgroundFill=background)
+    return slide
+
+
+def compress_page(slide):
+    """The raw page as compact, zlib-compressed JSON bytes."""
+    return zlib.compress(json.dumps(slide, separators=(",", ":")).encode("utf-8"), 9)
+
+
+def decompress_page(data):
+    return json.loads(zlib.decompress(data).decode("utf-8"))
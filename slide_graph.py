@@ -0,0 +1,282 @@
+import os
+import threading
+
+import numpy as np
+
+from slide_catalog import parse_tags, slide_catalog
+import slide_retrieval
+from slide_retrieval import index_slides, slide_key
+
+SLIDE_GRAPH_FILE = os.environ.get("SLIDE_GRAPH_FILE", "slide_graph.npz")
+# Neighbours kept per slide
+GRAPH_TOP_K = int(os.environ.get("GRAPH_TOP_K", "10"))
+# Share of the edge score given to tag overlap; the rest is embedding similarity
+GRAPH_TAG_WEIGHT = float(os.environ.get("GRAPH_TAG_WEIGHT", "0.3"))
+# Rows scored per matrix product, bounding memory to GRAPH_BLOCK_SIZE x slides floats
+GRAPH_BLOCK_SIZE = int(os.environ.get("GRAPH_BLOCK_SIZE", "256"))
+
+TAG_SEPARATOR = "|"
+
+
+def _top_k(columns, scores, k):
+    """Keep the k best (column, score) pairs of each row, best first; missing entries are -1."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.full((len(scores), 0), -1, dtype=np.int32), np.zeros((len(scores), 0), dtype=np.float32)
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    best_scores = np.take_along_axis(scores, best, axis=1)
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+    best = np.take_along_axis(best, order, axis=1)
+    best_scores = np.take_along_axis(best_scores, order, axis=1)
+    best_columns = np.take_along_axis(columns, best, axis=1).astype(np.int32)
+    best_columns[~np.isfinite(best_scores)] = -1
+    return best_columns, best_scores.astype(np.float32)
+
+
+class SlideGraph:
+    """Top-k relationship graph between slides, persisted to a local .npz file.
+
+    Edges are scored as a blend of summary-embedding cosine similarity (blocked
+    NumPy matrix products over the shared embedding index) and the Jaccard
+    overlap of tags (through an inverted tag index, so only slides sharing a tag
+    are compared). Each slide keeps its k best neighbours in a dense
+    (slides x k) array. New or changed slides are merged in incrementally
+    without rescoring the pairs that did not change.
+    """
+
+    def __init__(self, path=SLIDE_GRAPH_FILE, k=GRAPH_TOP_K, tag_weight=GRAPH_TAG_WEIGHT,
+                 block_size=GRAPH_BLOCK_SIZE, index=None):
+        self.path = path
+        self.k = k
+        self.tag_weight = tag_weight
+        self.block_size = block_size
+        # Defaults to the shared slide_retrieval.embedding_index
+        self._index = index
+        self.keys = []
+        self.tags = []
+        self.neighbors = np.full((0, k), -1, dtype=np.int32)
+        self.scores = np.zeros((0, k), dtype=np.float32)
+        self._rows = {}
+        self._tag_rows = {}
+        self._lock = threading.RLock()
+        self._loaded = False
+
+    def load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not os.path.exists(self.path):
+                return
+            data = np.load(self.path, allow_pickle=False)
+            if int(data["k"]) != self.k:
+                print(f"Ignoring slide graph {self.path} built with k={int(data['k'])}; rebuild it")
+                return
+            self.keys = [str(key) for key in data["keys"]]
+            self.tags = [frozenset(filter(None, str(tags).split(TAG_SEPARATOR))) for tags in data["tags"]]
+            self.neighbors = data["neighbors"].astype(np.int32)
+            self.scores = data["scores"].astype(np.float32)
+            self._rows = {key: row for row, key in enumerate(self.keys)}
+            self._tag_rows = {}
+            for row, tags in enumerate(self.tags):
+                for tag in tags:
+                    self._tag_rows.setdefault(tag, set()).add(row)
+
+    def clear(self):
+        with self._lock:
+            self._loaded = True
+            self.keys, self.tags = [], []
+            self.neighbors = np.full((0, self.k), -1, dtype=np.int32)
+            self.scores = np.zeros((0, self.k), dtype=np.float32)
+            self._rows, self._tag_rows = {}, {}
+
+    def save(self):
+        with self._lock:
+            tmp_path = self.path + ".tmp.npz"
+            np.savez(
+                tmp_path,
+                keys=np.array(self.keys, dtype=str),
+                tags=np.array([TAG_SEPARATOR.join(sorted(tags)) for tags in self.tags], dtype=str),
+                neighbors=self.neighbors,
+                scores=self.scores,
+                k=np.array(self.k),
+            )
+            os.replace(tmp_path, self.path)
+
+    @property
+    def index(self):
+        return self._index or slide_retrieval.embedding_index
+
+    def __len__(self):
+        self.load()
+        return len(self.keys)
+
+    def _vectors(self, rows):
+        return self.index.vectors([self.keys[row] for row in rows])
+
+    def _tag_overlap(self, row, columns_position, width):
+        """Jaccard similarity of row's tags with every column sharing at least one tag."""
+        overlap = np.zeros(width, dtype=np.float32)
+        tags = self.tags[row]
+        if not tags:
+            return overlap
+        shared = {}
+        for tag in tags:
+            for other in self._tag_rows.get(tag, ()):
+                shared[other] = shared.get(other, 0) + 1
+        for other, count in shared.items():
+            position = columns_position[other]
+            if position >= 0:
+                overlap[position] = count / (len(tags) + len(self.tags[other]) - count)
+        return overlap
+
+    def _score(self, rows, columns):
+        """Edge scores between rows and columns (both lists of row indices), self-pairs excluded."""
+        scores = (1 - self.tag_weight) * (self._vectors(rows) @ self._vectors(columns).T)
+        if self.tag_weight:
+            columns_position = np.full(len(self.keys), -1, dtype=np.int64)
+            columns_position[columns] = np.arange(len(columns))
+            for position, row in enumerate(rows):
+                scores[position] += self.tag_weight * self._tag_overlap(row, columns_position, len(columns))
+        columns_position = {column: position for position, column in enumerate(columns)}
+        for position, row in enumerate(rows):
+            if row in columns_position:
+                scores[position, columns_position[row]] = -np.inf
+        return scores
+
+    def _set_tags(self, row, tags):
+        for tag in self.tags[row]:
+            self._tag_rows[tag].discard(row)
+        self.tags[row] = tags
+        for tag in tags:
+            self._tag_rows.setdefault(tag, set()).add(row)
+
+    def add(self, slides):
+        """Add or update slides given as dicts with presentation_id, objectId and tags.
+
+        The slides must already be in the embedding index. Their rows are scored
+        against the whole graph, and every other row merges them into its top k.
+        Edges into an updated slide are rescored the same way; a row that drops
+        it keeps k - 1 neighbours until the next rebuild_slide_graph.
+        """
+        self.load()
+        with self._lock:
+            fresh = []
+            for slide in slides:
+                key = slide_key(slide.get("presentation_id"), slide.get("objectId"))
+                if key not in self.index:
+                    continue
+                tags = frozenset(parse_tags(slide.get("tags")))
+                row = self._rows.get(key)
+                if row is None:
+                    row = self._rows[key] = len(self.keys)
+                    self.keys.append(key)
+                    self.tags.append(frozenset())
+                fresh.append(row)
+                self._set_tags(row, tags)
+            fresh = sorted(set(fresh))
+            if not fresh:
+                return 0
+
+            missing = len(self.keys) - len(self.neighbors)
+            if missing:
+                self.neighbors = np.vstack([self.neighbors, np.full((missing, self.k), -1, dtype=np.int32)])
+                self.scores = np.vstack([self.scores, np.full((missing, self.k), -np.inf, dtype=np.float32)])
+
+            # Old edges into updated slides are stale
+            stale = np.isin(self.neighbors, fresh)
+            self.neighbors[stale] = -1
+            self.scores[stale] = -np.inf
+
+            everything = list(range(len(self.keys)))
+            fresh_set = set(fresh)
+            existing = np.array([row for row in everything if row not in fresh_set], dtype=np.int64)
+            for start in range(0, len(fresh), self.block_size):
+                rows = fresh[start:start + self.block_size]
+                scores = self._score(rows, everything)
+                columns = np.broadcast_to(np.arange(len(everything)), scores.shape)
+                self.neighbors[rows], self.scores[rows] = self._pad(*_top_k(columns, scores, self.k))
+
+                # Both similarities are symmetric, so the other rows' edges to this block are its
+                # transpose; nothing is rescored from their side
+                fresh_columns = np.array(rows, dtype=np.int32)
+                for existing_start in range(0, len(existing), self.block_size):
+                    existing_rows = existing[existing_start:existing_start + self.block_size]
+                    merged_scores = np.hstack([self.scores[existing_rows], scores[:, existing_rows].T])
+                    merged_columns = np.hstack([
+                        self.neighbors[existing_rows],
+                        np.broadcast_to(fresh_columns, (len(existing_rows), len(rows))),
+                    ])
+                    self.neighbors[existing_rows], self.scores[existing_rows] = self._pad(
+                        *_top_k(merged_columns, merged_scores, self.k)
+                    )
+            return len(fresh)
+
+    def _pad(self, neighbors, scores):
+        missing = self.k - neighbors.shape[1]
+        if missing > 0:
+            neighbors = np.hstack([neighbors, np.full((len(neighbors), missing), -1, dtype=np.int32)])
+            scores = np.hstack([scores, np.full((len(scores), missing), -np.inf, dtype=np.float32)])
+        return neighbors, scores
+
+    def related(self, presentation_id, object_id, k=None):
+        """The most related slides as (presentation_id, objectId, score), best first."""
+        self.load()
+        with self._lock:
+            row = self._rows.get(slide_key(presentation_id, object_id))
+            if row is None:
+                return []
+            related = []
+            for neighbor, score in zip(self.neighbors[row][:k or self.k], self.scores[row]):
+                if neighbor < 0:
+                    break
+                neighbor_presentation, _, neighbor_object = self.keys[neighbor].partition("/")
+                related.append((neighbor_presentation, neighbor_object, float(score)))
+            return related
+
+    def stats(self):
+        self.load()
+        with self._lock:
+            return {"slides": len(self.keys), "edges": int((self.neighbors >= 0).sum())}
+
+
+# Shared graph, extended by ingestion and read by generation
+slide_graph = SlideGraph()
+
+
+def update_slide_graph(slides):
+    """Merge freshly embedded slides into the shared graph and save it."""
+    added = slide_graph.add(slides)
+    if added:
+        slide_graph.save()
+    return added
+
+
+def related_slides(presentation_id, object_id, k=None):
+    return slide_graph.related(presentation_id, object_id, k)
+
+
+def get_slide_graph_stats():
+    return slide_graph.stats()
+
+
+def rebuild_slide_graph(db):
+    """Rebuild the graph from every categorized slide, embedding any missing from the index."""
+    slide_catalog.load(db)
+    slides = [record.as_dict() for record in slide_catalog.records()]
+    missing = [slide for slide in slides
+               if slide_key(slide["presentation_id"], slide["objectId"]) not in slide_retrieval.embedding_index]
+    if missing:
+        print(f"Embedding {len(missing)} slides missing from the index")
+        index_slides(missing)
+
+    slide_graph.clear()
+    slide_graph.add(slides)
+    slide_graph.save()
+    print(f"Built slide graph with {len(slide_graph)} slides and {slide_graph.stats()['edges']} edges")
+    return slide_graph
+
+
+if __name__ == "__main__":
+    from firebase_options import db
+    rebuild_slide_graph(db)
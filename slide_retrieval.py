@@ -0,0 +1,162 @@
+import os
+import threading
+
+import numpy as np
+from langchain_openai import OpenAIEmbeddings
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_INDEX_FILE = "slide_embeddings.npz"
+
+# Number of candidates handed to choose_best_slide per section
+RETRIEVAL_TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", "15"))
+
+
+def slide_key(presentation_id, object_id):
+    return f"{presentation_id}/{object_id}"
+
+
+def slide_embedding_text(summary, tags):
+    if isinstance(tags, (list, tuple)):
+        tags = ", ".join(tags)
+    return f"{summary or ''}\nTags: {tags or ''}"
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class SlideEmbeddingIndex:
+    """Unit-normalized slide embeddings in a NumPy matrix, persisted to a local .npz file."""
+
+    def __init__(self, path=EMBEDDING_INDEX_FILE):
+        self.path = path
+        self.keys = []
+        self.matrix = None
+        self._rows = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not os.path.exists(self.path):
+                return
+            data = np.load(self.path, allow_pickle=False)
+            self.keys = [str(key) for key in data["keys"]]
+            self.matrix = data["matrix"].astype(np.float32)
+            self._rows = {key: row for row, key in enumerate(self.keys)}
+
+    def save(self):
+        with self._lock:
+            if self.matrix is None:
+                return
+            tmp_path = self.path + ".tmp.npz"
+            np.savez(tmp_path, keys=np.array(self.keys), matrix=self.matrix)
+            os.replace(tmp_path, self.path)
+
+    def __contains__(self, key):
+        self.load()
+        return key in self._rows
+
+    def add(self, keys, vectors):
+        """Insert or overwrite the vectors for keys."""
+        self.load()
+        vectors = _normalize(vectors)
+        with self._lock:
+            new_keys, new_vectors = [], []
+            for key, vector in zip(keys, vectors):
+                row = self._rows.get(key)
+                if row is not None and row >= len(self.keys):
+                    new_vectors[row - len(self.keys)] = vector
+                elif row is not None:
+                    self.matrix[row] = vector
+                else:
+                    self._rows[key] = len(self.keys) + len(new_keys)
+                    new_keys.append(key)
+                    new_vectors.append(vector)
+            if new_keys:
+                stacked = np.vstack(new_vectors)
+                self.matrix = stacked if self.matrix is None else np.vstack([self.matrix, stacked])
+                self.keys.extend(new_keys)
+
+    def vectors(self, keys):
+        self.load()
+        with self._lock:
+            return self.matrix[[self._rows[key] for key in keys]]
+
+    def similarities(self, query_vector, keys):
+        """Cosine similarity of the query to each key (all keys must be indexed)."""
+        if not keys:
+            return np.zeros(0, dtype=np.float32)
+        return self.vectors(keys) @ _normalize(query_vector)
+
+
+# Shared index used by ingestion and slide selection
+embedding_index = SlideEmbeddingIndex()
+
+_embeddings = None
+
+
+def get_embeddings():
+    global _embeddings
+    if _embeddings is None:
+        _embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
+    return _embeddings
+
+
+def index_slides(slides):
+    """Embed and store slides given as dicts with presentation_id, objectId, summary and tags."""
+    slides = [slide for slide in slides if slide.get("summary")]
+    if not slides:
+        return 0
+    texts = [slide_embedding_text(slide.get("summary"), slide.get("tags")) for slide in slides]
+    vectors = get_embeddings().embed_documents(texts)
+    embedding_index.add(
+        [slide_key(slide.get("presentation_id"), slide.get("objectId")) for slide in slides],
+        vectors
+    )
+    embedding_index.save()
+    return len(slides)
+
+
+def rank_candidates(slides, client_intent, slide_goal, k=RETRIEVAL_TOP_K):
+    """Return the k slides most similar to the client intent and section goal.
+
+    Slides ingested before the index existed are embedded on first use. Up to k
+    slides that still have no embedding (no summary, or embedding them failed)
+    follow the ranked ones without a relevance score rather than being dropped,
+    so at most 2 * k candidates are returned.
+    Categories with at most k slides are returned unchanged without any
+    embedding calls.
+    """
+    if len(slides) <= k:
+        return slides
+
+    try:
+        keys = [slide_key(slide.get("presentation_id"), slide.get("objectId")) for slide in slides]
+        missing = [slide for slide, key in zip(slides, keys) if key not in embedding_index]
+        if missing:
+            print(f"Embedding {len(missing)} slides missing from the index")
+            index_slides(missing)
+
+        ranked_slides, ranked_keys, unindexed = [], [], []
+        for slide, key in zip(slides, keys):
+            if key in embedding_index:
+                ranked_slides.append(slide)
+                ranked_keys.append(key)
+            else:
+                unindexed.append(slide)
+
+        query_vector = get_embeddings().embed_query(f"{client_intent}\n{slide_goal}")
+        scores = embedding_index.similarities(query_vector, ranked_keys)
+    except Exception as e:
+        print(f"Error ranking slide candidates, using all of them: {e}")
+        return slides
+
+    top = np.argsort(-scores)[:k]
+    return [dict(ranked_slides[i], relevance=float(scores[i])) for i in top] + unindexed[:k]
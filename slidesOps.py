@@ -1,63 +1,114 @@
 import os.path
 import json
 import time
+import logging
 import uuid
+from concurrent.futures import FIRST_COMPLETED, wait
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-import google.auth
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
-SCOPES = ["https://www.googleapis.com/auth/presentations"]
+from instrumentation import api_requests, attach, current_span, span
+from ingestion_engine import worker_pool
 
+from slides_service import SCOPES, get_slides_service
+from presentation_cache import snapshot_cache
+from slide_cloner import clone_slide_requests
 
-# initialize the slides service
+logger = logging.getLogger(__name__)
+
+# Presentations fetched at once by fetch_presentations
+SLIDES_FETCH_CONCURRENCY = int(os.environ.get("SLIDES_FETCH_CONCURRENCY", "8"))
+# Levels of nested groups covered by SLIDE_FIELDS
+GROUP_NESTING_DEPTH = 3
+
+
+# get the shared slides service (built once per thread, see slides_service.py)
 def initialize_slides_service():
-  creds = None
-  if os.path.exists("token.json"):
-    creds = Credentials.from_authorized_user_file("token.json", SCOPES)
-  # If there are no (valid) credentials available, let the user log in.
-  if not creds or not creds.valid:
-    if creds and creds.expired and creds.refresh_token:
-      creds.refresh(Request())
-    else:
-      flow = InstalledAppFlow.from_client_secrets_file(
-          "credentials.json", SCOPES
-      )
-      creds = flow.run_local_server(port=0)
-    # Save the credentials for the next run
-    with open("token.json", "w") as token:
-      token.write(creds.to_json())
-
-  service = build("slides", "v1", credentials=creds)
-  return service
-
-def get_slides(presentation_id):
+  return get_slides_service()
+
+def get_slides(presentation_id, fields=None):
     # Build the Google Slides service
     service = initialize_slides_service()
 
     # Call the Google Slides API to retrieve all slides from the presentation
-    presentation = service.presentations().get(presentationId=presentation_id).execute()
+    # (only the parts named in fields, e.g. SLIDE_FIELDS, when given)
+    presentation = service.presentations().get(presentationId=presentation_id, fields=fields).execute()
 
     # Initialize an empty array to store slide contents
     slides_content = []
 
     # Iterate over each slide in the presentation
-    for slide in presentation['slides']:
-        slide_content = ""
+    for slide in presentation.get('slides', []):
         slides_content.append(slide)
-        # Iterate over each element (text, shapes, etc.) in the slide
-        # for element in slide['pageElements']:
-        #     #if "textRUN" in element:
-        #     slides_content.append(element)
-        #     # Append the slide_content to the slides_content array
-        #     #slides_content.append(element)
 
     # Print the array of slide contents
     return slides_content
 
+
+def page_element_fields(depth=GROUP_NESTING_DEPTH):
+    """Field mask for a page element, spelling out group children down to depth levels."""
+    fields = (
+        "objectId,size,transform,title,description,"
+        "shape(shapeType,placeholder,shapeProperties,text),"
+        "image(contentUrl,sourceUrl,imageProperties),"
+        "table(rows,columns,tableRows,tableColumns),"
+        "line(lineType,lineCategory,lineProperties),"
+        "video,sheetsChart,wordArt,speakerSpotlight"
+    )
+    if depth > 0:
+        fields += f",elementGroup(children({page_element_fields(depth - 1)}))"
+    return fields
+
+
+# Everything ingestion reads from a presentation: the slide elements (for content
+# hashes, text, layout and the stored page used to clone the slide), the layout
+# reference and background. Masters, layouts and notes pages are left out.
+SLIDE_FIELDS = (
+    "slides(objectId,slideProperties/layoutObjectId,pageProperties/pageBackgroundFill,"
+    f"pageElements({page_element_fields()}))"
+)
+
+
+def fetch_presentations(presentation_ids, fields=SLIDE_FIELDS, max_workers=None):
+    """Fetch many presentations concurrently, yielding (presentation_id, slides) as each arrives.
+
+    Requests run on the shared worker pool (see ingestion_engine.py), each
+    thread with its own long-lived Slides service, and ask only for the given
+    fields. At most max_workers
+    presentations are in flight or waiting to be consumed, so a slow consumer
+    does not pile up fetched decks in memory. Results come in completion order;
+    a presentation that fails to load is reported and yields no slides.
+    """
+    pending_ids = iter(presentation_ids)
+    max_workers = max_workers or SLIDES_FETCH_CONCURRENCY
+    parent = current_span()
+
+    def fetch(presentation_id):
+        with attach(parent), span("slides.fetch", presentation_id=presentation_id):
+            return get_slides(presentation_id, fields=fields)
+
+    in_flight = {}
+
+    def submit_next():
+        for presentation_id in pending_ids:
+            in_flight[worker_pool.submit(fetch, presentation_id)] = presentation_id
+            return
+
+    for _ in range(max_workers):
+        submit_next()
+    while in_flight:
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            presentation_id = in_flight.pop(future)
+            submit_next()
+            try:
+                slides = future.result()
+            except Exception as error:
+                # Timeouts, connection resets and credential refresh failures skip only this deck
+                print(f"Could not fetch presentation {presentation_id}: {error!r}")
+                slides = []
+            yield presentation_id, slides
+
 def create_slide(presentation_id, file_name):
   try:
     service = initialize_slides_service() # build the slides service connection
@@ -87,134 +138,50 @@ def generate_unique_object_id(base_id):
     """Generate a unique object ID using a base ID."""
     return f"{base_id}_{uuid.uuid4().hex[:8]}"
 
+def get_source_slide(source_presentation_id, slide_object_id):
+    """Look up a single slide page of a source presentation, or None if it is missing.
+
+    Source presentations are fetched through the shared snapshot cache, so copying
+    several slides from one deck downloads it once.
+    """
+    service = initialize_slides_service()
+    return snapshot_cache.get_slide(service, source_presentation_id, slide_object_id)
+
+
+def build_copy_slide_requests(source_slide, new_slide_id):
+    """Build the requests that replicate source_slide onto new_slide_id (see slide_cloner.py).
+
+    Every created element gets a client-generated objectId, so the requests can be
+    sent in the same batchUpdate as the createSlide for new_slide_id.
+    """
+    return clone_slide_requests(source_slide, new_slide_id, lambda: generate_unique_object_id("copied"))
+
+
 def copy_slide(source_presentation_id, slide_object_id, destination_presentation_id):
     try:
         service = initialize_slides_service()  # Initialize the Slides API service
 
-        # Get the source presentation data
-        source_presentation = service.presentations().get(
-            presentationId=source_presentation_id
-        ).execute()
-
-        # Find the source slide
-        source_slide = None
-        for slide in source_presentation["slides"]:
-            if slide["objectId"] == slide_object_id:
-                print("\nFOUND SLIDE\n")
-                source_slide = slide
-                break
-
+        source_slide = get_source_slide(source_presentation_id, slide_object_id)
         if source_slide is None:
             print(f"Slide {slide_object_id} not found in source presentation.")
             return {"status": "error", "message": "Slide not found"}
 
-        # Extract slide elements
-        slide_elements = source_slide.get("pageElements", [])
-        print(f"Found {len(slide_elements)} elements in source slide.")
+        logger.debug("Found %d elements in source slide.", len(source_slide.get('pageElements', [])))
 
-        # Create a new slide in the destination presentation
+        # Create the new slide and its elements in a single batch update
         new_slide_id = generate_unique_object_id("new_slide")
-        create_slide_request = [
-            {"createSlide": {"objectId": new_slide_id}}
-        ]
-        create_response = service.presentations().batchUpdate(
-            presentationId=destination_presentation_id,
-            body={"requests": create_slide_request}
-        ).execute()
-
-        print(f"Created new slide with ID: {new_slide_id}")
-
-        # Get the ID of the new slide
-        new_slide_id = create_response["replies"][0]["createSlide"]["objectId"]
-
-        # Prepare requests to replicate elements on the new slide
-        requests = []
+        requests = [{"createSlide": {"objectId": new_slide_id}}]
+        requests.extend(build_copy_slide_requests(source_slide, new_slide_id))
 
-        for element in slide_elements:
-            element_id = element["objectId"]
-            try:
-                # Handle shape elements
-                if "shape" in element:
-                    shape = element["shape"]
-                    text_content = shape.get("text", {}).get("textElements", [])
-                    shape_type = shape.get("shapeType", "TEXT_BOX")
-
-                    # Create the shape
-                    requests.append(
-                        {
-                            "createShape": {
-                                "objectId": f"copied_{element_id}",
-                                "shapeType": shape_type,
-                                "elementProperties": {
-                                    "pageObjectId": new_slide_id,
-                                    "size": element.get("size", {}),
-                                    "transform": element.get("transform", {}),
-                                },
-                            }
-                        }
-                    )
-
-                    # Add text to the shape
-                    for text_element in text_content:
-                        if "textRun" in text_element:
-                            requests.append(
-                                {
-                                    "insertText": {
-                                        "objectId": f"copied_{element_id}",
-                                        "text": text_element["textRun"]["content"],
-                                    }
-                                }
-                            )
-
-                # Handle image elements
-                elif "image" in element:
-                    image_url = element["image"].get("contentUrl", "")
-                    if image_url:
-                        # Create the image
-                        requests.append(
-                            {
-                                "createImage": {
-                                    "url": image_url,
-                                    "elementProperties": {
-                                        "pageObjectId": new_slide_id,
-                                        "size": element.get("size", {}),
-                                        "transform": element.get("transform", {}),
-                                    },
-                                }
-                            }
-                        )
-
-                # Handle other elements (e.g., titles, placeholders)
-                else:
-                    print(f"Adding placeholder or unknown element: {element_id}")
-                    requests.append(
-                        {
-                            "createShape": {
-                                "objectId": f"copied_{element_id}",
-                                "shapeType": "TEXT_BOX",  # Default to TEXT_BOX for placeholders
-                                "elementProperties": {
-                                    "pageObjectId": new_slide_id,
-                                    "size": element.get("size", {}),
-                                    "transform": element.get("transform", {}),
-                                },
-                            }
-                        }
-                    )
-            except Exception as element_error:
-                print(f"Error copying element {element_id}: {element_error}")
-                continue  # Skip this element and proceed with the rest
-
-        # Execute the batch update to add all elements to the new slide
-        if requests:
-            try:
-                batch_response = service.presentations().batchUpdate(
-                    presentationId=destination_presentation_id,
-                    body={"requests": requests}
-                ).execute()
-                print(f"Batch update response: {batch_response}")
-            except Exception as batch_error:
-                print(f"Error executing batch update for elements: {batch_error}")
-                return {"status": "partial_success", "message": "Slide copied partially due to errors"}
+        try:
+            api_requests.inc(len(requests), api="slides")
+            service.presentations().batchUpdate(
+                presentationId=destination_presentation_id,
+                body={"requests": requests}
+            ).execute()
+        except Exception as batch_error:
+            print(f"Error executing batch update for slide copy: {batch_error}")
+            return {"status": "error", "message": str(batch_error)}
 
         print(f"Successfully copied content from slide {slide_object_id} to new slide {new_slide_id}")
         return {"status": "success", "new_slide_id": new_slide_id}
@@ -233,22 +200,18 @@ def create_presentation(service, title):
     return presentation_id, first_slide_id
 
 
+def delete_slide_request(slide_id):
+    return {"deleteObject": {"objectId": slide_id}}
+
+
 def delete_first_slide(service, presentation_id, first_slide_id):
     if first_slide_id:
         print(f"Deleting first slide with ID: {first_slide_id}")
         try:
-            # Prepare request to delete the slide
-            delete_request = [
-                {
-                    "deleteObject": {
-                        "objectId": first_slide_id
-                    }
-                }
-            ]
             # Execute the batch update to delete the first slide
             service.presentations().batchUpdate(
                 presentationId=presentation_id,
-                body={"requests": delete_request}
+                body={"requests": [delete_slide_request(first_slide_id)]}
             ).execute()
             print(f"Deleted first slide with ID: {first_slide_id}")
         except Exception as e:
@@ -299,22 +262,24 @@ def add_slide_to_presentation(service, new_presentation_id, source_presentation_
     return response
 
 
+def apply_theme_request(slide_id, layout_id):
+    return {
+        "updateSlideProperties": {
+            "slideObjectId": slide_id,
+            "slideProperties": {
+                "layoutObjectId": layout_id
+            },
+            "fields": "layoutObjectId"
+        }
+    }
+
+
 def apply_theme_to_slide(presentation_id, slide_id, layout_id):
     try:
         service = initialize_slides_service()  # Initialize the Slides API service
 
         # Batch update request to apply the theme layout
-        requests = [
-            {
-                "updateSlideProperties": {
-                    "slideObjectId": slide_id,
-                    "slideProperties": {
-                        "layoutObjectId": layout_id
-                    },
-                    "fields": "layoutObjectId"
-                }
-            }
-        ]
+        requests = [apply_theme_request(slide_id, layout_id)]
 
         # Execute the batch update
         response = service.presentations().batchUpdate(
@@ -330,35 +295,54 @@ def apply_theme_to_slide(presentation_id, slide_id, layout_id):
         return {"status": "error", "message": str(error)}
     
     
-def set_slide_background_color(presentation_id, slide_id, color_hex):
-    # Convert hex color to RGB values
-    def hex_to_rgb(hex_color):
-        hex_color = hex_color.lstrip("#")
-        return {
-            "red": int(hex_color[0:2], 16) / 255.0,
-            "green": int(hex_color[2:4], 16) / 255.0,
-            "blue": int(hex_color[4:6], 16) / 255.0,
+# Convert hex color to RGB values
+def hex_to_rgb(hex_color):
+    hex_color = hex_color.lstrip("#")
+    return {
+        "red": int(hex_color[0:2], 16) / 255.0,
+        "green": int(hex_color[2:4], 16) / 255.0,
+        "blue": int(hex_color[4:6], 16) / 255.0,
+    }
+
+
+def background_color_request(slide_id, color_hex):
+    return {
+        "updatePageProperties": {
+            "objectId": slide_id,
+            "pageProperties": {
+                "pageBackgroundFill": {
+                    "solidFill": {
+                        "color": {
+                            "rgbColor": hex_to_rgb(color_hex)
+                        }
+                    }
+                }
+            },
+            "fields": "pageBackgroundFill"
         }
+    }
 
-    service = initialize_slides_service()
 
-    requests = [
-        {
-            "updatePageProperties": {
-                "objectId": slide_id,
-                "pageProperties": {
-                    "pageBackgroundFill": {
-                        "solidFill": {
-                            "color": {
-                                "rgbColor": hex_to_rgb(color_hex)
-                            }
-                        }
+def background_image_request(slide_id, image_url):
+    return {
+        "updatePageProperties": {
+            "objectId": slide_id,
+            "pageProperties": {
+                "pageBackgroundFill": {
+                    "stretchedPictureFill": {
+                        "contentUrl": image_url
                     }
-                },
-                "fields": "pageBackgroundFill"
-            }
+                }
+            },
+            "fields": "pageBackgroundFill"
         }
-    ]
+    }
+
+
+def set_slide_background_color(presentation_id, slide_id, color_hex):
+    service = initialize_slides_service()
+
+    requests = [background_color_request(slide_id, color_hex)]
 
     response = service.presentations().batchUpdate(
         presentationId=presentation_id,
@@ -371,21 +355,7 @@ def set_slide_background_color(presentation_id, slide_id, color_hex):
 def set_slide_background_image(presentation_id, slide_id, image_url):
     service = initialize_slides_service()
 
-    requests = [
-        {
-            "updatePageProperties": {
-                "objectId": slide_id,
-                "pageProperties": {
-                    "pageBackgroundFill": {
-                        "stretchedPictureFill": {
-                            "contentUrl": image_url
-                        }
-                    }
-                },
-                "fields": "pageBackgroundFill"
-            }
-        }
-    ]
+    requests = [background_image_request(slide_id, image_url)]
 
     response = service.presentations().batchUpdate(
         presentationId=presentation_id,
@@ -0,0 +1,180 @@
+import os.path
+import threading
+import time
+from datetime import datetime, timezone
+
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+
+import slides_transport
+from slides_transport import build_slides_service
+
+SCOPES = ["https://www.googleapis.com/auth/presentations"]
+TOKEN_FILE = "token.json"
+CLIENT_SECRETS_FILE = "credentials.json"
+
+# Refresh the access token this many seconds before it expires
+REFRESH_MARGIN_SECONDS = 300
+
+_lock = threading.RLock()
+_local = threading.local()
+# Service returned to every thread instead of the real API when set (benchmarks, local stubs)
+_service_override = None
+_credentials = None
+_token_mtime = None
+_refresher = None
+
+_stats = {
+    "service_builds": 0,
+    "service_build_seconds": 0.0,
+    "token_refreshes": 0,
+    "token_refresh_seconds": 0.0,
+    "token_refresh_failures": 0,
+}
+
+
+def _get_token_mtime():
+    try:
+        return os.path.getmtime(TOKEN_FILE)
+    except OSError:
+        return None
+
+
+def _save_credentials(creds):
+    global _token_mtime
+    with open(TOKEN_FILE, "w") as token:
+        token.write(creds.to_json())
+    _token_mtime = _get_token_mtime()
+
+
+def _refresh_credentials(creds):
+    start = time.perf_counter()
+    try:
+        creds.refresh(Request())
+    except Exception:
+        _stats["token_refresh_failures"] += 1
+        raise
+    finally:
+        _stats["token_refreshes"] += 1
+        _stats["token_refresh_seconds"] += time.perf_counter() - start
+    _save_credentials(creds)
+
+
+def _seconds_until_expiry(creds):
+    if creds is None or creds.expiry is None:
+        return None
+    # google-auth stores expiry as a naive UTC datetime
+    expiry = creds.expiry.replace(tzinfo=timezone.utc)
+    return (expiry - datetime.now(timezone.utc)).total_seconds()
+
+
+def _load_credentials():
+    global _token_mtime
+    creds = None
+    _token_mtime = _get_token_mtime()
+    if _token_mtime is not None:
+        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+    # If there are no (valid) credentials available, let the user log in.
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            _refresh_credentials(creds)
+        else:
+            flow = InstalledAppFlow.from_client_secrets_file(
+                CLIENT_SECRETS_FILE, SCOPES
+            )
+            creds = flow.run_local_server(port=0)
+            # Save the credentials for the next run
+            _save_credentials(creds)
+    return creds
+
+
+def _refresh_loop():
+    """Keep the shared credentials fresh so API calls never wait on a refresh."""
+    while True:
+        with _lock:
+            creds = _credentials
+        remaining = _seconds_until_expiry(creds)
+        if remaining is None or not creds.refresh_token:
+            time.sleep(REFRESH_MARGIN_SECONDS)
+            continue
+
+        wait = remaining - REFRESH_MARGIN_SECONDS
+        if wait > 0:
+            time.sleep(min(wait, REFRESH_MARGIN_SECONDS))
+            continue
+
+        try:
+            with _lock:
+                if creds is _credentials:
+                    _refresh_credentials(creds)
+        except Exception as e:
+            print(f"Background token refresh failed: {e}")
+            time.sleep(30)
+
+
+def _start_refresher():
+    global _refresher
+    if _refresher is None or not _refresher.is_alive():
+        _refresher = threading.Thread(target=_refresh_loop, name="slides-token-refresher", daemon=True)
+        _refresher.start()
+
+
+def get_credentials():
+    """Return the process-wide credentials, reloading them if token.json changed on disk."""
+    global _credentials
+    with _lock:
+        if _credentials is None or _get_token_mtime() != _token_mtime:
+            _credentials = _load_credentials()
+            _start_refresher()
+        elif not _credentials.valid and _credentials.refresh_token:
+            # The background refresher fell behind (e.g. after a suspend)
+            _refresh_credentials(_credentials)
+        return _credentials
+
+
+def get_slides_service():
+    """Return a Slides service for the calling thread, building it only once.
+
+    Service objects wrap an httplib2 connection that is not thread-safe, so each
+    thread gets its own client while all of them share one set of credentials.
+    Requests go through slides_transport (connection reuse, retries, quota).
+    """
+    if _service_override is not None:
+        return _service_override
+
+    # A local stub set with SLIDES_API_ENDPOINT needs no OAuth
+    creds = None if slides_transport.SLIDES_API_ENDPOINT else get_credentials()
+    service = getattr(_local, "service", None)
+    if service is not None and _local.credentials is creds:
+        return service
+
+    start = time.perf_counter()
+    service = build_slides_service(creds)
+    with _lock:
+        _stats["service_builds"] += 1
+        _stats["service_build_seconds"] += time.perf_counter() - start
+
+    _local.service = service
+    _local.credentials = creds
+    return service
+
+
+def use_slides_service(service):
+    """Serve get_slides_service() from service instead of the Slides API; None restores the API."""
+    global _service_override
+    _service_override = service
+
+
+def reset_slides_service():
+    """Drop cached credentials so the next call reloads token.json."""
+    global _credentials
+    with _lock:
+        _credentials = None
+    _local.service = None
+    _local.credentials = None
+
+
+def get_service_stats():
+    with _lock:
+        return dict(_stats)
@@ -0,0 +1,121 @@
+import os
+import threading
+import time
+
+import google_auth_httplib2
+import httplib2
+from google.auth.credentials import AnonymousCredentials
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+
+from instrumentation import api_bytes, metrics, span
+from rate_limiting import TokenBucket, backoff_delay
+
+# Root URL of the Slides API, e.g. http://localhost:8089/ for a local stub
+SLIDES_API_ENDPOINT = os.environ.get("SLIDES_API_ENDPOINT")
+# Retries of a failed request, with exponential backoff and full jitter
+SLIDES_NUM_RETRIES = int(os.environ.get("SLIDES_NUM_RETRIES", "5"))
+SLIDES_RETRY_BASE_DELAY = float(os.environ.get("SLIDES_RETRY_BASE_DELAY", "1.0"))
+SLIDES_RETRY_MAX_DELAY = float(os.environ.get("SLIDES_RETRY_MAX_DELAY", "32.0"))
+# Client-side limits matching the per-user Slides quotas
+SLIDES_READS_PER_MINUTE = int(os.environ.get("SLIDES_READS_PER_MINUTE", "600"))
+SLIDES_WRITES_PER_MINUTE = int(os.environ.get("SLIDES_WRITES_PER_MINUTE", "60"))
+SLIDES_HTTP_TIMEOUT = float(os.environ.get("SLIDES_HTTP_TIMEOUT", "120"))
+
+# Writes are only retried when the API did not apply them, so a retry never duplicates a deck
+RETRYABLE_READ_STATUSES = frozenset((429, 500, 502, 503, 504))
+RETRYABLE_WRITE_STATUSES = frozenset((429, 503))
+WRITE_METHODS = frozenset(("batchUpdate", "create"))
+
+read_limiter = TokenBucket.per_minute(SLIDES_READS_PER_MINUTE, capacity=max(1, SLIDES_READS_PER_MINUTE // 6))
+write_limiter = TokenBucket.per_minute(SLIDES_WRITES_PER_MINUTE, capacity=max(1, SLIDES_WRITES_PER_MINUTE // 6))
+
+request_duration = metrics.histogram("slides_request_duration_seconds", "Latency of Slides API attempts by endpoint")
+request_retries = metrics.counter("slides_request_retries_total", "Slides API attempts retried after an error")
+rate_limit_wait = metrics.counter("slides_rate_limit_wait_seconds_total", "Time spent waiting on the Slides quota")
+
+_local = threading.local()
+
+
+def pooled_http():
+    """The calling thread's httplib2.Http, kept for the life of the thread.
+
+    httplib2 keeps connections alive per host, so reusing one Http object per
+    thread (it is not thread-safe) reuses TLS connections across requests and
+    across service rebuilds after a token reload.
+    """
+    http = getattr(_local, "http", None)
+    if http is None:
+        http = _local.http = httplib2.Http(timeout=SLIDES_HTTP_TIMEOUT)
+    return http
+
+
+def _retry_after(error):
+    try:
+        return float(error.resp.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
+
+
+class SlidesHttpRequest(HttpRequest):
+    """HttpRequest for the Slides client: quota, retries and per-endpoint metrics.
+
+    Each attempt takes a token from the read or write bucket, is timed into
+    slides_request_duration_seconds by endpoint and status, and is retried
+    with backoff on 429/5xx (honouring Retry-After) and, for reads only,
+    dropped connections.
+    The whole call is one span named after the endpoint, e.g.
+    slides.presentations.batchUpdate.
+    """
+
+    def execute(self, http=None, num_retries=None):
+        num_retries = SLIDES_NUM_RETRIES if num_retries is None else num_retries
+        endpoint = self.methodId or "slides.request"
+        write = endpoint.rsplit(".", 1)[-1] in WRITE_METHODS
+        limiter = write_limiter if write else read_limiter
+        retryable_statuses = RETRYABLE_WRITE_STATUSES if write else RETRYABLE_READ_STATUSES
+        size = len(self.body) if self.body else 0
+
+        with span(endpoint, bytes=size) as current:
+            for attempt in range(num_retries + 1):
+                waited = limiter.acquire()
+                if waited:
+                    rate_limit_wait.inc(waited, endpoint=endpoint)
+                api_bytes.inc(size, api="slides")
+                start = time.perf_counter()
+                status = "error"
+                try:
+                    response = super().execute(http=http, num_retries=0)
+                    status = "ok"
+                    return response
+                except HttpError as error:
+                    status = str(error.resp.status)
+                    if attempt >= num_retries or error.resp.status not in retryable_statuses:
+                        raise
+                    delay = max(_retry_after(error), backoff_delay(attempt, SLIDES_RETRY_BASE_DELAY, SLIDES_RETRY_MAX_DELAY))
+                except (ConnectionError, TimeoutError):
+                    # A write whose connection dropped may already have been applied
+                    if write or attempt >= num_retries:
+                        raise
+                    delay = backoff_delay(attempt, SLIDES_RETRY_BASE_DELAY, SLIDES_RETRY_MAX_DELAY)
+                finally:
+                    request_duration.observe(time.perf_counter() - start, endpoint=endpoint, status=status)
+
+                print(f"{endpoint} failed ({status}); retrying in {delay:.1f}s")
+                request_retries.inc(endpoint=endpoint)
+                current.set(retries=attempt + 1)
+                time.sleep(delay)
+
+
+def build_slides_service(credentials=None, api_endpoint=None):
+    """Build a Slides client on this thread's pooled connection and SlidesHttpRequest.
+
+    With api_endpoint (default SLIDES_API_ENDPOINT) the client talks to that
+    root URL instead, e.g. a local stub; without credentials requests are sent
+    unauthenticated.
+    """
+    api_endpoint = api_endpoint or SLIDES_API_ENDPOINT
+    http = google_auth_httplib2.AuthorizedHttp(credentials or AnonymousCredentials(), http=pooled_http())
+    client_options = {"api_endpoint": api_endpoint} if api_endpoint else None
+    return build("slides", "v1", http=http, requestBuilder=SlidesHttpRequest, client_options=client_options)
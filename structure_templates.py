@@ -0,0 +1,180 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+
+from slide_categories import SlideCategory, match_category
+
+STRUCTURE_TEMPLATES_FILE = os.environ.get("STRUCTURE_TEMPLATES_FILE", "structure_templates.json")
+STRUCTURE_TEMPLATES_ENABLED = os.environ.get("STRUCTURE_TEMPLATES", "true").lower() in ("1", "true", "yes")
+# At or above this score a template the LLM has produced TEMPLATE_MIN_USES times replaces the structure call entirely
+TEMPLATE_SKIP_CONFIDENCE = float(os.environ.get("TEMPLATE_SKIP_CONFIDENCE", "0.6"))
+TEMPLATE_MIN_USES = int(os.environ.get("TEMPLATE_MIN_USES", "3"))
+# At or above this score the template is kept and the LLM only writes the section goals
+TEMPLATE_FILL_CONFIDENCE = float(os.environ.get("TEMPLATE_FILL_CONFIDENCE", "0.35"))
+# Intents remembered per template for classification
+MAX_TEMPLATE_INTENTS = 50
+
+# Goals used when a template is applied without any LLM call, from the outline in create_structure's prompt
+CATEGORY_GOALS = {
+    SlideCategory.TITLE_SLIDE: "Title of the presentation, subtitle and presenter",
+    SlideCategory.INTRODUCTION: "Brief overview of what the presentation is about and its objectives",
+    SlideCategory.AGENDA: "Outline of the topics or sections that will be covered",
+    SlideCategory.BACKGROUND_CONTEXT: "Background information or context the audience needs to understand the topic",
+    SlideCategory.MAIN_CONTENT_SLIDES: "The main topics of the presentation, with concise points and visuals",
+    SlideCategory.DATA_STATISTICS: "Relevant data or statistics, visualized with graphs, charts or tables",
+    SlideCategory.CASE_STUDIES_EXAMPLES: "Real-life examples or case studies showing the concepts in practice",
+    SlideCategory.ANALYSIS_FINDINGS: "Analysis of the information presented and the resulting insights",
+    SlideCategory.CONCLUSION: "Summary of the key points and main takeaways",
+    SlideCategory.RECOMMENDATIONS_NEXT_STEPS: "Recommendations and the next steps to take",
+    SlideCategory.Q_AND_A: "Invite the audience to ask questions",
+    SlideCategory.THANK_YOU: "Thank the audience and share contact information",
+}
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have how in into is it its of on or our that the their them
+they this to was we were what when which who will with you your about over under can should would
+presentation deck slides slide create make want need please
+""".split())
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def intent_terms(text):
+    """Term counts of an intent, without stopwords or very short words."""
+    terms = {}
+    for word in _WORD.findall((text or "").lower()):
+        if len(word) > 2 and word not in STOPWORDS:
+            terms[word] = terms.get(word, 0) + 1
+    return terms
+
+
+def _template_terms(intents):
+    terms = {}
+    for intent in intents:
+        for term, count in intent_terms(intent).items():
+            terms[term] = terms.get(term, 0) + count
+    return terms
+
+
+def _cosine(left, right):
+    if not left or not right:
+        return 0.0
+    dot = sum(count * right.get(term, 0) for term, count in left.items())
+    norm = math.sqrt(sum(c * c for c in left.values())) * math.sqrt(sum(c * c for c in right.values()))
+    return dot / norm if norm else 0.0
+
+
+def template_id(categories):
+    return hashlib.sha256("\n".join(categories).encode("utf-8")).hexdigest()[:12]
+
+
+class StructureTemplateLibrary:
+    """Deck shapes (ordered category lists) seen before, with the intents that produced them.
+
+    Stored as JSON at STRUCTURE_TEMPLATES_FILE. An intent is classified by the
+    cosine similarity of its keywords to the keywords of each template's past
+    intents, so choosing a template costs no network call.
+    """
+
+    def __init__(self, path=STRUCTURE_TEMPLATES_FILE):
+        self.path = path
+        self._templates = None
+        self._lock = threading.Lock()
+        self._stats = {"skipped": 0, "filled": 0, "generated": 0}
+
+    def _load(self):
+        if self._templates is None:
+            self._templates = {}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path) as file:
+                        for template in json.load(file):
+                            template.setdefault("generated", 0)
+                            template["terms"] = _template_terms(template.get("intents", []))
+                            self._templates[template["id"]] = template
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Could not load structure templates from {self.path}: {e}")
+        return self._templates
+
+    def _save(self):
+        templates = [
+            {key: value for key, value in template.items() if key != "terms"}
+            for template in self._templates.values()
+        ]
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(templates, file, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        with self._lock:
+            self._templates = {}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._load())
+
+    def classify(self, intent):
+        """Return (template, confidence) for the closest template, or (None, 0.0) if there are none."""
+        terms = intent_terms(intent)
+        with self._lock:
+            scored = [(_cosine(terms, template["terms"]), template) for template in self._load().values()]
+        if not scored:
+            return None, 0.0
+        confidence, template = max(scored, key=lambda item: item[0])
+        return template, confidence
+
+    def record(self, intent, sections, outcome):
+        """Remember that intent was given sections, creating the template for their shape if needed.
+
+        outcome is how the structure was made: "generated" by the LLM, "filled"
+        from a template by the LLM, or "skipped" (the template used as-is). Only
+        generated structures count towards TEMPLATE_MIN_USES, and a skipped one
+        adds nothing to the intents the template is classified by.
+        """
+        categories = [section.category.value for section in sections]
+        if not categories:
+            return None
+        key = template_id(categories)
+        with self._lock:
+            self._stats[outcome] += 1
+            templates = self._load()
+            template = templates.setdefault(key, {
+                "id": key, "categories": categories, "intents": [], "uses": 0, "generated": 0, "terms": {},
+            })
+            template["uses"] += 1
+            if outcome == "generated":
+                template["generated"] += 1
+            template["updated_at"] = time.time()
+            if outcome != "skipped" and intent not in template["intents"]:
+                template["intents"] = (template["intents"] + [intent])[-MAX_TEMPLATE_INTENTS:]
+                template["terms"] = _template_terms(template["intents"])
+            try:
+                self._save()
+            except OSError as e:
+                print(f"Could not save structure templates to {self.path}: {e}")
+            return template
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["templates"] = len(self._load())
+        return stats
+
+
+def template_categories(template):
+    """The template's categories as SlideCategory members, skipping any no longer known."""
+    categories = (match_category(category) for category in template["categories"])
+    return [category for category in categories if category is not None]
+
+
+# Shared library used by create_structure
+structure_templates = StructureTemplateLibrary()
+
+
+def get_structure_template_stats():
+    return structure_templates.stats()